@@ -1,6 +1,6 @@
 
 report_timing \
-  -through {{ from }} -through {{ to }} \
+  {% if from %}-through {{ from }} {% endif %}{% if to %}-through {{ to }} {% endif %}\
   -input_pins -capacitance -transition_time \
   -nets -significant_digits 4 -nosplit      \
   -path_type full_clock -attributes         \
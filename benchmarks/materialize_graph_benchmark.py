@@ -0,0 +1,30 @@
+import argparse
+import time
+
+from designs.inverter_chain import InverterChain
+from pdq.circuit_tools.graph_view_utils import materialize_compact_graph
+from pdq.common.reporting import make_header
+
+
+def _run(length: int, fanout: int):
+    ckt = InverterChain(length, fanout)
+    begin = time.perf_counter()
+    graph = materialize_compact_graph(ckt)
+    elapsed = time.perf_counter() - begin
+    us_per_node = 1e6 * elapsed / graph.num_nodes
+    print (f"{length:>10} {fanout:>6} {graph.num_nodes:>10} "
+           f"{graph.num_edges:>10} {elapsed:>10.3f} {us_per_node:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--lengths", type=str, default="1000,10000,100000,1000000")
+    parser.add_argument("--fanout", type=int, default=2)
+    args = parser.parse_args()
+    print (make_header("MATERIALIZE GRAPH (InverterChain)"))
+    print (f"{'length':>10} {'fanout':>6} {'nodes':>10} {'edges':>10} "
+           f"{'time (s)':>10} {'us/node':>10}")
+    for length in map(int, args.lengths.split(",")):
+        _run(length, args.fanout)
+    print (make_header("", pad=False))
@@ -0,0 +1,50 @@
+import argparse
+import os
+import time
+
+import magma as m
+
+from pdq.circuit_tools.circuit_utils import port_bits
+from pdq.circuit_tools.partial_extract import Extractor
+from pdq.circuit_tools.partial_extract_query import PartialExtractQuery
+from pdq.circuit_tools.signal_path import Scope, ScopedBit
+from pdq.common.main_utils import (
+    add_design_arguments, parse_design_args, slice_args)
+from pdq.common.reporting import make_header
+
+
+def _make_queries(ckt: m.DefineCircuitKind, num_queries: int):
+    """Splits the output bits of @ckt round-robin into @num_queries queries."""
+    scope = Scope(ckt)
+    outputs = [ScopedBit(bit, scope) for bit in port_bits(ckt)
+               if bit.is_input() and not isinstance(bit, m.ClockTypes)]
+    groups = [outputs[i::num_queries] for i in range(num_queries)]
+    return [PartialExtractQuery(to_list=tuple(group))
+            for group in groups if group]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    design_grp = add_design_arguments(parser)
+    parser.add_argument("--num_queries", type=int, default=32)
+    parser.add_argument(
+        "--processes", type=str, default=f"1,2,4,{os.cpu_count()}")
+    args = parser.parse_args()
+    ckt = parse_design_args(slice_args(args, design_grp))
+    begin = time.perf_counter()
+    extractor = Extractor(ckt)
+    elapsed = time.perf_counter() - begin
+    queries = _make_queries(ckt, args.num_queries)
+    print (make_header(f"PARALLEL EXTRACT ({ckt.name})"))
+    print (f"materialized {extractor.graph.num_nodes} nodes in {elapsed:.3f}s")
+    print (f"{'processes':>10} {'queries':>8} {'time (s)':>10} {'speedup':>8}")
+    baseline = None
+    for processes in map(int, args.processes.split(",")):
+        begin = time.perf_counter()
+        extractor.extract_many_verilog(queries, processes=processes)
+        elapsed = time.perf_counter() - begin
+        if baseline is None:
+            baseline = elapsed
+        print (f"{processes:>10} {len(queries):>8} {elapsed:>10.3f} "
+               f"{baseline / elapsed:>8.2f}")
+    print (make_header("", pad=False))
@@ -0,0 +1,40 @@
+import argparse
+import gc
+import time
+import tracemalloc
+
+from designs.inverter_chain import InverterChain
+from pdq.circuit_tools.graph_view_utils import materialize_compact_graph
+from pdq.circuit_tools.signal_path import ScopedBit
+from pdq.common.reporting import make_header
+
+
+def _run(length: int):
+    ckt = InverterChain(length)
+    graph = materialize_compact_graph(ckt)
+    keys = [(graph.value(i), graph.scope(i)) for i in range(graph.num_nodes)]
+    gc.collect()
+    tracemalloc.start()
+    begin = time.perf_counter()
+    bits = [ScopedBit(value, scope) for value, scope in keys]
+    # Touch the resolved refs so that lazily resolving representations are
+    # measured in their steady state.
+    for bit in bits:
+        bit.inst
+    elapsed = time.perf_counter() - begin
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    num_nodes = len(bits)
+    print (f"{length:>10} {num_nodes:>10} {size / num_nodes:>12.1f} "
+           f"{1e6 * elapsed / num_nodes:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", type=str, default="1000,10000,100000")
+    args = parser.parse_args()
+    print (make_header("SCOPED BIT MEMORY (InverterChain)"))
+    print (f"{'length':>10} {'nodes':>10} {'bytes/node':>12} {'us/node':>10}")
+    for length in map(int, args.lengths.split(",")):
+        _run(length)
+    print (make_header("", pad=False))
@@ -2,24 +2,37 @@ import argparse
 
 from pdq.common.main_utils import (
     add_design_arguments, parse_design_args, slice_args)
-from pdq.circuit_tools.generate_paths import SignalPathQuery, generate_paths
-from pdq.circuit_tools.signal_path import SignalPath
+from pdq.circuit_tools.generate_paths import (
+    PathOrder, SignalPathQuery, generate_paths)
+from pdq.circuit_tools.graph_cache import load_or_materialize_compact_graph
+from pdq.circuit_tools.query_pattern import resolve_patterns
 
 
 def _parse_query_args(ckt, args: argparse.Namespace):
-    locals_ = locals().copy()
-    locals_.update({ckt.name: ckt})
-    # NOTE(rsetaluri): Needs to be "from_" and need to call getattr() (rather
-    # than dot syntax) since "from" is a reserved kw.
-    from_ = eval(getattr(args, "from"), globals(), locals_)
-    to = eval(args.to, globals(), locals_)
-    return SignalPathQuery(src=from_, dst=to)
+    # NOTE(rsetaluri): Need to call getattr() (rather than dot syntax) since
+    # "from" is a reserved kw.
+    from_ = resolve_patterns(ckt, getattr(args, "from"))
+    to = resolve_patterns(ckt, args.to)
+    return SignalPathQuery(
+        src=from_,
+        dst=to,
+        order=PathOrder[args.order.upper()],
+        max_paths=args.max_paths,
+        max_paths_per_endpoint=args.max_paths_per_endpoint)
 
 
 def _add_query_arguments(parser: argparse.ArgumentParser):
     grp = parser.add_argument_group("query")
-    grp.add_argument("-from", type=str, required=True)
-    grp.add_argument("-to", type=str, required=True)
+    help_ = "query pattern(s), e.g. Tile_*/PE/*.O[0:15]"
+    grp.add_argument("-from", type=str, nargs="+", required=True, help=help_)
+    grp.add_argument("-to", type=str, nargs="+", required=True, help=help_)
+    grp.add_argument(
+        "-order",
+        type=str,
+        default="any",
+        choices=[order.name.lower() for order in PathOrder])
+    grp.add_argument("-max_paths", type=int)
+    grp.add_argument("-max_paths_per_endpoint", type=int)
     return grp
 
 
@@ -27,9 +40,16 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     design_grp = add_design_arguments(parser)
     query_grp = _add_query_arguments(parser)
+    parser.add_argument(
+        "--graph-cache",
+        action="store_true",
+        help="load the circuit graph from (or store it in) the graph cache")
     args = parser.parse_args()
     ckt = parse_design_args(slice_args(args, design_grp))
     query = _parse_query_args(ckt, slice_args(args, query_grp))
-    paths = generate_paths(ckt, query)
+    graph = None
+    if args.graph_cache:
+        graph = load_or_materialize_compact_graph(ckt)
+    paths = generate_paths(ckt, query, graph)
     for path in paths:
-        print (repr(path))
+        print (" -> ".join(str(node) for node in path))
@@ -1,12 +1,21 @@
+import collections
+import dataclasses
 import functools
+import multiprocessing
 import operator
+import time
+from typing import Dict, List, Optional, Set, Tuple
+import weakref
 
 import magma as m
+import numpy
 from magma.primitives.mux import CoreIRCommonLibMuxN
 from magma.primitives.register import _CoreIRRegister
 
 from pdq.circuit_tools.circuit_primitives_utils import (
-    WrappedOp, binop_to_unop, test_op)
+    WrappedOp, analytic_dependency_matrix, binop_to_unop, dependency_matrix,
+    get_dependency_cache_paths, has_cached_dependency_matrix,
+    set_dependency_cache_paths)
 from pdq.circuit_tools.circuit_utils import find_defn_ref
 from pdq.common.algorithms import first
 
@@ -41,40 +50,86 @@ def _is_coreir_op(ckt):
     return ckt.coreir_lib == "corebit" or ckt.coreir_lib == "coreir"
 
 
-def _get_coreir_op_drivers(ckt, name, sel):
-    assert name == "out"
-    op_name = ckt.coreir_name
-    if ckt.coreir_lib == "corebit":
-        assert type(sel) is m.value_utils.Selector
-        assert sel.child is None
-        if op_name == "not":
-            return [ckt.I]
-        return [ckt.I0, ckt.I1]
-    assert ckt.coreir_lib == "coreir"
-    if isinstance(sel, m.value_utils.ArraySelector):
-        assert sel.child is None
-        N = len(ckt.O)
-        n = sel.index
-    else:  # cmp op
-        assert type(sel) is m.value_utils.Selector
-        assert isinstance(ckt.O, m.Bit)
-        N = 1
-        n = 0
+_UNARY_COREIR_OPS = ("not", "neg", "orr", "andr", "xorr")
+
+
+def _make_coreir_op(op_name):
     if op_name == "orr":
         op = lambda x: functools.reduce(operator.or_, x)
     elif op_name == "andr":
         op = lambda x: functools.reduce(operator.and_, x)
+    elif op_name == "xorr":
+        op = lambda x: functools.reduce(operator.xor, x)
+    elif op_name == "neq":
+        op = operator.ne
     else:
         op = getattr(operator, m.primitive_to_python(op_name))
-    if op_name in ("not", "neg", "orr", "andr"):
-        inputs = list(ckt.I)
-    else:
-        inputs = list(m.concat(ckt.I0, ckt.I1))
+    if op_name not in _UNARY_COREIR_OPS:
         op = binop_to_unop(op)
-    op = WrappedOp(op_name, op)
-    M = len(inputs)
-    tests = (test_op(op, M, N, m, n) for m in range(M))
-    return [inputs[i] for i, t in enumerate(tests) if t]
+    return WrappedOp(op_name, op)
+
+
+def _get_coreir_op_inputs(ckt):
+    """
+    Returns (inputs, N) for coreir (not corebit) op @ckt, where @inputs are
+    the input bits the op is applied to (see _make_coreir_op()) and N is the
+    number of output bits.
+    """
+    assert ckt.coreir_lib == "coreir"
+    N = 1 if isinstance(ckt.O, m.Digital) else len(ckt.O)  # cmp op if 1-bit
+    if ckt.coreir_name in _UNARY_COREIR_OPS:
+        return list(ckt.I), N
+    return list(m.concat(ckt.I0, ckt.I1)), N
+
+
+def _get_coreir_op_dependencies(ckt):
+    op_name = ckt.coreir_name
+    if ckt.coreir_lib == "corebit":
+        inputs = [ckt.I] if op_name == "not" else [ckt.I0, ckt.I1]
+        return inputs, numpy.ones((1, len(inputs)), dtype=bool)
+    inputs, N = _get_coreir_op_inputs(ckt)
+    op = _make_coreir_op(op_name)
+    return inputs, dependency_matrix(op, len(inputs), N)
+
+
+_coreir_op_rows = weakref.WeakKeyDictionary()
+
+
+def _get_coreir_op_rows(ckt):
+    """
+    Returns the drivers of each output bit of coreir op @ckt. These are
+    computed once per definition, so that querying each bit of an N-bit op
+    does not redo the (O(N)) input concatenation and matrix lookup N times.
+    """
+    try:
+        return _coreir_op_rows[ckt]
+    except KeyError:
+        pass
+    inputs, matrix = _get_coreir_op_dependencies(ckt)
+    rows, cols = matrix.nonzero()
+    splits = numpy.searchsorted(rows, numpy.arange(1, len(matrix)))
+    drivers = [[inputs[i] for i in row.tolist()]
+               for row in numpy.split(cols, splits)]
+    _coreir_op_rows[ckt] = drivers
+    return drivers
+
+
+
+def _get_coreir_op_drivers(ckt, name, sel):
+    assert name == "out"
+    if isinstance(sel, m.value_utils.ArraySelector):
+        assert sel.child is None
+        n = sel.index
+    else:  # corebit or cmp op
+        assert type(sel) is m.value_utils.Selector
+        assert sel.child is None
+        n = 0
+    return list(_get_coreir_op_rows(ckt)[n])
+
+
+def _get_coreir_op_port_drivers(ckt, name):
+    assert name == "out"
+    return [list(drivers) for drivers in _get_coreir_op_rows(ckt)]
 ################################################################################
 
 
@@ -83,6 +138,7 @@ class _PrimitiveDriversDatabase:
         self._circuits = {}
         self._generators = {}
         self._properties = []
+        self._port_getters = {}
 
     def add_circuit(self, ckt, getter):
         self._circuits[ckt] = getter
@@ -93,32 +149,48 @@ class _PrimitiveDriversDatabase:
     def add_property(self, property_, getter):
         self._properties.append((property_, getter))
 
-    def get(self, ckt, name, sel, allow_default):
+    def add_port_getter(self, getter, port_getter):
+        """
+        Registers @port_getter(ckt, name), which returns the drivers of every
+        bit of port @name at once, as the port-level counterpart of @getter.
+        """
+        self._port_getters[getter] = port_getter
+
+    def _find(self, ckt, allow_default):
         try:
-            getter = self._circuits[ckt]
+            return self._circuits[ckt]
         except KeyError:
             pass
-        else:
-            return getter(ckt, name, sel)
         typ = type(ckt)
         if issubclass(typ, m.Generator2):
             try:
-                getter = self._generators[typ]
+                return self._generators[typ]
             except KeyError:
                 pass
-            else:
-                return getter(ckt, name, sel)
         try:
             _, getter = first(filter(lambda p: p[0](ckt), self._properties))
         except ValueError:
             pass
         else:
-            return getter(ckt, name, sel)
+            return getter
         if not allow_default:
             raise KeyError(f"No entry found for {ckt}")
         # TODO(rsetaluri): Implement default behavior.
         raise NotImplementedError()
 
+    def get(self, ckt, name, sel, allow_default):
+        getter = self._find(ckt, allow_default)
+        return getter(ckt, name, sel)
+
+    def get_port(self, ckt, name, port, allow_default):
+        getter = self._find(ckt, allow_default)
+        try:
+            port_getter = self._port_getters[getter]
+        except KeyError:
+            return [getter(ckt, name, m.value_utils.make_selector(bit))
+                    for bit in m.as_bits(port)]
+        return port_getter(ckt, name)
+
 
 _primitive_drivers_database = _PrimitiveDriversDatabase()
 
@@ -127,6 +199,12 @@ _primitive_drivers_database.add_generator(CoreIRCommonLibMuxN, _get_mux_drivers)
 _primitive_drivers_database.add_generator(
     _CoreIRRegister, _get_register_drivers)
 _primitive_drivers_database.add_property(_is_coreir_op, _get_coreir_op_drivers)
+_primitive_drivers_database.add_port_getter(
+    _get_coreir_op_drivers, _get_coreir_op_port_drivers)
+
+
+def is_register(defn: m.DefineCircuitKind) -> bool:
+    return m.isprimitive(defn) and isinstance(defn, _CoreIRRegister)
 
 
 def get_primitive_drivers(bit: m.Bit, allow_default: bool = True):
@@ -140,3 +218,139 @@ def get_primitive_drivers(bit: m.Bit, allow_default: bool = True):
     sel = m.value_utils.make_selector(bit)
     return _primitive_drivers_database.get(
         ref.defn, ref.name, sel, allow_default)
+
+
+def get_primitive_port_drivers(
+        port: m.Type, allow_default: bool = True) -> List[List[m.Bit]]:
+    """
+    Returns the drivers of each bit (in m.as_bits() order) of output @port of
+    a primitive definition, i.e. [get_primitive_drivers(bit) for each bit].
+    For coreir ops, the drivers of all bits are read from the op's dependency
+    matrix in one step.
+    """
+    if not port.is_input():
+        raise ValueError(f"Expected output port, got: {type(port)}")
+    ref = find_defn_ref(port)
+    if ref is None:
+        raise ValueError(f"Expected definition port, got {port}")
+    if not m.isprimitive(ref.defn):
+        raise ValueError(f"Expected primitive, got {ref.defn}")
+    return _primitive_drivers_database.get_port(
+        ref.defn, ref.name, port, allow_default)
+
+
+# (op name, M, N) of a coreir op, as for dependency_matrix().
+_OpSignature = Tuple[str, int, int]
+
+
+def find_coreir_op_signatures(ckt: m.DefineCircuitKind) -> Set[_OpSignature]:
+    """
+    Returns the distinct (op name, M, N) of the coreir ops instanced
+    (recursively) in @ckt. Each unique definition is visited once.
+    """
+    signatures = set()
+    visited = set()
+
+    def _visit(defn):
+        for inst in defn.instances:
+            type_ = type(inst)
+            if type_ in visited:
+                continue
+            visited.add(type_)
+            if m.isdefinition(type_):
+                _visit(type_)
+                continue
+            try:
+                getter = _primitive_drivers_database._find(type_, False)
+            except KeyError:
+                continue
+            if getter is not _get_coreir_op_drivers:
+                continue
+            if type_.coreir_lib != "coreir":
+                continue
+            inputs, N = _get_coreir_op_inputs(type_)
+            signatures.add((type_.coreir_name, len(inputs), N))
+
+    _visit(ckt)
+    return signatures
+
+
+@dataclasses.dataclass(frozen=True)
+class DependencyPrecomputeResult:
+    """
+    Outcome of precomputing the dependency matrix for one op signature:
+    @status is one of "analytic" (closed-form, never cached), "cached", or
+    "computed", and @seconds is the time spent computing.
+    """
+    op: str
+    M: int
+    N: int
+    status: str
+    seconds: float = 0.
+
+
+def _precompute_dependency_matrix(
+        signature: _OpSignature) -> DependencyPrecomputeResult:
+    # NOTE(rsetaluri): Another process may have computed the matrix since
+    # @signature was found to be missing.
+    if has_cached_dependency_matrix(*signature):
+        return DependencyPrecomputeResult(*signature, "cached")
+    op_name, M, N = signature
+    begin = time.perf_counter()
+    dependency_matrix(_make_coreir_op(op_name), M, N)
+    elapsed = time.perf_counter() - begin
+    return DependencyPrecomputeResult(op_name, M, N, "computed", elapsed)
+
+
+def precompute_primitive_dependencies(
+        ckt: m.DefineCircuitKind,
+        processes: Optional[int] = None) -> List[DependencyPrecomputeResult]:
+    """
+    Populates the dependency cache for every coreir op in @ckt, so that
+    subsequent driver queries never invoke the solver. Matrices which are
+    neither closed-form nor already cached are computed in a pool of
+    @processes (default os.cpu_count()) worker processes, largest first. If
+    @processes is 1, they are computed serially in this process.
+    """
+    results = []
+    pending = []
+    for signature in sorted(find_coreir_op_signatures(ckt)):
+        if analytic_dependency_matrix(*signature) is not None:
+            results.append(DependencyPrecomputeResult(*signature, "analytic"))
+        elif has_cached_dependency_matrix(*signature):
+            results.append(DependencyPrecomputeResult(*signature, "cached"))
+        else:
+            pending.append(signature)
+    pending.sort(key=lambda signature: signature[1] * signature[2],
+                 reverse=True)
+    if processes == 1 or len(pending) <= 1:
+        results.extend(map(_precompute_dependency_matrix, pending))
+        return results
+    # NOTE(rsetaluri): Workers only receive (picklable) op signatures and
+    # write their results to the (concurrency-safe) on-disk cache. We spawn
+    # (rather than fork) workers, since this process already holds an open
+    # SQLite connection, which must not be used across fork().
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(processes, initializer=set_dependency_cache_paths,
+                      initargs=get_dependency_cache_paths()) as pool:
+        results.extend(pool.imap_unordered(
+            _precompute_dependency_matrix, pending, chunksize=1))
+    return results
+
+
+def summarize_precompute_results(
+        results: List[DependencyPrecomputeResult]) -> str:
+    """
+    Returns a human readable report of @results: the number of matrices per
+    status, and the number computed and time spent per op.
+    """
+    counts = collections.Counter(result.status for result in results)
+    per_op: Dict[str, List[float]] = collections.defaultdict(list)
+    for result in results:
+        if result.status == "computed":
+            per_op[result.op].append(result.seconds)
+    lines = [", ".join(f"{status}: {counts[status]}"
+                       for status in ("computed", "cached", "analytic"))]
+    for op, seconds in sorted(per_op.items()):
+        lines.append(f"{op:>10} {len(seconds):>6} {sum(seconds):>10.3f}s")
+    return "\n".join(lines)
@@ -3,7 +3,13 @@ import random
 
 import magma as m
 
-from pdq.circuit_tools.circuit_primitives import get_primitive_drivers
+from pdq.circuit_tools import circuit_primitives
+from pdq.circuit_tools.circuit_primitives import (
+    find_coreir_op_signatures, get_primitive_drivers,
+    get_primitive_port_drivers, precompute_primitive_dependencies,
+    summarize_precompute_results)
+from pdq.circuit_tools.circuit_primitives_utils import (
+    has_cached_dependency_matrix)
 from pdq.common.algorithms import only
 
 
@@ -32,3 +38,67 @@ def test_bit_binop():
     Or = type(only(_Foo.instances))
     got = get_primitive_drivers(Or.O)
     print (got)
+
+
+def test_primitive_port_drivers():
+
+    class _Foo(m.Circuit):
+        io = m.IO(I0=m.In(m.UInt[4]), I1=m.In(m.UInt[4]), S=m.In(m.Bit))
+        io.I0 + io.I1
+        io.I0 < io.I1
+        io.S & io.I0[0]
+        m.Register(m.UInt[4])()
+
+    for inst in _Foo.instances:
+        defn = type(inst)
+        if not m.isprimitive(defn):
+            defn = type(only(defn.instances))
+        port = defn.O
+        expected = [get_primitive_drivers(bit) for bit in m.as_bits(port)]
+        got = get_primitive_port_drivers(port)
+        assert len(got) == len(expected)
+        for drivers, expected_drivers in zip(got, expected):
+            assert list(map(id, drivers)) == list(map(id, expected_drivers))
+    with pytest.raises(ValueError):
+        get_primitive_port_drivers(defn.I)
+
+
+def test_primitive_drivers_resolved_once(monkeypatch):
+
+    class _Foo(m.Circuit):
+        io = m.IO(I0=m.In(m.UInt[4]), I1=m.In(m.UInt[4]))
+        io.I0 - io.I1
+
+    Sub = type(only(_Foo.instances))
+    calls = []
+    get_dependencies = circuit_primitives._get_coreir_op_dependencies
+    monkeypatch.setattr(
+        circuit_primitives, "_get_coreir_op_dependencies",
+        lambda ckt: calls.append(ckt) or get_dependencies(ckt))
+    drivers = [get_primitive_drivers(bit) for bit in Sub.O]
+    got = get_primitive_port_drivers(Sub.O)
+    for bit_drivers, expected in zip(got, drivers):
+        assert list(map(id, bit_drivers)) == list(map(id, expected))
+    assert calls == [Sub]
+
+
+class _Ops(m.Circuit):
+    io = m.IO(I0=m.In(m.UInt[3]), I1=m.In(m.UInt[3]), O=m.Out(m.UInt[3]))
+    io.O @= (io.I0 // io.I1) + (io.I0 % io.I1) + (io.I0 + io.I1) - io.I0
+    m.Register(m.UInt[3])()
+
+
+def test_precompute_primitive_dependencies():
+    signatures = find_coreir_op_signatures(_Ops)
+    assert signatures == {("udiv", 6, 3), ("urem", 6, 3), ("add", 6, 3),
+                          ("sub", 6, 3)}
+    results = precompute_primitive_dependencies(_Ops, processes=2)
+    statuses = {(r.op, r.M, r.N): r.status for r in results}
+    assert statuses == {("udiv", 6, 3): "computed", ("urem", 6, 3): "computed",
+                        ("add", 6, 3): "analytic", ("sub", 6, 3): "analytic"}
+    assert has_cached_dependency_matrix("udiv", 6, 3)
+    results = precompute_primitive_dependencies(_Ops)
+    assert sorted(r.status for r in results) == [
+        "analytic", "analytic", "cached", "cached"]
+    report = summarize_precompute_results(results)
+    assert report.splitlines()[0] == "computed: 0, cached: 2, analytic: 2"
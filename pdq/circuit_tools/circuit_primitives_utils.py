@@ -1,12 +1,12 @@
-import atexit
+import collections
 import csv
 import dataclasses
 import functools
-import itertools
 import numpy
 import os
 import pathlib
-from typing import Callable, Optional, TypeVar
+import sqlite3
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
 
 import hwtypes as ht
 import pysmt.shortcuts as smt
@@ -18,67 +18,133 @@ _UnaryCallable = Callable[[_T], _T]
 _BinaryCallable = Callable[[_T, _T], _T]
 
 
+_TestOpGroup = Tuple[str, int, int]  # (op name, M, N)
+
+
+def _pack_matrix(matrix: numpy.ndarray) -> bytes:
+    return numpy.packbits(matrix, axis=None).tobytes()
+
+
+def _unpack_matrix(data: bytes, M: int, N: int) -> numpy.ndarray:
+    bits = numpy.unpackbits(numpy.frombuffer(data, dtype=numpy.uint8))
+    return bits[:M * N].reshape(N, M).astype(bool)
+
+
+def _matrices_from_rows(rows) -> Dict[_TestOpGroup, numpy.ndarray]:
+    """
+    Returns the dependency matrices of the complete groups in @rows of
+    per-bit results (op name, M, N, m, n, value).
+    """
+    groups = collections.defaultdict(dict)
+    for name, M, N, m, n, value in rows:
+        groups[(name, int(M), int(N))][(int(m), int(n))] = bool(int(value))
+    matrices = {}
+    for (name, M, N), values in groups.items():
+        if len(values) != M * N:
+            continue
+        matrix = numpy.zeros((N, M), dtype=bool)
+        for (m, n), value in values.items():
+            matrix[n, m] = value
+        matrices[(name, M, N)] = matrix
+    return matrices
+
+
 class _TestOpCache:
+    """
+    On-disk cache of test_op() results, shared by all processes using the
+    same working directory. Results are stored as one packed dependency
+    matrix per (op, M, N) in a SQLite database (in WAL mode, so that readers
+    never block writers), are appended as they are computed, and are loaded
+    lazily.
+    """
     _shared = dict(
-        _cache=None,
-        _filename=pathlib.Path(".pdq/test_op_cache.csv"),
-        _modified=False)
+        _connection=None,
+        _pid=None,
+        _matrices={},
+        _filename=pathlib.Path(".pdq/test_op_cache.db"),
+        _legacy_filename=pathlib.Path(".pdq/test_op_cache.csv"))
 
     def __init__(self):
         self.__dict__ = self._shared
 
     @staticmethod
-    def _initialize_cache(filename):
-        cache = {}
+    def _insert(connection, matrices: Dict[_TestOpGroup, numpy.ndarray]):
+        rows = [(name, M, N, _pack_matrix(matrix))
+                for (name, M, N), matrix in matrices.items()]
+        with connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO dependency_matrices "
+                "VALUES (?, ?, ?, ?)",
+                rows)
+
+    @staticmethod
+    def _import_legacy_cache(connection, filename):
+        # NOTE(rsetaluri): Older versions stored one row per bit pair in a CSV
+        # file. Complete groups are converted to matrices; the rest will be
+        # recomputed.
         try:
             with open(filename, "r") as f:
-                reader = csv.reader(f)
-                for *k, v in reader:
-                    k[0] = WrappedOp(k[0])
-                    k[1:] = list(map(int, k[1:]))
-                    k = tuple(k)
-                    cache[k] = bool(int(v))
+                rows = list(csv.reader(f))
         except FileNotFoundError:
-            pass
-        return cache
-
-    def writeback(self):
-        if not self._modified:
             return
-        dir_name = self._filename.parts[0]
-        if not os.path.isdir(dir_name):
-            os.mkdir(dir_name)
-        with open(self._filename, "w") as f:
-            writer = csv.writer(f)
-            for k, v in self._cache.items():
-                k = list(k)
-                k[0] = k[0].name
-                writer.writerow(k + [int(v)])
-
-    def get_or_set(self, key, evaluator):
-        if self._cache is None:
-            self._cache = _TestOpCache._initialize_cache(self._filename)
+        _TestOpCache._insert(connection, _matrices_from_rows(rows))
         try:
-            value = self._cache[key]
-        except KeyError:
-            value = evaluator(key)
-            self._cache[key] = value
-            self._modified = True
-        return value
+            filename.rename(filename.with_suffix(".csv.imported"))
+        except FileNotFoundError:  # imported concurrently
+            pass
 
+    def _connect(self):
+        # NOTE(rsetaluri): SQLite connections can not be used across fork(),
+        # so each process opens its own.
+        if self._connection is not None and self._pid == os.getpid():
+            return self._connection
+        self._filename.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(str(self._filename), timeout=60.)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS dependency_matrices ("
+                "op TEXT, num_inputs INTEGER, num_outputs INTEGER, "
+                "matrix BLOB, PRIMARY KEY (op, num_inputs, num_outputs)) "
+                "WITHOUT ROWID")
+        _TestOpCache._import_legacy_cache(connection, self._legacy_filename)
+        self._connection = connection
+        self._pid = os.getpid()
+        self._matrices = {}
+        return connection
 
-def _wrap_test_op(fn):
-    cache = _TestOpCache()
-    atexit.register(lambda: cache.writeback())
+    def paths(self) -> Tuple[pathlib.Path, pathlib.Path]:
+        return self._filename, self._legacy_filename
 
-    def _evaluator(key):
-        return fn(*key)
+    def set_paths(self, filename: pathlib.Path, legacy_filename: pathlib.Path):
+        self._filename = filename
+        self._legacy_filename = legacy_filename
+        self._connection = None
+        self._pid = None
+        self._matrices = {}
 
-    @functools.wraps(fn)
-    def _wrapped(*key):
-        return cache.get_or_set(key, _evaluator)
+    def get(self, group: _TestOpGroup) -> Optional[numpy.ndarray]:
+        connection = self._connect()
+        try:
+            return self._matrices[group]
+        except KeyError:
+            pass
+        # NOTE(rsetaluri): Misses are not cached in memory, since another
+        # process may compute the matrix in the meantime.
+        row = connection.execute(
+            "SELECT matrix FROM dependency_matrices "
+            "WHERE op = ? AND num_inputs = ? AND num_outputs = ?",
+            group).fetchone()
+        if row is None:
+            return None
+        _, M, N = group
+        matrix = self._matrices[group] = _unpack_matrix(row[0], M, N)
+        return matrix
 
-    return _wrapped
+    def set(self, group: _TestOpGroup, matrix: numpy.ndarray):
+        _TestOpCache._insert(self._connect(), {group: matrix})
+        self._matrices[group] = matrix
 
 
 @dataclasses.dataclass(frozen=True)
@@ -109,26 +175,205 @@ def binop_to_unop(op: _BinaryCallable) -> _UnaryCallable:
     return functools.partial(apply_binop_as_unop, op)
 
 
-@_wrap_test_op
-def test_op(op: WrappedOp, M: int, N: int, m: int, n: int):
+def _flip_input_bit(
+        op: WrappedOp, x: ht.SMTBitVector, m: int) -> Tuple[_T, _T]:
+    """
+    Returns (op(x0), op(x1)) where x0 and x1 are @x with bit @m cleared and
+    set respectively.
+    """
+    M = len(x)
+    x0 = x & ~ht.SMTBitVector[M](1 << m)
+    x1 = x | ht.SMTBitVector[M](1 << m)
+    l = op(x0)
+    r = op(x1)
+    assert type(l) is type(r)
+    return l, r
+
+
+def _output_bit_diffs(l: _T, r: _T, N: int) -> List[ht.SMTBit]:
+    if isinstance(l, ht.SMTBit):
+        assert N == 1
+        return [l ^ r]
+    return [l[n] ^ r[n] for n in range(N)]
+
+
+def _check_test_op_args(op: WrappedOp, M: int, N: int, m: int, n: int):
     if not isinstance(op, WrappedOp):
         raise TypeError(op)
     if m not in range(M):
         raise ValueError((m, M))
     if n not in range(N):
         raise ValueError((n, N))
+
+
+def test_op(op: WrappedOp, M: int, N: int, m: int, n: int) -> bool:
+    """
+    Returns True if output bit @n of @op depends on input bit @m, reading
+    the (cached) dependency matrix of @op.
+    """
+    _check_test_op_args(op, M, N, m, n)
+    return bool(_cached_dependency_matrix(op, M, N)[n, m])
+
+
+def _solve_test_op(op: WrappedOp, M: int, N: int, m: int, n: int) -> bool:
+    """
+    Per-bit reference for _solve_dependency_matrix(), using a fresh solver.
+    """
+    _check_test_op_args(op, M, N, m, n)
     x = ht.SMTBitVector[M]()
-    x0 = x & ~ht.SMTBitVector[M](1 << m)
-    x1 = x | ht.SMTBitVector[M](1 << m)
-    l = op(x0)
-    r = op(x1)
-    assert type(l) is type(r)
+    l, r = _flip_input_bit(op, x, m)
     is_bit_output = isinstance(l, ht.SMTBit)
     if is_bit_output:
         assert N == 1  # assert n in [0, N] guarantees n == 0
-        f = (op(x0) == op(x1))
+        f = (l == r)
     else:
-        f = (op(x0)[n] == op(x1)[n])
+        f = (l[n] == r[n])
     with smt.Solver("z3", logic=pysmt.logics.BV) as solver:
         solver.add_assertion((~f).value)
         return solver.solve()
+
+
+def _solve_dependency_matrix(
+        op: WrappedOp, M: int, N: int) -> numpy.ndarray:
+    matrix = numpy.zeros((N, M), dtype=bool)
+    x = ht.SMTBitVector[M]()
+    with smt.Solver("z3", logic=pysmt.logics.BV) as solver:
+        for m in range(M):
+            diffs = _output_bit_diffs(*_flip_input_bit(op, x, m), N)
+            for n in range(N):
+                if matrix[n, m]:
+                    continue
+                solver.push()
+                solver.add_assertion(diffs[n].value)
+                if solver.solve():
+                    # NOTE(rsetaluri): The model is a witness for every output
+                    # bit which differs under it, not just bit @n, so we can
+                    # skip solving for those bits.
+                    for k in range(n, N):
+                        if not matrix[k, m]:
+                            value = solver.get_py_value(diffs[k].value)
+                            matrix[k, m] = value
+                solver.pop()
+    return matrix
+
+
+def _operand_bit_indices(
+        M: int, N: int) -> Tuple[numpy.ndarray, numpy.ndarray]:
+    # NOTE(rsetaluri): Binary ops are applied to the concatenation of their
+    # (N-bit) operands, so input bit m is bit (m % N) of operand (m // N).
+    if M % N:
+        raise ValueError((M, N))
+    inputs = numpy.arange(M)
+    return inputs // N, inputs % N
+
+
+def _bitwise_dependencies(M: int, N: int) -> numpy.ndarray:
+    _, index = _operand_bit_indices(M, N)
+    return index[None, :] == numpy.arange(N)[:, None]
+
+
+def _carry_dependencies(M: int, N: int) -> numpy.ndarray:
+    _, index = _operand_bit_indices(M, N)
+    return index[None, :] <= numpy.arange(N)[:, None]
+
+
+def _shift_dependencies(M: int, N: int, left: bool) -> numpy.ndarray:
+    operand, index = _operand_bit_indices(M, N)
+    outputs = numpy.arange(N)[:, None]
+    if left:
+        shifted = index[None, :] <= outputs
+    else:
+        shifted = index[None, :] >= outputs
+    # Every bit of the shift amount may affect every output bit (e.g. by
+    # shifting out all of the bits).
+    return shifted | (operand[None, :] == 1)
+
+
+def _full_dependencies(M: int, N: int) -> numpy.ndarray:
+    return numpy.ones((N, M), dtype=bool)
+
+
+_DependencyRule = Callable[[int, int], numpy.ndarray]
+_DEPENDENCY_RULES = {
+    "not": _bitwise_dependencies,
+    "and": _bitwise_dependencies,
+    "or": _bitwise_dependencies,
+    "xor": _bitwise_dependencies,
+    "add": _carry_dependencies,
+    "sub": _carry_dependencies,
+    "neg": _carry_dependencies,
+    "mul": _carry_dependencies,
+    "shl": functools.partial(_shift_dependencies, left=True),
+    "lshr": functools.partial(_shift_dependencies, left=False),
+    "ashr": functools.partial(_shift_dependencies, left=False),
+}
+_DEPENDENCY_RULES.update(dict.fromkeys(
+    ("eq", "neq", "ult", "ule", "ugt", "uge", "slt", "sle", "sgt", "sge",
+     "orr", "andr", "xorr"),
+    _full_dependencies))
+
+
+def analytic_dependency_matrix(
+        name: str, M: int, N: int) -> Optional[numpy.ndarray]:
+    """
+    Returns the dependency matrix (see dependency_matrix()) of the coreir op
+    @name in closed form, or None if there is no rule for @name. Inputs of
+    binary ops are the concatenation of both operands.
+    """
+    try:
+        rule = _DEPENDENCY_RULES[name]
+    except KeyError:
+        return None
+    return rule(M, N)
+
+
+def _cached_dependency_matrix(
+        op: WrappedOp, M: int, N: int) -> numpy.ndarray:
+    cache = _TestOpCache()
+    group = (op.name, M, N)
+    matrix = cache.get(group)
+    if matrix is None:
+        matrix = _solve_dependency_matrix(op, M, N)
+        cache.set(group, matrix)
+    return matrix
+
+
+def get_dependency_cache_paths() -> Tuple[pathlib.Path, pathlib.Path]:
+    """
+    Returns the (database, legacy CSV) paths of the on-disk dependency cache.
+    """
+    return _TestOpCache().paths()
+
+
+def set_dependency_cache_paths(
+        filename: pathlib.Path, legacy_filename: pathlib.Path):
+    """
+    Points this process's dependency cache at @filename (importing
+    @legacy_filename, if it exists), e.g. in worker processes which must
+    share the cache of their parent.
+    """
+    _TestOpCache().set_paths(filename, legacy_filename)
+
+
+def has_cached_dependency_matrix(name: str, M: int, N: int) -> bool:
+    """
+    Returns True if the dependency matrix of op @name is in the on-disk cache.
+    """
+    return _TestOpCache().get((name, M, N)) is not None
+
+
+def dependency_matrix(op: WrappedOp, M: int, N: int) -> numpy.ndarray:
+    """
+    Returns the (N x M) boolean dependency matrix of @op, whose entry [n, m]
+    is test_op(@op, @M, @N, m, n), i.e. whether output bit n depends on input
+    bit m. Ops with a closed-form rule (see analytic_dependency_matrix()) are
+    answered directly. Otherwise, the formula for @op is built once per input
+    bit, and all of the queries are answered incrementally (using push/pop)
+    in a single solver session. Results are shared with the test_op() cache.
+    """
+    if not isinstance(op, WrappedOp):
+        raise TypeError(op)
+    matrix = analytic_dependency_matrix(op.name, M, N)
+    if matrix is not None:
+        return matrix
+    return _cached_dependency_matrix(op, M, N)
@@ -0,0 +1,91 @@
+import multiprocessing
+import operator
+
+import hwtypes as ht
+import numpy
+import pytest
+
+from pdq.circuit_tools.circuit_primitives import (
+    _UNARY_COREIR_OPS, _make_coreir_op)
+from pdq.circuit_tools.circuit_primitives_utils import (
+    WrappedOp, analytic_dependency_matrix, binop_to_unop, dependency_matrix,
+    _DEPENDENCY_RULES, _TestOpCache, _solve_dependency_matrix, _solve_test_op)
+# NOTE(rsetaluri): Renamed so that pytest does not collect it as a test.
+from pdq.circuit_tools.circuit_primitives_utils import test_op as _test_op
+
+
+def _binop(name, fn):
+    return WrappedOp(name, binop_to_unop(fn))
+
+
+_OPS = (
+    (WrappedOp("not", operator.invert), 3, 3),
+    (_binop("add", operator.add), 6, 3),
+    (_binop("mul", operator.mul), 6, 3),
+    (_binop("lshr", lambda x, y: x >> y), 4, 2),
+    (_binop("ult", operator.lt), 6, 1),
+    (_binop("and", operator.and_), 4, 2),
+)
+
+
+@pytest.mark.parametrize("op,M,N", _OPS)
+def test_solve_dependency_matrix(op, M, N):
+    # NOTE(rsetaluri): We compare against the uncached per-bit test, so that
+    # the result does not depend on the state of the on-disk cache.
+    expected = numpy.array(
+        [[_solve_test_op(op, M, N, m, n) for m in range(M)]
+         for n in range(N)])
+    assert numpy.array_equal(_solve_dependency_matrix(op, M, N), expected)
+
+
+def test_dependency_matrix():
+    op = WrappedOp("udiv", binop_to_unop(operator.floordiv))
+    assert analytic_dependency_matrix(op.name, 4, 2) is None
+    matrix = dependency_matrix(op, 4, 2)
+    assert numpy.array_equal(matrix, _solve_dependency_matrix(op, 4, 2))
+    op = WrappedOp("xor", binop_to_unop(operator.xor))
+    matrix = dependency_matrix(op, 4, 2)
+    assert numpy.array_equal(matrix, [[1, 0, 1, 0], [0, 1, 0, 1]])
+    assert all(_test_op(op, 4, 2, m, n) == matrix[n, m]
+               for m in range(4) for n in range(2))
+    with pytest.raises(TypeError):
+        dependency_matrix(operator.xor, 4, 2)
+
+
+_WIDTH = 3
+
+
+@pytest.mark.parametrize("name", sorted(_DEPENDENCY_RULES))
+def test_analytic_dependency_matrix(name):
+    op = _make_coreir_op(name)
+    M = _WIDTH if name in _UNARY_COREIR_OPS else 2 * _WIDTH
+    N = _WIDTH
+    if isinstance(op(ht.SMTBitVector[M]()), ht.SMTBit):
+        N = 1
+    matrix = analytic_dependency_matrix(name, M, N)
+    assert numpy.array_equal(matrix, _solve_dependency_matrix(op, M, N))
+
+
+def _set_matrix(M):
+    matrix = numpy.arange(M)[None, :] % 2 == numpy.arange(2)[:, None]
+    _TestOpCache().set(("xor", M, 2), matrix)
+
+
+def test_op_cache(op_cache_dir):
+    (op_cache_dir / "test_op_cache.csv").write_text(
+        "and,2,1,0,0,1\nand,2,1,1,0,0\nor,2,1,0,0,1\n")
+    cache = _TestOpCache()
+    assert numpy.array_equal(cache.get(("and", 2, 1)), [[True, False]])
+    assert cache.get(("or", 2, 1)) is None  # incomplete
+    assert (op_cache_dir / "test_op_cache.csv.imported").exists()
+    assert cache.get(("xor", 4, 2)) is None
+    with multiprocessing.get_context("fork").Pool(2) as pool:
+        pool.map(_set_matrix, (2, 4, 6, 64))
+    # Results written by other processes are visible without reopening, and
+    # test_op() is answered from the cache (the op can not be evaluated).
+    op = WrappedOp("xor")
+    for M in (2, 4, 6, 64):
+        assert all(_test_op(op, M, 2, m, n) == (m % 2 == n)
+                   for m in range(M) for n in range(2))
+    with pytest.raises(ValueError):
+        _test_op(op, 4, 2, 4, 0)
@@ -1,6 +1,11 @@
+import bisect
+import collections
 import dataclasses
+import fnmatch
 import functools
-from typing import Callable, Iterable, Optional, Union
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+import weakref
 
 import magma as m
 
@@ -27,7 +32,7 @@ def find_instances_type(
 
 def find_instances_name_equals(
         ckt: m.DefineCircuitKind, name: str) -> Iterable[m.Circuit]:
-    return find_instances_name(ckt, lambda s: s == name)
+    return iter(get_instance_index(ckt).by_name(name))
 
 
 def find_instances_name_substring(
@@ -35,25 +40,228 @@ def find_instances_name_substring(
     return find_instances_name(ckt, lambda s: name_substr in s)
 
 
+def _is_glob(pattern: str) -> bool:
+    return any(c in pattern for c in "*?[")
+
+
+class InstanceIndex:
+    """
+    Index over the instances of a single definition, by name, by type, and by
+    name prefix/glob. Use get_instance_index() to get the (cached) index of a
+    definition.
+    """
+
+    def __init__(self, defn: m.DefineCircuitKind):
+        self._defn = defn
+        self._size = len(defn.instances)
+        self._by_name = collections.defaultdict(list)
+        self._by_type = collections.defaultdict(list)
+        for inst in defn.instances:
+            self._by_name[inst.name].append(inst)
+            self._by_type[type(inst)].append(inst)
+        self._names = sorted(self._by_name)
+
+    @property
+    def defn(self) -> m.DefineCircuitKind:
+        return self._defn
+
+    def is_stale(self) -> bool:
+        return len(self._defn.instances) != self._size
+
+    def by_name(self, name: str) -> List[m.Circuit]:
+        return self._by_name.get(name, [])
+
+    def by_type(self, type_: m.DefineCircuitKind) -> List[m.Circuit]:
+        return self._by_type.get(type_, [])
+
+    def by_prefix(self, prefix: str) -> List[m.Circuit]:
+        """Returns instances whose name starts with @prefix, in name order."""
+        begin = bisect.bisect_left(self._names, prefix)
+        insts = []
+        for i in range(begin, len(self._names)):
+            name = self._names[i]
+            if not name.startswith(prefix):
+                break
+            insts.extend(self._by_name[name])
+        return insts
+
+    def match(self, pattern: str) -> List[m.Circuit]:
+        """
+        Returns instances whose name matches the glob @pattern (in the syntax
+        of fnmatch, matched case-sensitively). Only names sharing the literal
+        prefix of @pattern are tested.
+        """
+        if not _is_glob(pattern):
+            return self.by_name(pattern)
+        prefix = re.split(r"[*?\[]", pattern, maxsplit=1)[0]
+        return [inst for inst in self.by_prefix(prefix)
+                if fnmatch.fnmatchcase(inst.name, pattern)]
+
+
+_instance_indices = weakref.WeakKeyDictionary()
+
+
+def get_instance_index(defn: m.DefineCircuitKind) -> InstanceIndex:
+    """
+    Returns the instance index of @defn, which is built lazily and cached (and
+    rebuilt if instances have been added to @defn since).
+    """
+    try:
+        index = _instance_indices[defn]
+    except KeyError:
+        pass
+    else:
+        if not index.is_stale():
+            return index
+    index = InstanceIndex(defn)
+    _instance_indices[defn] = index
+    return index
+
+
+def find_instances_path(
+        defn: m.DefineCircuitKind,
+        path: str) -> Iterable[Tuple[m.Circuit, ...]]:
+    """
+    Yields all instance paths (tuples of instances, starting with an instance
+    of @defn) matching @path, a "."-separated sequence of instance name globs
+    (e.g. "Tile_X00_Y00.PE.*"). The first component of @path may optionally be
+    the name of @defn itself (e.g. "Interconnect.Tile_*").
+    """
+    components = path.split(".")
+    if len(components) > 1 and components[0] == defn.name:
+        components = components[1:]
+
+    def _find(curr, prefix, components):
+        if not components:
+            yield prefix
+            return
+        if not m.isdefinition(curr):
+            return
+        head, *tail = components
+        for inst in get_instance_index(curr).match(head):
+            yield from _find(type(inst), prefix + (inst,), tail)
+
+    yield from _find(defn, (), components)
+
+
+def _empty() -> Iterable:
+    yield from ()
+
+
+def trace_drivees(bit: m.Bit) -> Iterable[m.Bit]:
+    """Yields all (transitively traced) input/inout values driven by @bit."""
+    drivees = bit.driving()
+    if not drivees:
+        return _empty()
+    for drivee in drivees:
+        if drivee.is_input() or drivee.is_inout():
+            yield drivee
+            continue
+        yield from trace_drivees(drivee)
+
+
 def find_ref(
         ref: m.ref.Ref,
         condition: Callable[[m.ref.Ref], bool]) -> Optional[m.ref.Ref]:
-    if condition(ref):
+    """
+    Returns the first ref satisfying @condition in the parent chain of @ref
+    (starting at @ref itself), or None if there is no such ref.
+    """
+    # NOTE(rsetaluri): This walk is iterative (rather than recursive) so that
+    # deeply nested array/tuple values do not hit the recursion limit.
+    while not condition(ref):
+        if ref is None:
+            return None
+        parent = ref.parent()
+        if parent is ref:
+            return None
+        ref = parent
+    return ref
+
+
+PortRef = Union[m.ref.InstRef, m.ref.DefnRef]
+
+# Maps id(value) to (weakref(value), port ref of value). Entries are evicted
+# when the value is collected (see find_port_ref()).
+_port_refs = {}
+
+
+def _is_port_ref(ref: m.ref.Ref) -> bool:
+    return isinstance(ref, (m.ref.InstRef, m.ref.DefnRef))
+
+
+def _evict_port_ref(key: int, _) -> None:
+    _port_refs.pop(key, None)
+
+
+def find_port_ref(value: m.Type) -> Optional[PortRef]:
+    """
+    Returns the InstRef or DefnRef enclosing @value (i.e. the ref of the
+    instance or definition port containing @value), or None if @value is not
+    (part of) a port. Results are memoized per value.
+    """
+    key = id(value)
+    try:
+        value_ref, ref = _port_refs[key]
+    except KeyError:
+        pass
+    else:
+        if value_ref() is value:
+            return ref
+    ref = find_ref(value.name, _is_port_ref)
+    # NOTE(rsetaluri): We can not use a WeakKeyDictionary since magma values
+    # override __eq__. Keying on id(value) is safe since the entry is evicted
+    # (by the weakref callback) before the id can be reused.
+    value_ref = weakref.ref(value, functools.partial(_evict_port_ref, key))
+    _port_refs[key] = (value_ref, ref)
+    return ref
+
+
+def find_inst_ref(value: m.Type) -> Optional[m.ref.InstRef]:
+    ref = find_port_ref(value)
+    if isinstance(ref, m.ref.InstRef):
         return ref
-    if ref is None:
-        return None
-    parent = ref.parent()
-    if parent is ref:
-        return None
-    return find_ref(parent, condition)
+    return None
 
 
-def find_inst_ref(value: m.Type):
-    return find_ref(value.name, lambda r: isinstance(r, m.InstRef))
+def find_defn_ref(value: m.Type) -> Optional[m.ref.DefnRef]:
+    ref = find_port_ref(value)
+    if isinstance(ref, m.ref.DefnRef):
+        return ref
+    return None
 
 
-def find_defn_ref(value: m.Type):
-    return find_ref(value.name, lambda r: isinstance(r, m.DefnRef))
+# Maps definitions to (renamed_ports, reverse map of renamed_ports).
+_renamed_port_maps = weakref.WeakKeyDictionary()
+
+
+def _renamed_port_map(
+        defn_or_inst: Union[m.Circuit, m.DefineCircuitKind]) -> Dict[str, str]:
+    """
+    Returns a map from renamed port names to original port names for
+    @defn_or_inst. The map is computed once per definition (and recomputed if
+    the renamed ports are updated).
+    """
+    try:
+        renamed_ports = defn_or_inst.renamed_ports
+    except AttributeError:
+        return {}
+    if isinstance(defn_or_inst, m.DefineCircuitKind):
+        defn = defn_or_inst
+    else:
+        defn = type(defn_or_inst)
+    try:
+        source, size, reverse = _renamed_port_maps[defn]
+    except KeyError:
+        pass
+    else:
+        if source is renamed_ports and size == len(renamed_ports):
+            return reverse
+    reverse = {}
+    for k, v in renamed_ports.items():
+        reverse.setdefault(v, k)  # first match wins
+    _renamed_port_maps[defn] = (renamed_ports, len(renamed_ports), reverse)
+    return reverse
 
 
 def _lookup_renamed_port(
@@ -61,14 +269,27 @@ def _lookup_renamed_port(
     """Function to un-map renamed ports on circuits"""
     # NOTE(rsetaluri): This functionality should ideally be provided by circuit
     # directly.
-    try:
-        defn_or_inst.renamed_ports
-    except AttributeError:
-        return name
-    for k, v in defn_or_inst.renamed_ports.items():
-        if v == name:
-            return k
-    return name
+    return _renamed_port_map(defn_or_inst).get(name, name)
+
+
+def port_bit_map(
+        src: Union[m.Circuit, m.DefineCircuitKind],
+        dst: Union[m.Circuit, m.DefineCircuitKind]) -> Dict[int, m.Type]:
+    """
+    Returns a map from id(bit) of each port bit of @src to the corresponding
+    port bit of @dst, where @src and @dst have the same interface (e.g. two
+    instances of a definition, or a definition and an instance of it). Ports
+    are resolved once per port (rather than once per bit, as with selectors).
+
+    NOTE(rsetaluri): Keys are only valid while @src is alive.
+    """
+    bit_map = {}
+    dst_ports = dst.interface.ports
+    for name, port in src.interface.ports.items():
+        src_bits = value_bits(port)
+        dst_bits = value_bits(dst_ports[name])
+        bit_map.update(zip(map(id, src_bits), dst_bits))
+    return bit_map
 
 
 @dataclasses.dataclass(frozen=True)
@@ -97,9 +318,7 @@ class PlacedInstSelector(m.value_utils.Selector):
 
 
 def make_port_selector(value: m.Type):
-    ref = find_ref(
-        value.name,
-        lambda r: isinstance(r, m.InstRef) or isinstance(r, m.DefnRef))
+    ref = find_port_ref(value)
     if ref is None:
         raise ValueError("{value} is not a port")
     try:
@@ -116,11 +335,78 @@ def make_port_selector(value: m.Type):
     return DefnSelector(m.value_utils.make_selector(value), ref.name)
 
 
+def value_bits(value: m.Type) -> List[m.Bit]:
+    """Returns the bits of @value, i.e. list(m.as_bits(@value))."""
+    # NOTE(rsetaluri): m.as_bits() is relatively expensive (it constructs a new
+    # Bits value), so we skip it for single bit values.
+    if isinstance(value, m.Digital):
+        return [value]
+    return list(m.as_bits(value))
+
+
+def port_bits(defn_or_inst: Union[m.DefineCircuitKind, m.Circuit]) -> (
+        List[m.Bit]):
+    """
+    Returns the flattened list of all port bits of @defn_or_inst. The i-th bit
+    of an instance corresponds to the i-th bit of its definition.
+    """
+    bits = []
+    for port in defn_or_inst.interface.ports.values():
+        bits.extend(value_bits(port))
+    return bits
+
+
+@dataclasses.dataclass(frozen=True)
+class PortBitTable:
+    """
+    Flattened port bits of a definition or instance (see port_bits()) along
+    with a reverse index from id(bit) to position. Since positions agree
+    between an instance and its definition, translating a bit across a
+    hierarchy boundary is a pair of lookups.
+    """
+    bits: List[m.Bit]
+    index: Dict[int, int]
+
+
+_port_bit_tables = weakref.WeakKeyDictionary()
+
+
+def get_port_bit_table(
+        defn_or_inst: Union[m.DefineCircuitKind, m.Circuit]) -> PortBitTable:
+    """Returns the (lazily computed and cached) table of @defn_or_inst."""
+    try:
+        return _port_bit_tables[defn_or_inst]
+    except KeyError:
+        pass
+    bits = port_bits(defn_or_inst)
+    table = PortBitTable(bits, {id(bit): i for i, bit in enumerate(bits)})
+    _port_bit_tables[defn_or_inst] = table
+    return table
+
+
+def port_bit_index(defn: m.DefineCircuitKind) -> Dict[int, int]:
+    """Returns a map from id(bit) to index in port_bits(@defn)."""
+    return get_port_bit_table(defn).index
+
+
+def _translate_port_bit(
+        value: m.Type,
+        src: Union[m.DefineCircuitKind, m.Circuit],
+        dst: Union[m.DefineCircuitKind, m.Circuit]) -> Optional[m.Type]:
+    index = get_port_bit_table(src).index.get(id(value))
+    if index is None:
+        return None  # not a port bit (e.g. an entire port)
+    return get_port_bit_table(dst).bits[index]
+
+
 def inst_port_to_defn_port(value: m.Type, ref: Optional[m.ref.InstRef] = None):
     if ref is None:
         ref = find_inst_ref(value)
     if ref is None or not isinstance(ref, m.ref.InstRef):
         raise ValueError(f"Unexpected value (value={value}, ref={ref})")
+    bit = _translate_port_bit(value, ref.inst, type(ref.inst))
+    if bit is not None:
+        return bit
     selector = DefnSelector(m.value_utils.make_selector(value), ref.name)
     return selector.select(type(ref.inst))
 
@@ -134,5 +420,8 @@ def defn_port_to_inst_port(
              or not isinstance(inst, ref.defn))
     if check:
         raise ValueError(f"Unexpected value (value={value}, ref={ref})")
+    bit = _translate_port_bit(value, ref.defn, inst)
+    if bit is not None:
+        return bit
     selector = InstSelector(m.value_utils.make_selector(value), ref.name)
     return selector.select(inst)
@@ -0,0 +1,136 @@
+import gc
+import sys
+
+import magma as m
+
+from pdq.circuit_tools.circuit_utils import (
+    find_ref, find_port_ref, find_inst_ref, find_defn_ref, port_bit_map,
+    defn_port_to_inst_port, inst_port_to_defn_port, get_port_bit_table,
+    get_instance_index, find_instances_name_equals, find_instances_path,
+    _lookup_renamed_port, _port_refs)
+from pdq.common.algorithms import only
+
+
+class _Inner(m.Circuit):
+    T = m.Array[2, m.Tuple[m.Bits[4], m.Bit]]
+    io = m.IO(I=m.In(T), O=m.Out(T))
+    io.O @= io.I
+
+
+class _Outer(m.Circuit):
+    io = m.IO(I=m.In(_Inner.T), O=m.Out(_Inner.T))
+    io.O @= _Inner()(io.I)
+
+
+class _Not(m.Circuit):
+    io = m.IO(I=m.In(m.Bit), O=m.Out(m.Bit))
+    io.O @= ~io.I
+
+
+class _ChainRef:
+    def __init__(self, parent=None):
+        self._parent = parent
+
+    def parent(self):
+        return self if self._parent is None else self._parent
+
+
+def test_find_ref_deep_chain():
+    root = _ChainRef()
+    ref = root
+    for _ in range(10 * sys.getrecursionlimit()):
+        ref = _ChainRef(ref)
+    assert find_ref(ref, lambda r: r is root) is root
+    assert find_ref(ref, lambda r: False) is None
+
+
+def test_find_port_ref():
+    inst = only(_Outer.instances)
+    bit = inst.I[1][0][3]
+    assert find_port_ref(bit) is inst.I.name
+    assert find_inst_ref(bit) is inst.I.name
+    assert find_defn_ref(bit) is None
+    # The result is memoized per value.
+    assert _port_refs[id(bit)][1] is inst.I.name
+    assert find_port_ref(bit) is inst.I.name
+    bit = _Outer.O[0][1]
+    assert find_defn_ref(bit) is _Outer.O.name
+    assert find_inst_ref(bit) is None
+
+
+def test_find_port_ref_eviction():
+    value = m.Bit()
+    find_port_ref(value)
+    key = id(value)
+    assert key in _port_refs
+    del value
+    gc.collect()
+    assert key not in _port_refs
+
+
+def test_lookup_renamed_port():
+    inst = only(_Not.instances)
+    assert _lookup_renamed_port(inst, "out") == "O"
+    assert _lookup_renamed_port(type(inst), "in") == "I"
+    assert _lookup_renamed_port(inst, "O") == "O"
+    assert _lookup_renamed_port(_Outer, "I") == "I"
+
+
+def test_port_bit_map():
+    inst = only(_Outer.instances)
+    bit_map = port_bit_map(_Inner, inst)
+    for name in ("I", "O"):
+        defn_port = getattr(_Inner, name)
+        for bit in m.as_bits(defn_port):
+            expected = defn_port_to_inst_port(bit, inst)
+            assert bit_map[id(bit)] is expected
+
+
+def test_port_bit_table_translation():
+    inst = only(_Outer.instances)
+    inst_table = get_port_bit_table(inst)
+    defn_table = get_port_bit_table(_Inner)
+    assert get_port_bit_table(inst) is inst_table
+    assert len(inst_table.bits) == len(defn_table.bits) == 20
+    for inst_bit, defn_bit in zip(inst_table.bits, defn_table.bits):
+        assert inst_port_to_defn_port(inst_bit) is defn_bit
+        assert defn_port_to_inst_port(defn_bit, inst) is inst_bit
+    # Values which are not port bits fall back to selectors.
+    assert inst_port_to_defn_port(inst.I[1]) is _Inner.I[1]
+    assert defn_port_to_inst_port(_Inner.O, inst) is inst.O
+
+
+class _Tile(m.Circuit):
+    io = m.IO(I=m.In(m.Bit), O=m.Out(m.Bit))
+    io.O @= _Not(name="PE")(io.I)
+
+
+class _Array(m.Circuit):
+    io = m.IO(I=m.In(m.Bit), O=m.Out(m.Bit))
+    curr = io.I
+    for x in range(3):
+        for y in range(2):
+            curr = _Tile(name=f"Tile_X{x:02}_Y{y:02}")(curr)
+    io.O @= curr
+
+
+def test_instance_index():
+    index = get_instance_index(_Array)
+    assert get_instance_index(_Array) is index
+    tile = only(index.by_name("Tile_X01_Y00"))
+    assert only(find_instances_name_equals(_Array, "Tile_X01_Y00")) is tile
+    assert index.by_name("Tile_X09_Y00") == []
+    assert len(index.by_type(_Tile)) == 6
+    names = [inst.name for inst in index.by_prefix("Tile_X01")]
+    assert names == ["Tile_X01_Y00", "Tile_X01_Y01"]
+    names = [inst.name for inst in index.match("Tile_X0[02]_Y01")]
+    assert names == ["Tile_X00_Y01", "Tile_X02_Y01"]
+
+
+def test_find_instances_path():
+    paths = list(find_instances_path(_Array, "_Array.Tile_X01_*.PE"))
+    assert [tuple(i.name for i in path) for path in paths] == [
+        ("Tile_X01_Y00", "PE"), ("Tile_X01_Y01", "PE")]
+    paths = list(find_instances_path(_Array, "Tile_X00_Y00.PE.*"))
+    assert len(paths) == 1 and len(paths[0]) == 3
+    assert list(find_instances_path(_Array, "Tile_X00_Y00.Foo")) == []
@@ -0,0 +1,375 @@
+from typing import Iterable, Optional, Sequence, Tuple
+
+import magma as m
+import numpy as np
+
+from pdq.circuit_tools.graph_view import (
+    BitPortNode, DirectedGraphInterface, NodeInterface)
+from pdq.circuit_tools.signal_path import Scope, ScopedBit
+
+
+NodeId = int
+EdgeType = Tuple[BitPortNode, BitPortNode]
+
+
+def _make_csr(
+        keys: np.ndarray,
+        values: np.ndarray,
+        num_nodes: int) -> Tuple[np.ndarray, np.ndarray]:
+    # NOTE(rsetaluri): We use a stable sort so that the neighbors of each node
+    # retain edge insertion order, which keeps downstream consumers (e.g.
+    # circuit reconstruction) deterministic.
+    order = np.argsort(keys, kind="stable")
+    counts = np.bincount(keys, minlength=num_nodes)
+    ptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(counts, out=ptr[1:])
+    return ptr, values[order]
+
+
+def _gather_positions(
+        ptr: np.ndarray, frontier: np.ndarray) -> (
+            Tuple[np.ndarray, np.ndarray]):
+    """
+    Returns (owners, positions), where @positions is the concatenation of the
+    CSR positions of each node in @frontier, i.e. range(ptr[i], ptr[i + 1])
+    for all i, and @owners is the node in @frontier owning each position. No
+    python-level loop is used.
+    """
+    starts = ptr[frontier]
+    counts = ptr[frontier + 1] - starts
+    total = int(counts.sum())
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(frontier, counts), np.repeat(starts, counts) + offsets
+
+
+def _gather(
+        ptr: np.ndarray, idx: np.ndarray, frontier: np.ndarray) -> np.ndarray:
+    """
+    Returns the concatenation of the CSR neighbors of each node in @frontier,
+    i.e. idx[ptr[i]:ptr[i + 1]] for all i (see _gather_positions()).
+    """
+    _, positions = _gather_positions(ptr, frontier)
+    return idx[positions]
+
+
+class CompactDirectedGraph(DirectedGraphInterface):
+    """
+    Directed graph over interned integer node ids. Each node id maps to a
+    (scope id, value) pair via side tables, and adjacency is stored in CSR form
+    (for both incoming and outgoing edges). Node ids are assigned in insertion
+    order, which is preserved by all derived graphs (e.g. subgraph()).
+    """
+
+    def __init__(
+            self,
+            scopes: Sequence[Scope],
+            node_scopes: np.ndarray,
+            values: Sequence[m.Bit],
+            sources: np.ndarray,
+            targets: np.ndarray,
+            csr: Optional[Tuple[np.ndarray, ...]] = None):
+        """
+        If @csr is not None, it is used as the precomputed (out_ptr, out_idx,
+        in_ptr, in_idx) adjacency of the graph (see csr_arrays).
+        """
+        if len(node_scopes) != len(values):
+            raise ValueError("Expected node_scopes and values to be the same "
+                             f"length ({len(node_scopes)} vs. {len(values)})")
+        if len(sources) != len(targets):
+            raise ValueError("Expected sources and targets to be the same "
+                             f"length ({len(sources)} vs. {len(targets)})")
+        self._scopes = scopes
+        self._node_scopes = np.asarray(node_scopes, dtype=np.int32)
+        self._values = values
+        self._sources = np.asarray(sources, dtype=np.int64)
+        self._targets = np.asarray(targets, dtype=np.int64)
+        if csr is not None:
+            self._out_ptr, self._out_idx, self._in_ptr, self._in_idx = csr
+        else:
+            num_nodes = len(self._values)
+            self._out_ptr, self._out_idx = _make_csr(
+                self._sources, self._targets, num_nodes)
+            self._in_ptr, self._in_idx = _make_csr(
+                self._targets, self._sources, num_nodes)
+        self._scope_ids = None
+        self._node_ids = None
+
+    @staticmethod
+    def from_nodes_and_edges(
+            nodes: Iterable[BitPortNode],
+            edges: Iterable[EdgeType]) -> 'CompactDirectedGraph':
+        builder = CompactDirectedGraphBuilder()
+        for node in nodes:
+            builder.add_node(node)
+        for u, v in edges:
+            builder.add_edge(builder.add_node(u), builder.add_node(v))
+        return builder.build()
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self._values)
+
+    @property
+    def num_edges(self) -> int:
+        return len(self._sources)
+
+    @property
+    def scopes(self) -> Sequence[Scope]:
+        return self._scopes
+
+    @property
+    def node_scopes(self) -> np.ndarray:
+        return self._node_scopes
+
+    @property
+    def values(self) -> Sequence[m.Bit]:
+        return self._values
+
+    @property
+    def edge_arrays(self) -> Tuple[np.ndarray, np.ndarray]:
+        return self._sources, self._targets
+
+    @property
+    def csr_arrays(self) -> Tuple[np.ndarray, ...]:
+        return self._out_ptr, self._out_idx, self._in_ptr, self._in_idx
+
+    def __len__(self) -> int:
+        return self.num_nodes
+
+    def scope(self, node_id: NodeId) -> Scope:
+        return self._scopes[self._node_scopes[node_id]]
+
+    def value(self, node_id: NodeId) -> m.Bit:
+        return self._values[node_id]
+
+    def node(self, node_id: NodeId) -> BitPortNode:
+        return BitPortNode(
+            ScopedBit(self._values[node_id], self.scope(node_id)))
+
+    def nodes(self) -> Iterable[BitPortNode]:
+        return map(self.node, range(self.num_nodes))
+
+    def edges(self) -> Iterable[EdgeType]:
+        for u, v in zip(self._sources, self._targets):
+            yield self.node(u), self.node(v)
+
+    def index(self, node: BitPortNode) -> Optional[NodeId]:
+        """Returns the id of @node if it is in this graph, otherwise None."""
+        if self._node_ids is None:
+            self._build_index()
+        scope_id = self._scope_ids.get(node.bit.scope)
+        if scope_id is None:
+            return None
+        return self._node_ids.get((scope_id, id(node.bit.value)))
+
+    def has_node(self, node: BitPortNode) -> bool:
+        return self.index(node) is not None
+
+    def incoming_ids(self, node_id: NodeId) -> np.ndarray:
+        return self._in_idx[self._in_ptr[node_id]:self._in_ptr[node_id + 1]]
+
+    def outgoing_ids(self, node_id: NodeId) -> np.ndarray:
+        return self._out_idx[self._out_ptr[node_id]:self._out_ptr[node_id + 1]]
+
+    def outgoing_edges(
+            self, frontier: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns (sources, edges) for all outgoing edges of the nodes in
+        @frontier, where @edges are positions in CSR (outgoing) order, i.e.
+        indices into csr_arrays[1] (and into per-edge arrays in that order).
+        """
+        return _gather_positions(self._out_ptr, frontier)
+
+    def in_degrees(self) -> np.ndarray:
+        return np.diff(self._in_ptr)
+
+    def out_degrees(self) -> np.ndarray:
+        return np.diff(self._out_ptr)
+
+    def in_degree(self, node_id: NodeId) -> int:
+        return int(self._in_ptr[node_id + 1] - self._in_ptr[node_id])
+
+    def out_degree(self, node_id: NodeId) -> int:
+        return int(self._out_ptr[node_id + 1] - self._out_ptr[node_id])
+
+    def incoming(self, node: NodeInterface) -> Iterable[NodeInterface]:
+        node_id = self._checked_index(node)
+        return map(self.node, self.incoming_ids(node_id))
+
+    def outgoing(self, node: NodeInterface) -> Iterable[NodeInterface]:
+        node_id = self._checked_index(node)
+        return map(self.node, self.outgoing_ids(node_id))
+
+    def reachable(
+            self,
+            sources: Iterable[NodeId],
+            reverse: bool = False,
+            mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Returns a boolean node mask of all nodes reachable from any of
+        @sources (including @sources themselves), following incoming rather
+        than outgoing edges if @reverse is True. If @mask is not None, the
+        traversal is restricted to nodes selected by @mask.
+
+        All sources are propagated together, one frontier (BFS level) at a
+        time, so shared fanout/fanin cones are only visited once.
+        """
+        return self.distances(sources, reverse, mask) >= 0
+
+    def distances(
+            self,
+            sources: Iterable[NodeId],
+            reverse: bool = False,
+            mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Returns the distance (in edges) of each node from the nearest of
+        @sources, or -1 for nodes which are not reachable (see reachable()).
+        """
+        if reverse:
+            ptr, idx = self._in_ptr, self._in_idx
+        else:
+            ptr, idx = self._out_ptr, self._out_idx
+        distances = np.full(self.num_nodes, -1, dtype=np.int64)
+        frontier = np.unique(np.fromiter(sources, dtype=np.int64))
+        if mask is not None:
+            frontier = frontier[mask[frontier]]
+        distance = 0
+        distances[frontier] = distance
+        while frontier.size:
+            neighbors = _gather(ptr, idx, frontier)
+            if neighbors.size == 0:
+                break
+            neighbors = neighbors[distances[neighbors] < 0]
+            if mask is not None:
+                neighbors = neighbors[mask[neighbors]]
+            frontier = np.unique(neighbors)
+            distance += 1
+            distances[frontier] = distance
+        return distances
+
+    def heights(self, mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Returns the length (in edges) of the longest path from each node to a
+        sink, or -1 for nodes not selected by @mask. If @mask is not None, only
+        the subgraph induced by @mask is considered. Raises ValueError if that
+        subgraph is not acyclic.
+
+        Nodes are peeled off in reverse topological order, one level (of
+        nodes whose successors have all been peeled) at a time.
+        """
+        if mask is None:
+            mask = np.ones(self.num_nodes, dtype=bool)
+        internal = mask[self._sources] & mask[self._targets]
+        remaining = np.bincount(
+            self._sources[internal], minlength=self.num_nodes)
+        heights = np.full(self.num_nodes, -1, dtype=np.int64)
+        frontier = np.flatnonzero(mask & (remaining == 0))
+        height = 0
+        num_peeled = 0
+        while frontier.size:
+            heights[frontier] = height
+            num_peeled += frontier.size
+            predecessors = _gather(self._in_ptr, self._in_idx, frontier)
+            predecessors = predecessors[mask[predecessors]]
+            np.subtract.at(remaining, predecessors, 1)
+            frontier = np.unique(predecessors[remaining[predecessors] == 0])
+            height += 1
+        if num_peeled != int(mask.sum()):
+            raise ValueError("Graph is not acyclic")
+        return heights
+
+    def subgraph(self, node_ids: Iterable[NodeId]) -> 'CompactDirectedGraph':
+        """
+        Returns the subgraph induced by @node_ids. Node (and edge) ordering of
+        the original graph is preserved, irrespective of the order of
+        @node_ids.
+        """
+        mask = np.zeros(self.num_nodes, dtype=bool)
+        mask[np.fromiter(node_ids, dtype=np.int64)] = True
+        return self.masked_subgraph(mask)
+
+    def masked_subgraph(self, mask: np.ndarray) -> 'CompactDirectedGraph':
+        """
+        Returns the subgraph induced by the nodes selected by the boolean node
+        mask @mask, preserving node (and edge) ordering.
+        """
+        keep = np.flatnonzero(mask)
+        remap = np.full(self.num_nodes, -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+        edge_mask = mask[self._sources] & mask[self._targets]
+        values = [self._values[i] for i in keep]
+        return CompactDirectedGraph(
+            self._scopes,
+            self._node_scopes[keep],
+            values,
+            remap[self._sources[edge_mask]],
+            remap[self._targets[edge_mask]])
+
+    def _checked_index(self, node: BitPortNode) -> NodeId:
+        node_id = self.index(node)
+        if node_id is None:
+            raise KeyError(node)
+        return node_id
+
+    def _build_index(self):
+        self._scope_ids = {scope: i for i, scope in enumerate(self._scopes)}
+        self._node_ids = {
+            (int(scope_id), id(value)): i
+            for i, (scope_id, value) in enumerate(
+                zip(self._node_scopes, self._values))
+        }
+
+
+class CompactDirectedGraphBuilder:
+    def __init__(self):
+        self._scopes = []
+        self._scope_ids = {}
+        self._node_scopes = []
+        self._values = []
+        self._node_ids = {}
+        self._sources = []
+        self._targets = []
+
+    def add_scope(self, scope: Scope) -> int:
+        try:
+            return self._scope_ids[scope]
+        except KeyError:
+            pass
+        scope_id = len(self._scopes)
+        self._scopes.append(scope)
+        self._scope_ids[scope] = scope_id
+        return scope_id
+
+    def intern_node(self, node: BitPortNode) -> Tuple[NodeId, bool]:
+        """
+        Returns (id, added) for @node, where @added is True iff @node was not
+        previously added. Nodes are keyed by (scope id, id(value)) rather than
+        by @node itself, so @node need not be kept alive by the caller.
+        """
+        scope_id = self.add_scope(node.bit.scope)
+        key = (scope_id, id(node.bit.value))
+        try:
+            return self._node_ids[key], False
+        except KeyError:
+            pass
+        node_id = len(self._values)
+        self._node_scopes.append(scope_id)
+        self._values.append(node.bit.value)
+        self._node_ids[key] = node_id
+        return node_id, True
+
+    def add_node(self, node: BitPortNode) -> NodeId:
+        node_id, _ = self.intern_node(node)
+        return node_id
+
+    def add_edge(self, u: NodeId, v: NodeId):
+        self._sources.append(u)
+        self._targets.append(v)
+
+    def build(self) -> CompactDirectedGraph:
+        return CompactDirectedGraph(
+            self._scopes,
+            np.array(self._node_scopes, dtype=np.int32),
+            self._values,
+            np.array(self._sources, dtype=np.int64),
+            np.array(self._targets, dtype=np.int64))
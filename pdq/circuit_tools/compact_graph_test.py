@@ -0,0 +1,114 @@
+import random
+
+import magma as m
+import numpy as np
+import pytest
+
+from pdq.circuit_tools.compact_graph import CompactDirectedGraph
+from pdq.circuit_tools.graph_view import BitPortNode
+from pdq.circuit_tools.graph_view_utils import (
+    materialize_graph, materialize_compact_graph)
+from pdq.circuit_tools.signal_path import Scope, ScopedBit
+
+
+class _Accum(m.Circuit):
+    T = m.UInt[4]
+    io = m.IO(I=m.In(T), O=m.Out(T)) + m.ClockIO()
+    reg = m.Register(T)()
+    accum = reg.O + io.I
+    reg.I @= accum
+    io.O @= accum
+
+
+class _Top(m.Circuit):
+    T = m.UInt[4]
+    io = m.IO(I0=m.In(T), I1=m.In(T), O=m.Out(T)) + m.ClockIO()
+    out = _Accum()(io.I0)
+    out |= (io.I0 & io.I1)
+    io.O @= out
+
+
+m.passes.clock.WireClockPass(_Top).run()
+
+
+def test_compact_graph_matches_materialized_graph():
+    nodes, edges = materialize_graph(_Top)
+    graph = materialize_compact_graph(_Top)
+    assert graph.num_nodes == len(nodes)
+    assert graph.num_edges == len(edges)
+    assert list(graph.nodes()) == nodes
+    assert list(graph.edges()) == edges
+    for i, node in enumerate(nodes):
+        assert graph.index(node) == i
+        expected = [u for u, v in edges if v == node]
+        assert list(graph.incoming(node)) == expected
+        expected = [v for u, v in edges if u == node]
+        assert list(graph.outgoing(node)) == expected
+
+
+def test_compact_graph_subgraph():
+    nodes, edges = materialize_graph(_Top)
+    graph = CompactDirectedGraph.from_nodes_and_edges(nodes, edges)
+    keep = list(range(0, len(nodes), 2))
+    subgraph = graph.subgraph(reversed(keep))
+    expected_nodes = [nodes[i] for i in keep]
+    assert list(subgraph.nodes()) == expected_nodes
+    expected_edges = [
+        (u, v) for u, v in edges
+        if u in expected_nodes and v in expected_nodes
+    ]
+    assert list(subgraph.edges()) == expected_edges
+    missing = BitPortNode(ScopedBit(_Top.I0[0], Scope(_Accum)))
+    assert subgraph.index(missing) is None
+
+
+def _dfs(graph, src, reverse, mask):
+    neighbors = graph.incoming_ids if reverse else graph.outgoing_ids
+    seen = set()
+    stack = [src] if mask[src] else []
+    while stack:
+        curr = stack.pop()
+        if curr in seen:
+            continue
+        seen.add(curr)
+        stack.extend(n for n in neighbors(curr).tolist() if mask[n])
+    return seen
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_compact_graph_reachable(reverse):
+    graph = materialize_compact_graph(_Top)
+    rng = random.Random(0)
+    for _ in range(10):
+        sources = rng.sample(range(graph.num_nodes), 3)
+        mask = np.array([rng.random() < 0.8 for _ in range(graph.num_nodes)])
+        expected = set()
+        for src in sources:
+            expected |= _dfs(graph, src, reverse, mask)
+        got = graph.reachable(sources, reverse=reverse, mask=mask)
+        assert set(np.flatnonzero(got).tolist()) == expected
+
+
+def test_compact_graph_distances_and_heights():
+    graph = materialize_compact_graph(_Top)
+    distances = graph.distances([0])
+    assert distances[0] == 0
+    for u, v in zip(*map(np.ndarray.tolist, graph.edge_arrays)):
+        if distances[u] >= 0:
+            assert 0 <= distances[v] <= distances[u] + 1
+    assert np.array_equal(distances >= 0, graph.reachable([0]))
+    heights = graph.heights()
+    for i in range(graph.num_nodes):
+        successors = graph.outgoing_ids(i).tolist()
+        expected = max((heights[j] + 1 for j in successors), default=0)
+        assert heights[i] == expected
+
+
+def test_compact_graph_outgoing_edges():
+    graph = materialize_compact_graph(_Top)
+    _, out_idx, _, _ = graph.csr_arrays
+    frontier = np.array([0, graph.num_nodes - 1, 1])
+    sources, edges = graph.outgoing_edges(frontier)
+    expected = [(int(i), int(j)) for i in frontier
+                for j in graph.outgoing_ids(i)]
+    assert list(zip(sources.tolist(), out_idx[edges].tolist())) == expected
@@ -0,0 +1,21 @@
+import pytest
+
+from pdq.circuit_tools.circuit_primitives_utils import _TestOpCache
+
+
+@pytest.fixture(autouse=True)
+def op_cache_dir(tmp_path, monkeypatch):
+    """
+    Points the (process-wide) test_op cache at a fresh directory for each
+    test, so that tests neither read nor modify the developer's .pdq cache.
+    """
+    shared = _TestOpCache._shared
+    monkeypatch.setitem(shared, "_filename", tmp_path / "test_op_cache.db")
+    monkeypatch.setitem(
+        shared, "_legacy_filename", tmp_path / "test_op_cache.csv")
+    monkeypatch.setitem(shared, "_connection", None)
+    monkeypatch.setitem(shared, "_pid", None)
+    monkeypatch.setitem(shared, "_matrices", {})
+    yield tmp_path
+    if shared["_connection"] is not None:
+        shared["_connection"].close()
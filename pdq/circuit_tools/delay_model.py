@@ -0,0 +1,380 @@
+import collections
+import dataclasses
+import math
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+import magma as m
+import numpy as np
+
+from pdq.circuit_tools.compact_graph import CompactDirectedGraph, NodeId
+from pdq.circuit_tools.graph_view_utils import materialize_compact_graph
+from pdq.circuit_tools.logic_depth import (
+    NodeClasses, backtrack_critical_path, classify_nodes,
+    compute_arrival_depths, edge_weights)
+from pdq.circuit_tools.query_pattern import tcl_bit_name
+from pdq.circuit_tools.signal_path import BitSignalPath
+
+
+# (op name, width), e.g. ("coreir.add", 16).
+OpKey = Tuple[str, int]
+
+
+@dataclasses.dataclass(frozen=True)
+class PrimitiveCost:
+    delay: float
+    area: float
+
+
+def primitive_op_key(defn: m.DefineCircuitKind) -> OpKey:
+    """
+    Returns the (op name, width) key of primitive @defn. The op name is
+    "<coreir_lib>.<coreir_name>" (e.g. "coreir.add" or "corebit.and") and the
+    width is the "width" generator argument if present, and otherwise the
+    total number of output bits.
+    """
+    lib = getattr(defn, "coreir_lib", None)
+    name = getattr(defn, "coreir_name", None) or defn.name
+    op = name if lib is None else f"{lib}.{name}"
+    genargs = getattr(defn, "coreir_genargs", None) or {}
+    try:
+        width = int(genargs["width"])
+    except KeyError:
+        # NOTE(rsetaluri): From the inside of the definition, outputs are
+        # inputs.
+        width = sum(
+            len(m.as_bits(port)) for port in defn.interface.ports.values()
+            if port.is_input())
+    return op, width
+
+
+_UNIT_DELAY = 0.05  # roughly one gate delay, in ns
+_ADDERS = {"add", "sub", "neg", "ult", "ule", "ugt", "uge", "slt", "sle",
+           "sgt", "sge"}
+_SHIFTERS = {"shl", "lshr", "ashr"}
+_REDUCTIONS = {"eq", "neq", "orr", "andr", "xorr"}
+
+
+def default_primitive_cost(op: str, width: int) -> PrimitiveCost:
+    """
+    Rough, uncalibrated cost of (@op, @width): delays are in ns and areas in
+    (roughly) gate equivalents. Bitwise ops cost a single gate per bit,
+    whereas adders, shifters and reductions grow logarithmically in delay.
+    """
+    name = op.rsplit(".", 1)[-1]
+    levels = math.log2(max(width, 2))
+    if name == "reg":
+        return PrimitiveCost(0., 6. * width)
+    if name in _ADDERS:
+        return PrimitiveCost((2 + 2 * levels) * _UNIT_DELAY, 8. * width)
+    if name == "mul":
+        return PrimitiveCost((4 + 4 * levels) * _UNIT_DELAY, 6. * width ** 2)
+    if name in _SHIFTERS:
+        return PrimitiveCost((1 + levels) * _UNIT_DELAY, 3. * width * levels)
+    if name in _REDUCTIONS:
+        return PrimitiveCost(levels * _UNIT_DELAY, 2. * width)
+    if "mux" in name.lower():
+        return PrimitiveCost(2 * _UNIT_DELAY, 3. * width)
+    return PrimitiveCost(_UNIT_DELAY, 1. * width)
+
+
+@dataclasses.dataclass(frozen=True)
+class CostModel:
+    """
+    Per-primitive delay/area cost model. Costs are looked up in @table by
+    (op name, width), falling back to @default for missing entries; either
+    may be replaced (or cost() overridden) to plug in another model. Delays
+    are in the units of the clock period, and registers contribute
+    @clock_to_q at their outputs and @setup at their inputs.
+    """
+    table: Mapping[OpKey, PrimitiveCost] = dataclasses.field(
+        default_factory=dict)
+    default: Callable[[str, int], PrimitiveCost] = default_primitive_cost
+    clock_to_q: float = 2 * _UNIT_DELAY
+    setup: float = _UNIT_DELAY
+
+    def cost(self, key: OpKey) -> PrimitiveCost:
+        try:
+            return self.table[key]
+        except KeyError:
+            return self.default(*key)
+
+
+def _node_keys(
+        graph: CompactDirectedGraph,
+        classes: NodeClasses) -> Dict[NodeId, OpKey]:
+    keys = {}
+    cache = {}
+    for node_id in np.flatnonzero(classes.cell_outputs).tolist():
+        defn = type(graph.node(node_id).bit.inst)
+        try:
+            key = cache[defn]
+        except KeyError:
+            key = cache[defn] = primitive_op_key(defn)
+        keys[node_id] = key
+    return keys
+
+
+class TimingAnalysis:
+    """
+    Static-timing-like analysis of @ckt for a given @clock_period under
+    @model. Arrival times are propagated from register outputs (and top-level
+    inputs, at time 0, if @include_ports is True) through primitive cells,
+    each of which delays all of its outputs by its cost. Required times are
+    @clock_period less setup at register inputs (and @clock_period at
+    top-level outputs, if @include_ports is True). If @graph is not None, it
+    is used as the (materialized) graph of @ckt.
+    """
+
+    def __init__(
+            self,
+            ckt: m.DefineCircuitKind,
+            clock_period: float,
+            model: Optional[CostModel] = None,
+            include_ports: bool = False,
+            graph: Optional[CompactDirectedGraph] = None):
+        if model is None:
+            model = CostModel()
+        if graph is None:
+            graph = materialize_compact_graph(ckt)
+        self._ckt = ckt
+        self._clock_period = clock_period
+        self._model = model
+        self._graph = graph
+        self._classes = classify_nodes(graph)
+        self._startpoints = self._classes.startpoints(include_ports)
+        self._endpoints = self._classes.endpoints(include_ports)
+        self._keys = _node_keys(graph, self._classes)
+        self._delays = np.zeros(graph.num_nodes, dtype=np.float64)
+        for node_id, key in self._keys.items():
+            self._delays[node_id] = model.cost(key).delay
+        self._active, self._weights = edge_weights(
+            graph, self._classes, self._delays)
+        self._offsets = np.where(
+            self._classes.register_outputs, model.clock_to_q, 0.)
+        self._required = np.where(
+            self._classes.register_inputs,
+            clock_period - model.setup,
+            clock_period)
+        self._arrival = self.arrival_times(self._startpoints)
+
+    @property
+    def graph(self) -> CompactDirectedGraph:
+        return self._graph
+
+    @property
+    def classes(self) -> NodeClasses:
+        return self._classes
+
+    def arrival_times(self, startpoints: np.ndarray) -> np.ndarray:
+        """
+        Returns the arrival time of each node from (only) @startpoints, or -1
+        for nodes not reachable from @startpoints.
+        """
+        return compute_arrival_depths(
+            self._graph, startpoints, self._weights, self._active,
+            self._offsets)
+
+    def slacks(self) -> Dict[NodeId, float]:
+        """
+        Returns the slack of each (reachable) endpoint, worst first.
+        """
+        endpoints = np.flatnonzero(self._endpoints & (self._arrival >= 0))
+        slacks = self._required[endpoints] - self._arrival[endpoints]
+        order = np.argsort(slacks, kind="stable")
+        return dict(zip(endpoints[order].tolist(), slacks[order].tolist()))
+
+    def worst_slack(self) -> float:
+        return min(self.slacks().values(), default=math.inf)
+
+    def total_negative_slack(self) -> float:
+        return sum(min(slack, 0.) for slack in self.slacks().values())
+
+    def critical_path(
+            self,
+            endpoint: NodeId,
+            arrival: Optional[np.ndarray] = None,
+            startpoints: Optional[np.ndarray] = None) -> List[NodeId]:
+        """
+        Returns the node ids of the critical path to @endpoint. If @arrival is
+        not None, it is used in place of the arrival times from all
+        startpoints, having been computed (by arrival_times()) from
+        @startpoints.
+        """
+        if arrival is None:
+            arrival, startpoints = self._arrival, self._startpoints
+        return backtrack_critical_path(
+            self._graph, endpoint, arrival, startpoints, self._delays)
+
+    def critical_paths(self, num_paths: int = 10) -> List[
+            Tuple[float, BitSignalPath]]:
+        """
+        Returns (slack, path) for the critical paths to the @num_paths
+        endpoints with the worst slack, worst first.
+        """
+        paths = []
+        for endpoint, slack in list(self.slacks().items())[:num_paths]:
+            ids = self.critical_path(endpoint)
+            path = BitSignalPath([self._graph.node(i).bit for i in ids])
+            paths.append((slack, path))
+        return paths
+
+    def path_ops(self, ids: List[NodeId]) -> List[OpKey]:
+        """Returns the op keys of the cells along the path @ids."""
+        return [self._keys[i] for i in ids if i in self._keys]
+
+    def required_time(self, endpoint: NodeId) -> float:
+        return float(self._required[endpoint])
+
+    def start_offset(self, startpoint: NodeId) -> float:
+        return float(self._offsets[startpoint])
+
+
+def _instance_paths(
+        defn: m.DefineCircuitKind,
+        prefix: Tuple[m.Circuit, ...] = ()):
+    for inst in defn.instances:
+        path = prefix + (inst,)
+        yield path
+        if not m.isprimitive(type(inst)):
+            yield from _instance_paths(type(inst), path)
+
+
+def _instance_path_name(path: Tuple[m.Circuit, ...]) -> str:
+    return "/".join(inst.name for inst in path)
+
+
+def estimate_area(
+        ckt: m.DefineCircuitKind,
+        model: Optional[CostModel] = None) -> float:
+    """Returns the total area of the primitives in @ckt under @model."""
+    if model is None:
+        model = CostModel()
+    areas = {}
+
+    def _area(defn):
+        try:
+            return areas[defn]
+        except KeyError:
+            pass
+        if m.isprimitive(defn):
+            area = model.cost(primitive_op_key(defn)).area
+        else:
+            area = sum(_area(type(inst)) for inst in defn.instances)
+        areas[defn] = area
+        return area
+
+    return _area(ckt)
+
+
+def calibrate_areas(
+        model: CostModel,
+        ckt: m.DefineCircuitKind,
+        areas: Mapping[str, str]) -> CostModel:
+    """
+    Returns a copy of @model whose area for each (op, width) is the mean of
+    the areas reported for the primitive instances of @ckt with that key.
+    @areas maps hierarchical instance names (e.g. "Tile_0/PE/add_inst0") to
+    areas, as returned by parse_dc_area(); primitives which were not kept
+    as separate cells by synthesis are ignored.
+    """
+    samples = collections.defaultdict(list)
+    for path in _instance_paths(ckt):
+        defn = type(path[-1])
+        if not m.isprimitive(defn):
+            continue
+        try:
+            area = areas[_instance_path_name(path)]
+        except KeyError:
+            continue
+        samples[primitive_op_key(defn)].append(float(area))
+    table = dict(model.table)
+    for key, values in samples.items():
+        delay = model.cost(key).delay
+        table[key] = PrimitiveCost(delay, sum(values) / len(values))
+    return dataclasses.replace(model, table=table)
+
+
+class _PointResolver:
+    """
+    Resolves start and endpoint names from synthesis timing reports to node
+    ids. Port and pin names (see tcl_bit_name()) resolve to single bits, and
+    any other name to all of the bits of the longest instance path it begins
+    with (e.g. "Register_inst0/reg_P2_inst0/out_reg_0_" resolves to the bits
+    of reg_P2_inst0).
+    """
+
+    def __init__(self, graph: CompactDirectedGraph, mask: np.ndarray):
+        names = collections.defaultdict(list)
+        for node_id in np.flatnonzero(mask).tolist():
+            bit = graph.node(node_id).bit
+            names[tcl_bit_name(bit)].append(node_id)
+            if bit.inst is None:
+                continue
+            path = bit.scope.path + (bit.inst,)
+            for i in range(1, len(path) + 1):
+                names[_instance_path_name(path[:i])].append(node_id)
+        self._names = dict(names)
+
+    def resolve(self, name: str) -> List[NodeId]:
+        while True:
+            try:
+                return self._names[name]
+            except KeyError:
+                pass
+            if "/" not in name:
+                return []
+            name = name.rsplit("/", 1)[0]
+
+
+def calibrate_delays(
+        model: CostModel,
+        ckt: m.DefineCircuitKind,
+        slacks: Mapping[str, Mapping[str, str]],
+        clock_period: float,
+        graph: Optional[CompactDirectedGraph] = None) -> CostModel:
+    """
+    Returns a copy of @model with delays fitted to reported @slacks at
+    @clock_period, as returned by parse_dc_timing() (startpoint -> endpoint
+    -> slack). Each reported path is matched to the critical path between its
+    start and endpoints under @model, and the delays of the ops along these
+    paths are adjusted by the smallest (least-squares) change which makes the
+    estimated delay of every path match its reported delay. Register
+    clock-to-q and setup times are not adjusted, and paths whose points can
+    not be resolved in @ckt are ignored.
+    """
+    analysis = TimingAnalysis(
+        ckt, clock_period, model, include_ports=True, graph=graph)
+    classes = analysis.classes
+    starts = _PointResolver(analysis.graph, classes.startpoints(True))
+    ends = _PointResolver(analysis.graph, classes.endpoints(True))
+    rows, targets = [], []
+    for start_name, reports in slacks.items():
+        start_ids = starts.resolve(start_name)
+        if not start_ids:
+            continue
+        startpoints = np.zeros(analysis.graph.num_nodes, dtype=bool)
+        startpoints[start_ids] = True
+        arrival = analysis.arrival_times(startpoints)
+        for end_name, slack in reports.items():
+            end_ids = [i for i in ends.resolve(end_name) if arrival[i] >= 0]
+            if not end_ids:
+                continue
+            endpoint = max(end_ids, key=lambda i: arrival[i])
+            ids = analysis.critical_path(endpoint, arrival, startpoints)
+            delay = (analysis.required_time(endpoint) - float(slack) -
+                     analysis.start_offset(ids[0]))
+            rows.append(collections.Counter(analysis.path_ops(ids)))
+            targets.append(delay)
+    keys = sorted(set().union(*rows))
+    if not keys:
+        return model
+    A = np.array([[row[key] for key in keys] for row in rows], dtype=float)
+    prior = np.array([model.cost(key).delay for key in keys])
+    # NOTE(rsetaluri): Solving for the change in delays (rather than the
+    # delays themselves) means that the minimum-norm solution of an
+    # under-determined system stays close to the prior model.
+    delta, *_ = np.linalg.lstsq(A, np.array(targets) - A @ prior, rcond=None)
+    table = dict(model.table)
+    for key, delay in zip(keys, np.maximum(prior + delta, 0.).tolist()):
+        table[key] = PrimitiveCost(delay, model.cost(key).area)
+    return dataclasses.replace(model, table=table)
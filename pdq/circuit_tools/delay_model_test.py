@@ -0,0 +1,105 @@
+import magma as m
+import pytest
+
+from pdq.circuit_tools.delay_model import (
+    CostModel, PrimitiveCost, TimingAnalysis, calibrate_areas,
+    calibrate_delays, estimate_area, primitive_op_key)
+from pdq.circuit_tools.graph_view_utils import materialize_compact_graph
+from pdq.circuit_tools.query_pattern import tcl_bit_name
+from pdq.report_parsing.parsers import parse_dc_timing
+
+
+class _Pipeline(m.Circuit):
+    T = m.Bits[2]
+    io = m.IO(I=m.In(T), O=m.Out(T)) + m.ClockIO()
+    reg0 = m.Register(T)()
+    reg1 = m.Register(T)()
+    reg0.I @= io.I
+    # Bit 0 goes through (not, and, xor) and bit 1 through (not, xor).
+    curr = ~reg0.O
+    curr = m.bits([curr[0] & io.I[1], curr[1]])
+    reg1.I @= curr ^ reg0.O
+    io.O @= ~reg1.O
+
+
+m.passes.clock.WireClockPass(_Pipeline).run()
+
+
+_NOT = ("coreir.not", 2)
+_AND = ("corebit.and", 1)
+_XOR = ("coreir.xor", 2)
+_REG = ("coreir.reg", 2)
+_MODEL = CostModel(
+    table={
+        _NOT: PrimitiveCost(0.1, 2.),
+        _AND: PrimitiveCost(0.2, 1.),
+        _XOR: PrimitiveCost(0.3, 4.),
+        _REG: PrimitiveCost(0., 10.),
+    },
+    clock_to_q=0.05,
+    setup=0.02)
+
+
+def _reg_pin(reg, port, index):
+    name = f"{reg.name}/{type(reg).reg_P2_inst0.name}"
+    return f"{name}/{port}[{index}]"
+
+
+def test_primitive_op_key():
+    primitive = type(_Pipeline.reg0).reg_P2_inst0
+    assert primitive_op_key(type(primitive)) == _REG
+    keys = {primitive_op_key(type(inst)) for inst in _Pipeline.instances
+            if m.isprimitive(type(inst))}
+    assert keys == {_NOT, _AND, _XOR}
+
+
+def test_timing_analysis():
+    analysis = TimingAnalysis(_Pipeline, 1., _MODEL)
+    slacks = analysis.slacks()
+    expected = [1. - 0.02 - 0.05 - 0.6, 1. - 0.02 - 0.05 - 0.4]
+    assert list(slacks.values()) == pytest.approx(expected)
+    assert analysis.worst_slack() == pytest.approx(expected[0])
+    assert analysis.total_negative_slack() == 0.
+    (slack, path), _ = analysis.critical_paths()
+    assert slack == pytest.approx(expected[0])
+    assert path.validate()
+    assert tcl_bit_name(path.nodes[0]) == _reg_pin(_Pipeline.reg0, "out", 0)
+    assert tcl_bit_name(path.nodes[-1]) == _reg_pin(_Pipeline.reg1, "in", 0)
+    analysis = TimingAnalysis(_Pipeline, 0.5, _MODEL, include_ports=True)
+    # reg1.I[0], reg1.I[1], O (x2) and reg0.I (x2).
+    expected = [-0.17, 0.03, 0.35, 0.35, 0.48, 0.48]
+    assert list(analysis.slacks().values()) == pytest.approx(expected)
+    assert analysis.total_negative_slack() == pytest.approx(-0.17)
+
+
+def test_estimate_area():
+    assert estimate_area(_Pipeline, _MODEL) == 2 * 10. + 2 * 2. + 1. + 4.
+    areas = {"Register_inst0/reg_P2_inst0": "7", "Register_inst1": "100",
+             "magma_Bit_and_inst0": "3", "TOTAL_COMBO": "1000"}
+    model = calibrate_areas(_MODEL, _Pipeline, areas)
+    assert model.cost(_REG) == PrimitiveCost(0., 7.)
+    assert model.cost(_AND) == PrimitiveCost(0.2, 3.)
+    assert model.cost(_XOR) == _MODEL.cost(_XOR)
+
+
+def test_calibrate_delays(tmp_path):
+    report = tmp_path / "timing.rpt"
+    lines = []
+    for index, delay in ((0, 0.6), (1, 0.4)):
+        slack = 1. - 0.02 - 0.05 - delay
+        lines += [
+            f"  Startpoint: {_reg_pin(_Pipeline.reg0, 'out', index)}",
+            f"  Endpoint: {_Pipeline.reg1.name}/reg_P2_inst0/out_reg_{index}_",
+            f"  slack (MET) {slack:.4f}",
+        ]
+    report.write_text("\n".join(lines) + "\n")
+    slacks = parse_dc_timing(str(report))
+    prior = CostModel(clock_to_q=0.05, setup=0.02)
+    graph = materialize_compact_graph(_Pipeline)
+    model = calibrate_delays(prior, _Pipeline, slacks, 1., graph)
+    assert set(model.table) == {_NOT, _AND, _XOR}
+    calibrated = TimingAnalysis(_Pipeline, 1., model, graph=graph)
+    expected = TimingAnalysis(_Pipeline, 1., _MODEL, graph=graph)
+    assert list(calibrated.slacks().values()) == pytest.approx(
+        list(expected.slacks().values()))
+    assert calibrate_delays(prior, _Pipeline, {"x": {"y": "0"}}, 1.) is prior
@@ -0,0 +1,186 @@
+import dataclasses
+import enum
+from typing import Callable, Iterable, List, Optional, Tuple
+
+import magma as m
+import numpy as np
+
+from pdq.circuit_tools.compact_graph import CompactDirectedGraph, NodeId
+from pdq.circuit_tools.graph_view import BitPortNode
+from pdq.circuit_tools.graph_view_utils import (
+    materialize_compact_graph, materialize_query_graph)
+from pdq.circuit_tools.signal_path import BitSignalPath, ScopedBit
+
+
+class PathOrder(enum.Enum):
+    ANY = enum.auto()  # depth-first order
+    SHORTEST = enum.auto()  # non-decreasing length
+    LONGEST = enum.auto()  # non-increasing length
+
+
+@dataclasses.dataclass(frozen=True)
+class SignalPathQuery:
+    """
+    Query for all simple paths from any bit in @src to any bit in @dst.
+    Lengths are in edges (hops) of the bit-level graph. At most @max_paths
+    paths are generated in total, and at most @max_paths_per_endpoint paths
+    ending at each bit in @dst.
+    """
+    src: Tuple[ScopedBit, ...]
+    dst: Tuple[ScopedBit, ...]
+    order: PathOrder = PathOrder.ANY
+    max_paths: Optional[int] = None
+    max_paths_per_endpoint: Optional[int] = None
+
+
+# Predicate on (depth, node) deciding whether a node is explored at a depth.
+_FitsFn = Callable[[int, NodeId], bool]
+
+
+def _node_ids(
+        graph: CompactDirectedGraph, bits: Iterable[ScopedBit]) -> List[NodeId]:
+    ids = (graph.index(BitPortNode(bit)) for bit in bits)
+    return list(dict.fromkeys(i for i in ids if i is not None))
+
+
+def _dfs(
+        graph: CompactDirectedGraph,
+        srcs: List[NodeId],
+        is_dst: np.ndarray,
+        alive: np.ndarray,
+        fits: _FitsFn,
+        length: Optional[int] = None) -> Iterable[Tuple[NodeId, ...]]:
+    """
+    Yields simple paths (of exactly @length edges, if not None) starting at
+    @srcs and ending at nodes selected by @is_dst. Only nodes selected by
+    @alive, and for which fits(depth, node) is True, are explored. Memory use
+    is bounded by the length of the longest path (rather than the number of
+    paths). @is_dst and @alive may be narrowed (in place) while paths are
+    being generated, to prune the remainder of the search.
+    """
+    for src in srcs:
+        if not alive[src] or not fits(0, src):
+            continue
+        path = [src]
+        on_path = {src}
+        stack = [iter(graph.outgoing_ids(src))]
+        while stack:
+            for node in stack[-1]:
+                node = int(node)
+                depth = len(path)
+                if node in on_path or not alive[node] or not fits(depth, node):
+                    continue
+                path.append(node)
+                on_path.add(node)
+                if is_dst[node] and (length is None or depth == length):
+                    yield tuple(path)
+                if length is not None and depth == length:
+                    successors = iter(())
+                else:
+                    successors = iter(graph.outgoing_ids(node))
+                stack.append(successors)
+                break
+            else:
+                stack.pop()
+                on_path.discard(path.pop())
+
+
+def _alive_mask(
+        graph: CompactDirectedGraph,
+        srcs: List[NodeId],
+        dsts: List[NodeId]) -> np.ndarray:
+    # NOTE(rsetaluri): Nodes which are not both reachable from @srcs and able to
+    # reach @dsts can never be on a path, so we prune them up front.
+    return graph.reachable(srcs) & graph.reachable(dsts, reverse=True)
+
+
+def _enumerate(
+        graph: CompactDirectedGraph,
+        srcs: List[NodeId],
+        dsts: List[NodeId],
+        is_dst: np.ndarray,
+        alive: np.ndarray,
+        order: PathOrder) -> Iterable[Tuple[NodeId, ...]]:
+    srcs = [i for i in srcs if alive[i]]
+    if order is PathOrder.ANY:
+        yield from _dfs(graph, srcs, is_dst, alive, lambda depth, node: True)
+        return
+    # For ordered enumeration, we enumerate paths of each length in turn
+    # (iterative deepening), using the shortest and longest distances from
+    # each node to @dsts to prune nodes which can not be on a path of that
+    # length. This keeps memory bounded at the cost of re-traversal.
+    near = graph.distances(dsts, reverse=True, mask=alive)
+    far = graph.heights(alive)
+    if not srcs:
+        return
+    lengths = range(
+        max(1, min(int(near[i]) for i in srcs)),
+        max(int(far[i]) for i in srcs) + 1)
+    if order is PathOrder.LONGEST:
+        lengths = reversed(lengths)
+    for length in lengths:
+
+        def _fits(depth, node):
+            return depth + near[node] <= length <= depth + far[node]
+
+        yield from _dfs(graph, srcs, is_dst, alive, _fits, length)
+
+
+def generate_paths(
+        ckt: m.DefineCircuitKind,
+        query: SignalPathQuery,
+        graph: Optional[CompactDirectedGraph] = None,
+        summarize: bool = False) -> Iterable[BitSignalPath]:
+    """
+    Lazily generates the paths in @ckt matching @query. If @graph is not None,
+    it is used as the (materialized) graph of @ckt. Otherwise, if @summarize
+    is True, only the instances relevant to @query are expanded (see
+    materialize_query_graph()), which yields the same paths as the flat graph.
+    Paths are simple (no bit appears twice) and have at least one edge;
+    ordered enumeration (see PathOrder) requires the graph to be acyclic.
+    """
+    if query.max_paths == 0 or query.max_paths_per_endpoint == 0:
+        return
+    if graph is None and summarize:
+
+        def _relevant(graph):
+            srcs = _node_ids(graph, query.src)
+            dsts = _node_ids(graph, query.dst)
+            return _alive_mask(graph, srcs, dsts)
+
+        graph = materialize_query_graph(
+            ckt, query.src + query.dst, _relevant)
+    elif graph is None:
+        graph = materialize_compact_graph(ckt)
+    srcs = _node_ids(graph, query.src)
+    dsts = _node_ids(graph, query.dst)
+    if not srcs or not dsts:
+        return
+    is_dst = np.zeros(graph.num_nodes, dtype=bool)
+    is_dst[dsts] = True
+    alive = _alive_mask(graph, srcs, dsts)
+    limit = query.max_paths_per_endpoint
+    num_paths = 0
+    per_endpoint = {}
+    num_exhausted = 0
+    for path in _enumerate(graph, srcs, dsts, is_dst, alive, query.order):
+        yield BitSignalPath([graph.node(i).bit for i in path])
+        num_paths += 1
+        if query.max_paths is not None and num_paths >= query.max_paths:
+            return
+        if limit is None:
+            continue
+        count = per_endpoint.get(path[-1], 0) + 1
+        per_endpoint[path[-1]] = count
+        if count < limit:
+            continue
+        num_exhausted += 1
+        if num_exhausted == len(dsts):
+            return
+        # NOTE(rsetaluri): Exhausted endpoints are no longer destinations, and
+        # nodes which can only reach exhausted endpoints are pruned from the
+        # (in progress) search. Any node on a path to a remaining endpoint is
+        # already alive, so we only need to traverse the alive nodes.
+        is_dst[path[-1]] = False
+        remaining = [i for i in dsts if is_dst[i]]
+        alive &= graph.reachable(remaining, reverse=True, mask=alive)
@@ -0,0 +1,122 @@
+import magma as m
+import pytest
+
+from pdq.circuit_tools import generate_paths as generate_paths_module
+from pdq.circuit_tools.generate_paths import (
+    PathOrder, SignalPathQuery, generate_paths)
+from pdq.circuit_tools.graph_view import BitPortNode
+from pdq.circuit_tools.graph_view_utils import materialize_compact_graph
+from pdq.circuit_tools.signal_path import Scope, ScopedBit
+
+
+class _Inner(m.Circuit):
+    T = m.UInt[2]
+    io = m.IO(I0=m.In(T), I1=m.In(T), O=m.Out(T))
+    io.O @= (io.I0 & io.I1) + io.I1
+
+
+class _Top(m.Circuit):
+    T = m.UInt[2]
+    io = m.IO(I0=m.In(T), I1=m.In(T), O=m.Out(T)) + m.ClockIO()
+    reg = m.Register(T)()
+    reg.I @= _Inner()(io.I0, io.I1)
+    io.O @= reg.O ^ io.I1
+
+
+m.passes.clock.WireClockPass(_Top).run()
+
+
+def _bits(port):
+    return tuple(ScopedBit(bit, Scope(_Top)) for bit in m.as_bits(port))
+
+
+def _all_paths(graph, srcs, dsts):
+    paths = []
+
+    def _visit(path):
+        if len(path) > 1 and path[-1] in dsts:
+            paths.append(tuple(path))
+        for node in graph.outgoing_ids(path[-1]).tolist():
+            if node not in path:
+                _visit(path + [node])
+
+    for src in srcs:
+        _visit([src])
+    return paths
+
+
+def _ids(graph, bits):
+    return tuple(graph.index(BitPortNode(bit)) for bit in bits)
+
+
+_QUERIES = (
+    (_bits(_Top.I1), _bits(_Top.O)),
+    (_bits(_Top.I0) + _bits(_Top.I1), _bits(_Top.reg.I)),
+)
+
+
+@pytest.mark.parametrize("src,dst", _QUERIES)
+@pytest.mark.parametrize("order", list(PathOrder))
+def test_generate_paths(src, dst, order):
+    graph = materialize_compact_graph(_Top)
+    srcs = _ids(graph, src)
+    dsts = set(_ids(graph, dst))
+    expected = _all_paths(graph, srcs, dsts)
+    assert expected
+    query = SignalPathQuery(src, dst, order=order)
+    paths = list(generate_paths(_Top, query, graph))
+    for path in paths:
+        assert path.validate()
+    got = [_ids(graph, path) for path in paths]
+    assert sorted(got) == sorted(expected)
+    lengths = [len(path) for path in got]
+    if order is PathOrder.SHORTEST:
+        assert lengths == sorted(lengths)
+    if order is PathOrder.LONGEST:
+        assert lengths == sorted(lengths, reverse=True)
+
+
+def test_generate_paths_limits():
+    src, dst = _QUERIES[1]
+    query = SignalPathQuery(src, dst, order=PathOrder.LONGEST, max_paths=3)
+    paths = list(generate_paths(_Top, query))
+    assert len(paths) == 3
+    query = SignalPathQuery(src, dst, max_paths_per_endpoint=2)
+    paths = list(generate_paths(_Top, query))
+    endpoints = [path.nodes[-1] for path in paths]
+    assert len(paths) == 2 * len(dst)
+    assert all(endpoints.count(bit) == 2 for bit in dst)
+    # Exhausting some endpoints prunes them without losing the others.
+    src = _bits(_Top.I1)
+    dst = _bits(_Top.reg.I) + _bits(_Top.O)
+    query = SignalPathQuery(src, dst, max_paths_per_endpoint=1)
+    endpoints = [path.nodes[-1] for path in generate_paths(_Top, query)]
+    assert sorted(map(str, endpoints)) == sorted(map(str, dst))
+
+
+def test_generate_paths_zero_limit(monkeypatch):
+
+    def _materialize(*args, **kwargs):
+        raise AssertionError("Graph should not be materialized")
+
+    monkeypatch.setattr(
+        generate_paths_module, "materialize_compact_graph", _materialize)
+    src, dst = _QUERIES[1]
+    query = SignalPathQuery(src, dst, max_paths=0)
+    assert list(generate_paths(_Top, query)) == []
+    query = SignalPathQuery(src, dst, max_paths_per_endpoint=0)
+    assert list(generate_paths(_Top, query)) == []
+
+
+def test_generate_paths_unreachable():
+    query = SignalPathQuery(_bits(_Top.I0), _bits(_Top.O))
+    assert list(generate_paths(_Top, query)) == []
+
+
+@pytest.mark.parametrize("src,dst", _QUERIES)
+def test_generate_paths_summarized(src, dst):
+    query = SignalPathQuery(src, dst)
+    expected = {tuple(path.nodes) for path in generate_paths(_Top, query)}
+    got = {tuple(path.nodes)
+           for path in generate_paths(_Top, query, summarize=True)}
+    assert got == expected
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+from typing import Dict, List, Optional, Union
+import weakref
+
+import magma as m
+import numpy as np
+
+from pdq.circuit_tools.circuit_utils import (
+    find_inst_ref, find_defn_ref, find_instances_name_equals, value_bits,
+    _lookup_renamed_port)
+from pdq.circuit_tools.compact_graph import CompactDirectedGraph
+from pdq.circuit_tools.graph_view_utils import materialize_compact_graph
+from pdq.circuit_tools.signal_path import Scope
+from pdq.common.algorithms import only
+
+
+_FORMAT_VERSION = 1
+_DEFAULT_CACHE_DIR = pathlib.Path(".pdq/graph_cache")
+_CSR_ARRAYS = ("out_ptr", "out_idx", "in_ptr", "in_idx")
+_ARRAYS = (
+    "node_scopes", "node_ports", "node_bits", "sources", "targets",
+    *_CSR_ARRAYS)
+
+_definition_hashes = weakref.WeakKeyDictionary()
+
+
+class _UnsupportedGraphError(Exception):
+    pass
+
+
+def _hash_value(value: Optional[m.Type]) -> str:
+    if value is None:
+        return "<undriven>"
+    return repr(value)
+
+
+def _hash_ports(hasher, defn_or_inst) -> List[m.Type]:
+    bits = []
+    for name, port in defn_or_inst.interface.ports.items():
+        hasher.update(f"port:{name}:{type(port)}\n".encode())
+        bits.extend(value_bits(port))
+    return bits
+
+
+def definition_hash(defn: m.DefineCircuitKind) -> str:
+    """
+    Returns a structural hash of @defn which covers its interface, its
+    instances (recursively, by definition hash), and all of its connections.
+    Hashes are memoized per definition, so each unique definition in a
+    hierarchy is hashed exactly once.
+    """
+    try:
+        return _definition_hashes[defn]
+    except KeyError:
+        pass
+    hasher = hashlib.sha256()
+    hasher.update(f"defn:{defn.name}\n".encode())
+    bits = _hash_ports(hasher, defn)
+    if not m.isdefinition(defn):
+        for attr in ("coreir_lib", "coreir_name", "coreir_genargs"):
+            hasher.update(f"{attr}:{getattr(defn, attr, None)}\n".encode())
+    for inst in defn.instances:
+        child_hash = definition_hash(type(inst))
+        hasher.update(f"inst:{inst.name}:{child_hash}\n".encode())
+        bits.extend(_hash_ports(hasher, inst))
+    for bit in bits:
+        if not bit.is_input():
+            continue
+        driver = _hash_value(bit.trace())
+        hasher.update(f"wire:{repr(bit)}:{driver}\n".encode())
+    value = hasher.hexdigest()
+    _definition_hashes[defn] = value
+    return value
+
+
+def _encode_const(value: m.Bit) -> int:
+    for i in (0, 1):
+        if value is m.Bit(i):
+            return i
+    raise _UnsupportedGraphError(f"Unsupported constant {value}")
+
+
+def _encode_scope(scope: Scope) -> Optional[List[str]]:
+    if scope.top is None:
+        return None
+    return [inst.name for inst in scope.path]
+
+
+def _encode_graph(
+        graph: CompactDirectedGraph) -> (Dict, Dict[str, np.ndarray]):
+    ports = []
+    port_ids = {}
+    port_bit_indices = {}
+    node_ports = np.empty(graph.num_nodes, dtype=np.int64)
+    node_bits = np.empty(graph.num_nodes, dtype=np.int64)
+    for node_id, (scope_id, value) in enumerate(
+            zip(graph.node_scopes, graph.values)):
+        scope_id = int(scope_id)
+        if value.const():
+            key = (scope_id, None, None)
+            bit_index = _encode_const(value)
+            port = None
+        else:
+            ref = find_inst_ref(value)
+            if ref is not None:
+                inst_name = ref.inst.name
+                port = ref.inst.interface.ports[
+                    _lookup_renamed_port(ref.inst, ref.name)]
+            else:
+                ref = find_defn_ref(value)
+                if ref is None:
+                    raise _UnsupportedGraphError(f"Unsupported value {value}")
+                inst_name = None
+                port = ref.defn.interface.ports[
+                    _lookup_renamed_port(ref.defn, ref.name)]
+            key = (scope_id, inst_name, ref.name)
+        try:
+            port_id = port_ids[key]
+        except KeyError:
+            port_id = len(ports)
+            port_ids[key] = port_id
+            ports.append(list(key))
+            if port is not None:
+                port_bit_indices[port_id] = {
+                    id(b): i for i, b in enumerate(value_bits(port))}
+        if port is not None:
+            bit_index = port_bit_indices[port_id][id(value)]
+        node_ports[node_id] = port_id
+        node_bits[node_id] = bit_index
+    meta = {
+        "version": _FORMAT_VERSION,
+        "scopes": [_encode_scope(scope) for scope in graph.scopes],
+        "ports": ports,
+    }
+    sources, targets = graph.edge_arrays
+    arrays = {
+        "node_scopes": graph.node_scopes,
+        "node_ports": node_ports,
+        "node_bits": node_bits,
+        "sources": sources,
+        "targets": targets,
+    }
+    arrays.update(zip(_CSR_ARRAYS, graph.csr_arrays))
+    return meta, arrays
+
+
+def _decode_scope(
+        defn: m.DefineCircuitKind, path: Optional[List[str]]) -> Scope:
+    if path is None:
+        return Scope(None)
+    insts = []
+    curr = defn
+    for name in path:
+        inst = only(find_instances_name_equals(curr, name))
+        insts.append(inst)
+        curr = type(inst)
+    return Scope(defn, tuple(insts))
+
+
+def _decode_graph(
+        defn: m.DefineCircuitKind,
+        meta: Dict,
+        arrays: Dict[str, np.ndarray]) -> CompactDirectedGraph:
+    scopes = [_decode_scope(defn, path) for path in meta["scopes"]]
+    port_bits = []
+    for scope_id, inst_name, port_name in meta["ports"]:
+        if port_name is None:
+            port_bits.append((m.Bit(0), m.Bit(1)))
+            continue
+        leaf = scopes[scope_id].leaf_type()
+        if inst_name is None:
+            owner = leaf
+        else:
+            owner = only(find_instances_name_equals(leaf, inst_name))
+        port = owner.interface.ports[_lookup_renamed_port(owner, port_name)]
+        port_bits.append(value_bits(port))
+    values = [
+        port_bits[port_id][bit_index]
+        for port_id, bit_index in zip(
+            arrays["node_ports"].tolist(), arrays["node_bits"].tolist())
+    ]
+    return CompactDirectedGraph(
+        scopes,
+        arrays["node_scopes"],
+        values,
+        arrays["sources"],
+        arrays["targets"],
+        csr=tuple(arrays[name] for name in _CSR_ARRAYS))
+
+
+def _entry_dir(defn: m.DefineCircuitKind, cache_dir: pathlib.Path):
+    key = f"{defn.name}-{definition_hash(defn)[:32]}-v{_FORMAT_VERSION}"
+    return pathlib.Path(cache_dir) / key
+
+
+def load_graph(
+        defn: m.DefineCircuitKind,
+        cache_dir: Union[str, pathlib.Path] = _DEFAULT_CACHE_DIR) -> (
+            Optional[CompactDirectedGraph]):
+    """
+    Loads the cached graph of @defn from @cache_dir (with node and edge arrays
+    memory-mapped), or returns None if there is no (valid) cache entry.
+    """
+    entry_dir = _entry_dir(defn, cache_dir)
+    try:
+        with open(entry_dir / "meta.json", "r") as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(entry_dir / f"{name}.npy", mmap_mode="r")
+            for name in _ARRAYS
+        }
+    except FileNotFoundError:
+        return None
+    if meta.get("version") != _FORMAT_VERSION:
+        return None
+    try:
+        return _decode_graph(defn, meta, arrays)
+    except (_UnsupportedGraphError, KeyError, IndexError, ValueError) as e:
+        logging.warning(f"Ignoring invalid graph cache entry {entry_dir}: {e}")
+        return None
+
+
+def store_graph(
+        defn: m.DefineCircuitKind,
+        graph: CompactDirectedGraph,
+        cache_dir: Union[str, pathlib.Path] = _DEFAULT_CACHE_DIR) -> bool:
+    """
+    Stores @graph as the cached graph of @defn in @cache_dir. Returns False if
+    @graph can not be serialized.
+    """
+    try:
+        meta, arrays = _encode_graph(graph)
+    except _UnsupportedGraphError as e:
+        logging.warning(f"Not caching graph of {defn.name}: {e}")
+        return False
+    entry_dir = _entry_dir(defn, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+    # NOTE(rsetaluri): We write into a temporary directory and rename it into
+    # place so that concurrent readers never observe a partial entry.
+    tmp_dir = pathlib.Path(tempfile.mkdtemp(dir=cache_dir))
+    try:
+        with open(tmp_dir / "meta.json", "w") as f:
+            json.dump(meta, f)
+        for name, array in arrays.items():
+            np.save(tmp_dir / f"{name}.npy", np.asarray(array))
+        try:
+            os.rename(tmp_dir, entry_dir)
+        except OSError:
+            pass  # another process already populated this entry
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    return True
+
+
+def load_or_materialize_compact_graph(
+        defn: m.DefineCircuitKind,
+        cache_dir: Union[str, pathlib.Path] = _DEFAULT_CACHE_DIR) -> (
+            CompactDirectedGraph):
+    """
+    Returns the cached graph of @defn from @cache_dir if there is one, and
+    otherwise materializes (and caches) it.
+
+    A cache hit is not free: the key is a structural hash of
+    @defn (see definition_hash()), which is linear in the total size of the
+    unique definitions in the hierarchy, and decoding resolves the port of
+    every node, which is linear in the size of the flattened graph (though
+    with a much smaller constant than tracing). Hence the cache pays off most
+    for hierarchical designs, where unique definitions are small relative to
+    the flattened design; for flat designs, a hit is still cheaper than
+    materializing (e.g. ~0.6s vs. ~1.4s for InverterChain(20000)), but by a
+    smaller margin.
+    """
+    graph = load_graph(defn, cache_dir)
+    if graph is not None:
+        return graph
+    graph = materialize_compact_graph(defn)
+    store_graph(defn, graph, cache_dir)
+    return graph
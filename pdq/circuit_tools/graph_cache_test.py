@@ -0,0 +1,49 @@
+import tempfile
+
+import magma as m
+
+from pdq.circuit_tools.graph_cache import (
+    definition_hash, load_graph, load_or_materialize_compact_graph)
+from pdq.circuit_tools.graph_view_utils import materialize_compact_graph
+
+
+def _make_circuits(invert: bool):
+
+    class _Inner(m.Circuit):
+        io = m.IO(I=m.In(m.Bits[2]), O=m.Out(m.Bits[2]))
+        io.O @= ~io.I if invert else io.I ^ 1
+
+    class _Outer(m.Circuit):
+        io = m.IO(I=m.In(m.Bits[2]), O=m.Out(m.Bits[3])) + m.ClockIO()
+        io.O @= m.concat(m.register(_Inner()(io.I)), m.bits(1, 1))
+
+    m.passes.clock.WireClockPass(_Outer).run()
+    return _Inner, _Outer
+
+
+def test_definition_hash():
+    inner0, outer0 = _make_circuits(True)
+    inner1, outer1 = _make_circuits(True)
+    inner2, outer2 = _make_circuits(False)
+    assert definition_hash(outer0) == definition_hash(outer1)
+    assert definition_hash(inner0) != definition_hash(inner2)
+    # Changing a sub-definition must change the top-level hash.
+    assert definition_hash(outer0) != definition_hash(outer2)
+
+
+def test_graph_cache_round_trip():
+    _, outer = _make_circuits(True)
+    expected = materialize_compact_graph(outer)
+    with tempfile.TemporaryDirectory() as directory:
+        assert load_graph(outer, directory) is None
+        load_or_materialize_compact_graph(outer, directory)
+        graph = load_graph(outer, directory)
+        assert graph is not None
+        assert list(graph.nodes()) == list(expected.nodes())
+        assert list(graph.edges()) == list(expected.edges())
+        for node in expected.nodes():
+            assert (list(graph.incoming(node)) ==
+                    list(expected.incoming(node)))
+        # A modified design must not hit the previous entry.
+        _, other = _make_circuits(False)
+        assert load_graph(other, directory) is None
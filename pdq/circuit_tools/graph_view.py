@@ -1,13 +1,14 @@
 import abc
 import dataclasses
-from typing import Iterable, Union
+from typing import Callable, Iterable, Optional, Union
 
 import magma as m
 
 from pdq.circuit_tools.circuit_primitives import get_primitive_drivers
 from pdq.circuit_tools.circuit_utils import (
     find_inst_ref, find_defn_ref, inst_port_to_defn_port,
-    defn_port_to_inst_port)
+    defn_port_to_inst_port, trace_drivees, get_port_bit_table,
+    port_bit_index)
 from pdq.circuit_tools.signal_path import Scope, ScopedBit
 from pdq.common.validator import validator
 
@@ -16,17 +17,6 @@ def _empty() -> Iterable:
     yield from ()
 
 
-def _trace_drivees(bit: m.Bit) -> Iterable[m.Bit]:
-    drivees = bit.driving()
-    if not drivees:
-        return _empty()
-    for drivee in drivees:
-        if drivee.is_input() or drivee.is_inout():
-            yield drivee
-            continue
-        yield from _trace_drivees(drivee)
-
-
 class NodeInterface(abc.ABC):
     # NOTE(rsetaluri): We'd like this class to have abstract methods __eq__ and
     # __hash__, but unfortunately implementations relying on dataclass
@@ -110,13 +100,13 @@ class SimpleDirectedGraphViewBase(DirectedGraphInterface):
                 return
             assert node.bit.value.is_output()  # no support for InOut types
             if include_outgoing:
-                for drivee in _trace_drivees(node.bit.value):
+                for drivee in trace_drivees(node.bit.value):
                     yield BitPortNode(ScopedBit(drivee, scope))
             return
         assert node.bit.inst is not None  # no support for anon bits
         if node.bit.value.is_output():
             if include_outgoing:
-                for drivee in _trace_drivees(node.bit.value):
+                for drivee in trace_drivees(node.bit.value):
                     ref = find_inst_ref(drivee)
                     if ref is not None:
                         yield BitPortNode(ScopedBit(drivee, node.bit.scope))
@@ -183,7 +173,7 @@ class SimpleDirectedGraphViewBase(DirectedGraphInterface):
                     yield BitPortNode(ScopedBit(drivee, node.bit.scope))
                 return
             defn_port = inst_port_to_defn_port(node.bit.value, node.bit.ref)
-            for drivee in _trace_drivees(defn_port):
+            for drivee in trace_drivees(defn_port):
                 ref = find_defn_ref(drivee)
                 if ref is not None:
                     # TODO(rsetaluri): Implement this case.
@@ -209,8 +199,65 @@ class SimpleDirectedGraphViewBase(DirectedGraphInterface):
             primitive: m.DefineCircuitKind,
             inst_bit: m.In(m.Bit)) -> Iterable[m.Bit]:
         assert inst_bit.is_input()
-        for port in primitive.interface.ports.values():
-            port_as_bits = m.as_bits(port)
-            for other_bit in port_as_bits:
-                if other_bit.is_input():
-                    yield other_bit
+        for other_bit in get_port_bit_table(primitive).bits:
+            if other_bit.is_input():
+                yield other_bit
+
+
+class SummarizedDirectedGraphView(SimpleDirectedGraphViewBase):
+    """
+    Graph view which hops over non-primitive instances in one step using their
+    port-to-port reachability summaries (see get_definition_summary()), rather
+    than descending into them. Instances for which @expand(scope, inst)
+    returns True are descended into as usual.
+    """
+
+    def __init__(
+            self,
+            ckt: m.DefineCircuitKind,
+            expand: Optional[Callable[[Scope, m.Circuit], bool]] = None):
+        super().__init__(ckt)
+        self._expand = expand
+
+    def _is_summarized(self, node: BitPortNode) -> bool:
+        if node.bit.value.const() or node.bit.defn is not None:
+            return False
+        inst = node.bit.inst
+        if inst is None or not m.isdefinition(type(inst)):
+            return False
+        return self._expand is None or not self._expand(node.bit.scope, inst)
+
+    def _hop(self, node: BitPortNode) -> Iterable[BitPortNode]:
+        from pdq.circuit_tools.hierarchical_graph import (
+            get_definition_summary)
+        defn = type(node.bit.inst)
+        summary = get_definition_summary(defn)
+        defn_bit = inst_port_to_defn_port(node.bit.value, node.bit.ref)
+        index = port_bit_index(defn)[id(defn_bit)]
+        if node.bit.value.is_output():
+            others = summary.drivers(index)
+        else:
+            others = summary.drivees(index)
+        bits = get_port_bit_table(node.bit.inst).bits
+        for other in others:
+            yield BitPortNode(ScopedBit(bits[other], node.bit.scope))
+
+    def _neighbors_impl(
+            self,
+            node: BitPortNode,
+            include_incoming: bool,
+            include_outgoing: bool) -> Iterable[BitPortNode]:
+        if not self._is_summarized(node):
+            yield from super()._neighbors_impl(
+                node, include_incoming, include_outgoing)
+            return
+        # Edges crossing into the instance are replaced by summary edges; edges
+        # at the level of the instance are handled by the base implementation.
+        is_output = node.bit.value.is_output()
+        yield from super()._neighbors_impl(
+            node,
+            include_incoming and not is_output,
+            include_outgoing and is_output)
+        if (include_incoming and is_output) or (
+                include_outgoing and not is_output):
+            yield from self._hop(node)
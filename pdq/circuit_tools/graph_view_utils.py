@@ -1,10 +1,15 @@
+import collections
 import dataclasses
-from typing import Iterable, Tuple
+from typing import Callable, Iterable, List, Optional, Set, Tuple
 
 import magma as m
+import numpy as np
 
+from pdq.circuit_tools.compact_graph import (
+    CompactDirectedGraph, CompactDirectedGraphBuilder)
 from pdq.circuit_tools.graph_view import (
-    SimpleDirectedGraphViewBase, BitPortNode)
+    DirectedGraphInterface, SimpleDirectedGraphViewBase,
+    SummarizedDirectedGraphView, BitPortNode)
 from pdq.circuit_tools.signal_path import Scope, ScopedBit
 
 
@@ -12,30 +17,185 @@ NodeType = BitPortNode
 EdgeType = Tuple[NodeType, NodeType]
 
 
-def materialize_graph(
-        defn: m.DefineCircuitKind) -> (Iterable[NodeType], Iterable[EdgeType]):
-    seen = set()
-    node_indices = {}  # in order to get consistently ordered vertices
-    edges = []
-    queue = []
+def _scope_depth(node: NodeType) -> int:
+    return node.bit.scope.depth
+
+
+def _root_nodes(defn: m.DefineCircuitKind) -> Iterable[NodeType]:
+    scope = Scope(defn)
     for port in defn.interface.ports.values():
-        for bit in m.as_bits(port):
-            node = BitPortNode(ScopedBit(bit, Scope(defn)))
+        for bit in ScopedBit.from_port(port, scope):
+            yield BitPortNode(bit)
+
+
+def _dict_interner() -> Callable[[NodeType], Tuple[int, bool]]:
+    ids = {}
+
+    def _intern(node):
+        try:
+            return ids[node], False
+        except KeyError:
+            pass
+        node_id = len(ids)
+        ids[node] = node_id
+        return node_id, True
+
+    return _intern
+
+
+def traverse_graph(
+        graph: DirectedGraphInterface,
+        roots: Iterable[NodeType],
+        max_depth: Optional[int] = None,
+        intern: Optional[Callable[[NodeType], Tuple[int, bool]]] = None) -> (
+            Iterable[Tuple[int, NodeType, List[int]]]):
+    """
+    Breadth-first traversal of @graph (following both incoming and outgoing
+    edges) starting from @roots. Yields (id, node, incoming ids) tuples, where
+    ids are assigned in the order that nodes are discovered; since nodes are
+    marked as seen when they are enqueued, each node is yielded exactly once,
+    and in increasing id order.
+
+    If @max_depth is not None, then nodes whose scope is nested more than
+    @max_depth levels below the root are not visited (nor are edges to them
+    reported).
+
+    If @intern is not None, it assigns ids: intern(node) must return (id,
+    True) for an unseen node, with ids consecutive from 0, and (id, False)
+    otherwise. By default, ids are kept in a dict keyed by node, which keeps
+    every node alive until the traversal completes.
+    """
+    if intern is None:
+        intern = _dict_interner()
+    queue = collections.deque()
+
+    def _enqueue(node):
+        node_id, added = intern(node)
+        if added:
             queue.append(node)
-    graph = SimpleDirectedGraphViewBase(defn)
+        return node_id
+
+    def _visit(node):
+        return max_depth is None or _scope_depth(node) <= max_depth
+
+    for root in roots:
+        _enqueue(root)
+    node_id = 0
     while queue:
-        node = queue.pop(0)
-        if node in seen:
-            continue
-        seen.add(node)
-        node_indices[node] = len(node_indices)
-        for i in graph.incoming(node):
-            edges.append((i, node))
-            if i not in seen:
-                queue.append(i)
+        node = queue.popleft()
+        incoming = [_enqueue(i) for i in graph.incoming(node) if _visit(i)]
         for o in graph.outgoing(node):
-            if o not in seen:
-                queue.append(o)
-    assert len(node_indices) == len(seen)
-    nodes = sorted(list(seen), key=lambda n: node_indices[n])
+            if _visit(o):
+                _enqueue(o)
+        yield node_id, node, incoming
+        node_id += 1
+
+
+def materialize_graph(
+        defn: m.DefineCircuitKind,
+        max_depth: Optional[int] = None,
+        graph: Optional[DirectedGraphInterface] = None) -> (
+            Iterable[NodeType], Iterable[EdgeType]):
+    if graph is None:
+        graph = SimpleDirectedGraphViewBase(defn)
+    nodes = []  # in order to get consistently ordered vertices
+    edge_ids = []
+    for node_id, node, incoming in traverse_graph(
+            graph, _root_nodes(defn), max_depth):
+        assert node_id == len(nodes)
+        nodes.append(node)
+        edge_ids.extend((i, node_id) for i in incoming)
+    edges = [(nodes[u], nodes[v]) for u, v in edge_ids]
     return nodes, edges
+
+
+def materialize_compact_graph(
+        defn: m.DefineCircuitKind,
+        max_depth: Optional[int] = None,
+        graph: Optional[DirectedGraphInterface] = None) -> (
+            CompactDirectedGraph):
+    """
+    Materializes the graph of @defn (as for materialize_graph()) directly
+    into a CompactDirectedGraph. Node ids are assigned by the builder as nodes
+    are discovered, so node objects are only kept alive while they are
+    queued.
+    """
+    if graph is None:
+        graph = SimpleDirectedGraphViewBase(defn)
+    builder = CompactDirectedGraphBuilder()
+    for node_id, _, incoming in traverse_graph(
+            graph, _root_nodes(defn), max_depth, builder.intern_node):
+        for i in incoming:
+            builder.add_edge(i, node_id)
+    return builder.build()
+
+
+_InstanceKey = Tuple[Scope, m.Circuit]
+
+
+def _endpoint_instances(bits: Iterable[ScopedBit]) -> Set[_InstanceKey]:
+    keys = set()
+    for bit in bits:
+        if bit.scope.top is None:  # constant
+            continue
+        insts = bit.scope.path
+        if bit.inst is not None:
+            insts += (bit.inst,)
+        scope = Scope(bit.scope.top)
+        for inst in insts:
+            keys.add((scope, inst))
+            scope = scope.extend(inst)
+    return keys
+
+
+def expand_endpoint_scopes(
+        bits: Iterable[ScopedBit]) -> Callable[[Scope, m.Circuit], bool]:
+    """
+    Returns an @expand predicate for SummarizedDirectedGraphView which expands
+    exactly the instances along the hierarchy paths of @bits, i.e. every
+    instance containing (or owning) a bit in @bits. All of @bits are then
+    nodes of the summarized graph.
+    """
+    keys = _endpoint_instances(bits)
+    return lambda scope, inst: (scope, inst) in keys
+
+
+def materialize_query_graph(
+        defn: m.DefineCircuitKind,
+        endpoints: Iterable[ScopedBit],
+        relevant: Callable[[CompactDirectedGraph], np.ndarray]) -> (
+            CompactDirectedGraph):
+    """
+    Materializes a graph of @defn for a query over @endpoints, in which only
+    the instances relevant to the query are expanded and all others are
+    summarized (see SummarizedDirectedGraphView). @relevant(graph) returns a
+    node mask of the nodes of @graph that the query retains (e.g. those on
+    some path between its endpoints).
+
+    Instances along the paths to @endpoints are expanded up front (see
+    expand_endpoint_scopes()); then, while @relevant selects a port of a
+    summarized instance, that instance is expanded and the graph is
+    re-materialized. On return, the nodes selected by @relevant, and the edges
+    among them, are the same as in the flat graph of @defn (although node ids
+    may differ).
+    """
+    keys = _endpoint_instances(endpoints)
+
+    def _expand(scope, inst):
+        return (scope, inst) in keys
+
+    while True:
+        view = SummarizedDirectedGraphView(defn, _expand)
+        graph = materialize_compact_graph(defn, graph=view)
+        summarized = set()
+        for node_id in np.flatnonzero(relevant(graph)).tolist():
+            bit = graph.node(node_id).bit
+            inst = bit.inst
+            if inst is None or not m.isdefinition(type(inst)):
+                continue
+            key = (bit.scope, inst)
+            if key not in keys:
+                summarized.add(key)
+        if not summarized:
+            return graph
+        keys |= summarized
@@ -0,0 +1,36 @@
+import magma as m
+
+from designs.inverter_chain import InverterChain
+from pdq.circuit_tools.graph_view_utils import (
+    materialize_graph, materialize_compact_graph)
+
+
+class _Inner(m.Circuit):
+    io = m.IO(I=m.In(m.Bit), O=m.Out(m.Bit))
+    io.O @= ~io.I
+
+
+class _Outer(m.Circuit):
+    io = m.IO(I=m.In(m.Bit), O=m.Out(m.Bit))
+    io.O @= ~_Inner()(io.I)
+
+
+def test_materialize_graph_unique_nodes():
+    ckt = InverterChain(8, 3)
+    nodes, edges = materialize_graph(ckt)
+    assert len(set(nodes)) == len(nodes)
+    # Each inverter contributes 2 nodes; the top level has 2 + 8 * 3 ports.
+    assert len(nodes) == 2 * 8 + 2 + 8 * 3
+    # Every node other than the top-level input has exactly one driver.
+    assert len(edges) == len(nodes) - 1
+
+
+def test_materialize_graph_max_depth():
+    nodes, _ = materialize_graph(_Outer)
+    assert max(len(n.bit.scope.path) for n in nodes) == 1
+    shallow_nodes, shallow_edges = materialize_graph(_Outer, max_depth=0)
+    assert all(n.bit.scope.is_root() for n in shallow_nodes)
+    assert len(shallow_nodes) == len(nodes) - 2
+    graph = materialize_compact_graph(_Outer, max_depth=0)
+    assert list(graph.nodes()) == shallow_nodes
+    assert list(graph.edges()) == shallow_edges
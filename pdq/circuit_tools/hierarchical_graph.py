@@ -0,0 +1,360 @@
+import dataclasses
+from typing import List, Tuple, Union
+import weakref
+
+import magma as m
+import numpy as np
+
+from pdq.circuit_tools.circuit_primitives import (
+    get_primitive_port_drivers, is_register)
+from pdq.circuit_tools.circuit_utils import port_bits, port_bit_index
+from pdq.circuit_tools.compact_graph import CompactDirectedGraph
+from pdq.circuit_tools.signal_path import Scope
+
+
+_templates = weakref.WeakKeyDictionary()
+_summaries = weakref.WeakKeyDictionary()
+
+
+@dataclasses.dataclass
+class DefinitionTemplate:
+    """
+    Internal connectivity of a single definition, independent of the scope(s)
+    in which it is instanced. Local nodes are the port bits of all instances
+    in the definition (in instance order), and local edges are expressed over
+    local node ids. Connections to the definition's own ports are recorded as
+    boundary edges (indexed by position in port_bits(defn)), and connections
+    into non-primitive instances are resolved by stitching the instance's own
+    template.
+    """
+    defn: m.DefineCircuitKind
+    values: List[m.Bit]
+    inst_offsets: List[int]
+    sources: np.ndarray
+    targets: np.ndarray
+    const_edges: List[Tuple[m.Bit, int]]
+    input_edges: List[Tuple[int, int]]
+    output_drivers: List[Tuple[int, str, Union[int, m.Bit]]]
+    children: List[int]
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.values)
+
+
+def _make_template(defn: m.DefineCircuitKind) -> DefinitionTemplate:
+    instances = list(defn.instances)
+    values = []
+    inst_offsets = []
+    local_ids = {}
+    for inst in instances:
+        inst_offsets.append(len(values))
+        for bit in port_bits(inst):
+            local_ids[id(bit)] = len(values)
+            values.append(bit)
+    defn_index = port_bit_index(defn)
+    sources = []
+    targets = []
+    const_edges = []
+    input_edges = []
+
+    def _add_driver(driver, target):
+        if driver.const():
+            const_edges.append((driver, target))
+            return
+        try:
+            source = local_ids[id(driver)]
+        except KeyError:
+            input_edges.append((defn_index[id(driver)], target))
+            return
+        sources.append(source)
+        targets.append(target)
+
+    children = []
+    for i, inst in enumerate(instances):
+        type_ = type(inst)
+        offset = inst_offsets[i]
+        if m.isdefinition(type_):
+            children.append(i)
+        else:
+            index = port_bit_index(type_)
+            for port in type_.interface.ports.values():
+                if not port.is_input():
+                    continue
+                all_drivers = get_primitive_port_drivers(
+                    port, allow_default=False)
+                for bit, drivers in zip(m.as_bits(port), all_drivers):
+                    target = offset + index[id(bit)]
+                    for driver in drivers:
+                        sources.append(offset + index[id(driver)])
+                        targets.append(target)
+        for bit in port_bits(inst):
+            if not bit.is_input():
+                continue
+            driver = bit.trace()
+            if driver is not None:
+                _add_driver(driver, local_ids[id(bit)])
+    output_drivers = []
+    for j, bit in enumerate(port_bits(defn)):
+        if not bit.is_input():
+            continue
+        driver = bit.trace()
+        if driver is None:
+            continue
+        if driver.const():
+            output_drivers.append((j, "const", driver))
+        elif id(driver) in local_ids:
+            output_drivers.append((j, "local", local_ids[id(driver)]))
+        else:
+            output_drivers.append((j, "input", defn_index[id(driver)]))
+    return DefinitionTemplate(
+        defn=defn,
+        values=values,
+        inst_offsets=inst_offsets,
+        sources=np.array(sources, dtype=np.int64),
+        targets=np.array(targets, dtype=np.int64),
+        const_edges=const_edges,
+        input_edges=input_edges,
+        output_drivers=output_drivers,
+        children=children)
+
+
+def get_definition_template(defn: m.DefineCircuitKind) -> DefinitionTemplate:
+    """Returns the (cached) template of @defn."""
+    if not m.isdefinition(defn):
+        raise ValueError(f"Expected definition, got {defn}")
+    try:
+        return _templates[defn]
+    except KeyError:
+        pass
+    template = _make_template(defn)
+    _templates[defn] = template
+    return template
+
+
+@dataclasses.dataclass(frozen=True)
+class DefinitionSummary:
+    """
+    Port-to-port (combinational) reachability of a definition. @inputs and
+    @outputs are indices into port_bits(defn); reach[i, o] is True iff input
+    @inputs[i] reaches output @outputs[o] without passing through a register.
+    Register boundaries are marked by @reaches_register (input i reaches the
+    input of some register) and @from_register (output o is reached from the
+    output of some register).
+    """
+    defn: m.DefineCircuitKind
+    inputs: Tuple[int, ...]
+    outputs: Tuple[int, ...]
+    reach: np.ndarray
+    reaches_register: np.ndarray
+    from_register: np.ndarray
+
+    def __post_init__(self):
+        object.__setattr__(
+            self, "_input_pos", {j: i for i, j in enumerate(self.inputs)})
+        object.__setattr__(
+            self, "_output_pos", {j: o for o, j in enumerate(self.outputs)})
+
+    def drivers(self, output: int) -> List[int]:
+        """Returns the inputs (port bit indices) which reach @output."""
+        o = self._output_pos[output]
+        return [self.inputs[i] for i in np.flatnonzero(self.reach[:, o])]
+
+    def drivees(self, input_: int) -> List[int]:
+        """Returns the outputs (port bit indices) reached by @input_."""
+        i = self._input_pos[input_]
+        return [self.outputs[o] for o in np.flatnonzero(self.reach[i])]
+
+
+def _make_summary(defn: m.DefineCircuitKind) -> DefinitionSummary:
+    template = get_definition_template(defn)
+    defn_bits = port_bits(defn)
+    # NOTE(rsetaluri): From inside the definition, inputs of @defn are outputs
+    # (and vice versa).
+    inputs = tuple(j for j, b in enumerate(defn_bits) if b.is_output())
+    outputs = tuple(j for j, b in enumerate(defn_bits) if b.is_input())
+    # Local summary graph nodes: [port bits of defn] + [template nodes] +
+    # [register source, register sink].
+    base = len(defn_bits)
+    reg_source = base + template.num_nodes
+    reg_sink = reg_source + 1
+    successors = [[] for _ in range(reg_sink + 1)]
+    for u, v in zip(template.sources.tolist(), template.targets.tolist()):
+        successors[base + u].append(base + v)
+    for j, t in template.input_edges:
+        successors[j].append(base + t)
+    for j, kind, driver in template.output_drivers:
+        if kind == "local":
+            successors[base + driver].append(j)
+        elif kind == "input":
+            successors[driver].append(j)
+    for i, inst in enumerate(template.defn.instances):
+        type_ = type(inst)
+        offset = base + template.inst_offsets[i]
+        if m.isdefinition(type_):
+            child = get_definition_summary(type_)
+            for k, child_input in enumerate(child.inputs):
+                for child_output in child.drivees(child_input):
+                    successors[offset + child_input].append(
+                        offset + child_output)
+                if child.reaches_register[k]:
+                    successors[offset + child_input].append(reg_sink)
+            for k, child_output in enumerate(child.outputs):
+                if child.from_register[k]:
+                    successors[reg_source].append(offset + child_output)
+        elif is_register(type_):
+            for j, bit in enumerate(port_bits(type_)):
+                if bit.is_input():  # register output
+                    successors[reg_source].append(offset + j)
+                else:
+                    successors[offset + j].append(reg_sink)
+    # Propagate (bitset) masks of sources reaching each node to a fixed point.
+    # Bit i corresponds to inputs[i] and bit len(inputs) to the register
+    # source.
+    sources = list(inputs) + [reg_source]
+    masks = [0] * len(successors)
+    worklist = []
+    for i, source in enumerate(sources):
+        masks[source] |= 1 << i
+        worklist.append(source)
+    while worklist:
+        node = worklist.pop()
+        mask = masks[node]
+        for succ in successors[node]:
+            new_mask = masks[succ] | mask
+            if new_mask != masks[succ]:
+                masks[succ] = new_mask
+                worklist.append(succ)
+    num_inputs = len(inputs)
+    reach = np.zeros((num_inputs + 1, len(outputs) + 1), dtype=bool)
+    for o, node in enumerate(list(outputs) + [reg_sink]):
+        mask = masks[node]
+        for i in range(num_inputs + 1):
+            reach[i, o] = bool((mask >> i) & 1)
+    return DefinitionSummary(
+        defn=defn,
+        inputs=inputs,
+        outputs=outputs,
+        reach=reach[:num_inputs, :len(outputs)],
+        reaches_register=reach[:num_inputs, len(outputs)],
+        from_register=reach[num_inputs, :len(outputs)])
+
+
+def get_definition_summary(defn: m.DefineCircuitKind) -> DefinitionSummary:
+    """Returns the (cached) port-to-port reachability summary of @defn."""
+    if not m.isdefinition(defn):
+        raise ValueError(f"Expected definition, got {defn}")
+    try:
+        return _summaries[defn]
+    except KeyError:
+        pass
+    summary = _make_summary(defn)
+    _summaries[defn] = summary
+    return summary
+
+
+class _Stitcher:
+    def __init__(self):
+        self.scopes = []
+        self._scope_ids = {}
+        self.node_scopes = []
+        self.values = []
+        self.sources = []
+        self.targets = []
+        self._const_ids = {}
+        self._num_nodes = 0
+
+    def add_scope(self, scope: Scope) -> int:
+        try:
+            return self._scope_ids[scope]
+        except KeyError:
+            pass
+        scope_id = len(self.scopes)
+        self.scopes.append(scope)
+        self._scope_ids[scope] = scope_id
+        return scope_id
+
+    def add_block(self, values: List[m.Bit], scope: Scope) -> int:
+        base = self._num_nodes
+        scope_id = self.add_scope(scope)
+        self.node_scopes.append(np.full(len(values), scope_id, np.int32))
+        self.values.extend(values)
+        self._num_nodes += len(values)
+        return base
+
+    def add_edges(self, sources: np.ndarray, targets: np.ndarray):
+        self.sources.append(np.asarray(sources, dtype=np.int64))
+        self.targets.append(np.asarray(targets, dtype=np.int64))
+
+    def add_edge(self, source: int, target: int):
+        self.add_edges([source], [target])
+
+    def const_node(self, value: m.Bit) -> int:
+        try:
+            return self._const_ids[id(value)]
+        except KeyError:
+            pass
+        node_id = self.add_block([value], Scope(None))
+        self._const_ids[id(value)] = node_id
+        return node_id
+
+    def stitch(
+            self,
+            template: DefinitionTemplate,
+            scope: Scope,
+            boundary: np.ndarray):
+        """
+        Adds a block for @template in @scope. @boundary maps each index of
+        port_bits(template.defn) to the node representing that port bit in
+        the enclosing scope.
+        """
+        base = self.add_block(template.values, scope)
+        self.add_edges(template.sources + base, template.targets + base)
+        for value, target in template.const_edges:
+            self.add_edge(self.const_node(value), base + target)
+        for j, target in template.input_edges:
+            self.add_edge(boundary[j], base + target)
+        for j, kind, driver in template.output_drivers:
+            if kind == "const":
+                source = self.const_node(driver)
+            elif kind == "local":
+                source = base + driver
+            else:
+                assert kind == "input"
+                source = boundary[driver]
+            self.add_edge(source, boundary[j])
+        for i in template.children:
+            inst = template.defn.instances[i]
+            child = get_definition_template(type(inst))
+            offset = base + template.inst_offsets[i]
+            num_bits = len(port_bit_index(type(inst)))
+            child_boundary = np.arange(offset, offset + num_bits)
+            self.stitch(child, scope.extend(inst), child_boundary)
+
+    def build(self) -> CompactDirectedGraph:
+        return CompactDirectedGraph(
+            self.scopes,
+            np.concatenate(self.node_scopes),
+            self.values,
+            np.concatenate(self.sources),
+            np.concatenate(self.targets))
+
+
+def materialize_hierarchical_graph(
+        defn: m.DefineCircuitKind) -> CompactDirectedGraph:
+    """
+    Materializes the flattened graph of @defn by stitching together the
+    per-definition templates of each instance (see DefinitionTemplate), such
+    that the interior of each unique definition is only traced once.
+
+    Unlike materialize_graph(), the resulting graph contains all instance port
+    bits in the hierarchy (not just those connected to the ports of @defn), and
+    nodes are ordered by hierarchy block rather than by discovery order.
+    """
+    stitcher = _Stitcher()
+    root = Scope(defn)
+    top_bits = port_bits(defn)
+    base = stitcher.add_block(top_bits, root)
+    boundary = np.arange(base, base + len(top_bits))
+    stitcher.stitch(get_definition_template(defn), root, boundary)
+    return stitcher.build()
@@ -0,0 +1,97 @@
+import magma as m
+import pytest
+
+from designs.inverter_chain import InverterChain
+from pdq.circuit_tools.circuit_utils import port_bits
+from pdq.circuit_tools.graph_view import SummarizedDirectedGraphView
+from pdq.circuit_tools.graph_view_utils import materialize_compact_graph
+from pdq.circuit_tools.hierarchical_graph import (
+    get_definition_summary, get_definition_template,
+    materialize_hierarchical_graph)
+
+
+class _Accum(m.Circuit):
+    T = m.UInt[4]
+    io = m.IO(I=m.In(T), O=m.Out(T)) + m.ClockIO()
+    reg = m.Register(T)()
+    accum = reg.O + io.I
+    reg.I @= accum
+    io.O @= accum
+
+
+class _Array(m.Circuit):
+    T = m.UInt[4]
+    io = m.IO(I=m.In(T), O=m.Out(T)) + m.ClockIO()
+    curr = io.I
+    for _ in range(4):
+        curr = _Accum()(curr) ^ 1
+    io.O @= curr
+
+
+m.passes.clock.WireClockPass(_Array).run()
+
+
+def _as_sets(graph):
+    return set(graph.nodes()), set(graph.edges())
+
+
+@pytest.mark.parametrize(
+    "ckt", [_Accum, _Array, InverterChain(4, 2)])
+def test_hierarchical_graph_matches_flat_graph(ckt):
+    expected = materialize_compact_graph(ckt)
+    graph = materialize_hierarchical_graph(ckt)
+    assert graph.num_nodes == expected.num_nodes
+    assert graph.num_edges == expected.num_edges
+    assert _as_sets(graph) == _as_sets(expected)
+
+
+def test_definition_template_is_shared():
+    template = get_definition_template(_Accum)
+    materialize_hierarchical_graph(_Array)
+    assert get_definition_template(_Accum) is template
+
+
+def _reachable_top_ports(graph, ckt):
+    top = [i for i in range(graph.num_nodes) if graph.node(i).bit.defn is ckt]
+    reachable = set()
+    for src in top:
+        seen = {src}
+        stack = [src]
+        while stack:
+            curr = stack.pop()
+            for succ in graph.outgoing_ids(curr).tolist():
+                if succ not in seen:
+                    seen.add(succ)
+                    stack.append(succ)
+        reachable |= {
+            (str(graph.node(src)), str(graph.node(dst)))
+            for dst in seen if dst in top and dst != src}
+    return reachable
+
+
+def test_definition_summary():
+    summary = get_definition_summary(_Accum)
+    bits = port_bits(_Accum)
+    inputs = [str(bits[i]) for i in summary.inputs]
+    outputs = [str(bits[o]) for o in summary.outputs]
+    assert inputs == [f"_Accum.I[{i}]" for i in range(4)] + ["CLK"]
+    assert outputs == [f"_Accum.O[{i}]" for i in range(4)]
+    # Bit n of the adder output depends on input bits 0..n.
+    expected = [[i <= o for o in range(4)] for i in range(4)] + [[False] * 4]
+    assert summary.reach.tolist() == expected
+    assert summary.reaches_register.tolist() == [True] * 5
+    assert summary.from_register.tolist() == [True] * 4
+
+
+def test_summarized_graph_view():
+    graph = materialize_compact_graph(
+        _Array, graph=SummarizedDirectedGraphView(_Array))
+    assert all(n.bit.scope.is_root() for n in graph.nodes())
+    expected = materialize_compact_graph(_Array)
+    assert graph.num_nodes < expected.num_nodes
+    assert (_reachable_top_ports(graph, _Array) ==
+            _reachable_top_ports(expected, _Array))
+    # Expanding every instance is equivalent to the flat view.
+    view = SummarizedDirectedGraphView(_Array, expand=lambda s, i: True)
+    graph = materialize_compact_graph(_Array, graph=view)
+    assert list(graph.edges()) == list(expected.edges())
@@ -0,0 +1,196 @@
+import dataclasses
+from typing import List, Optional, Tuple
+
+import magma as m
+import numpy as np
+
+from pdq.circuit_tools.circuit_primitives import is_register
+from pdq.circuit_tools.compact_graph import CompactDirectedGraph, NodeId
+from pdq.circuit_tools.graph_view_utils import materialize_compact_graph
+from pdq.circuit_tools.partial_extract_query import PartialExtractQuery
+from pdq.circuit_tools.signal_path import BitSignalPath
+
+
+@dataclasses.dataclass(frozen=True)
+class NodeClasses:
+    """
+    Boolean node masks classifying the nodes of a graph for timing analysis.
+    Startpoints are register outputs (and top-level inputs), endpoints are
+    register inputs (and top-level outputs); clocks are neither. Cell outputs
+    are outputs of (non-register) primitive instances.
+    """
+    cell_outputs: np.ndarray
+    register_outputs: np.ndarray
+    register_inputs: np.ndarray
+    input_ports: np.ndarray
+    output_ports: np.ndarray
+
+    def startpoints(self, include_ports: bool) -> np.ndarray:
+        if include_ports:
+            return self.register_outputs | self.input_ports
+        return self.register_outputs
+
+    def endpoints(self, include_ports: bool) -> np.ndarray:
+        if include_ports:
+            return self.register_inputs | self.output_ports
+        return self.register_inputs
+
+
+def classify_nodes(graph: CompactDirectedGraph) -> NodeClasses:
+    masks = [np.zeros(graph.num_nodes, dtype=bool) for _ in range(5)]
+    cells, reg_outs, reg_ins, input_ports, output_ports = masks
+    for node_id in range(graph.num_nodes):
+        value = graph.value(node_id)
+        if value.const() or isinstance(value, m.ClockTypes):
+            continue
+        node = graph.node(node_id)
+        if node.bit.defn is not None:
+            # NOTE(rsetaluri): Top-level ports have flipped directions from the
+            # inside of the definition.
+            if node.bit.scope.is_root():
+                input_ports[node_id] = value.is_output()
+                output_ports[node_id] = value.is_input()
+            continue
+        inst = node.bit.inst
+        if inst is None or not m.isprimitive(type(inst)):
+            continue
+        if is_register(type(inst)):
+            reg_outs[node_id] = value.is_output()
+            reg_ins[node_id] = value.is_input()
+            continue
+        cells[node_id] = value.is_output()
+    return NodeClasses(*masks)
+
+
+def edge_weights(
+        graph: CompactDirectedGraph,
+        classes: NodeClasses,
+        node_weights: Optional[np.ndarray] = None) -> (
+            Tuple[np.ndarray, np.ndarray]):
+    """
+    Returns (active, weights) over the edges of @graph in CSR (outgoing) order:
+    edges into register outputs are cut (inactive), and each edge is weighted
+    by the entry of @node_weights for its target node. If @node_weights is
+    None, edges into cell outputs (i.e. through a cell) have weight 1 and all
+    others weight 0.
+    """
+    if node_weights is None:
+        node_weights = classes.cell_outputs.astype(np.int64)
+    _, out_idx, _, _ = graph.csr_arrays
+    active = ~classes.register_outputs[out_idx]
+    return active, node_weights[out_idx]
+
+
+def compute_arrival_depths(
+        graph: CompactDirectedGraph,
+        startpoints: np.ndarray,
+        weights: np.ndarray,
+        active: np.ndarray,
+        offsets: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Returns the arrival depth of each node, i.e. the maximum total weight of
+    any path from a node in @startpoints, or -1 for nodes not reachable from
+    @startpoints. @weights and @active are per edge in CSR (outgoing) order,
+    and inactive edges are ignored. If @offsets is not None, paths from each
+    startpoint begin at its (non-negative) entry of @offsets rather than 0.
+    Arrival depths are propagated in a single topological pass, one level at a
+    time, with the dtype of @weights. Raises ValueError if the graph of active
+    edges is not acyclic.
+    """
+    _, out_idx, _, _ = graph.csr_arrays
+    remaining = np.bincount(out_idx[active], minlength=graph.num_nodes)
+    arrival = np.full(graph.num_nodes, -1, dtype=weights.dtype)
+    arrival[startpoints] = 0 if offsets is None else offsets[startpoints]
+    frontier = np.flatnonzero(remaining == 0)
+    num_visited = 0
+    while frontier.size:
+        num_visited += frontier.size
+        sources, edges = graph.outgoing_edges(frontier)
+        keep = active[edges]
+        edges, sources = edges[keep], sources[keep]
+        targets = out_idx[edges]
+        reached = arrival[sources] >= 0
+        np.maximum.at(
+            arrival,
+            targets[reached],
+            arrival[sources[reached]] + weights[edges[reached]])
+        np.subtract.at(remaining, targets, 1)
+        frontier = np.unique(targets[remaining[targets] == 0])
+    if num_visited != graph.num_nodes:
+        raise ValueError("Graph has combinational cycles")
+    return arrival
+
+
+@dataclasses.dataclass(frozen=True)
+class LogicDepthPath:
+    depth: int
+    path: BitSignalPath
+
+    def to_query(self) -> PartialExtractQuery:
+        """Returns a query for extracting the logic along this path."""
+        nodes = self.path.nodes
+        return PartialExtractQuery(
+            from_list=(nodes[0],),
+            to_list=(nodes[-1],),
+            through_lists=(tuple(nodes[1:-1]),) if len(nodes) > 2 else ())
+
+
+def backtrack_critical_path(
+        graph: CompactDirectedGraph,
+        endpoint: NodeId,
+        arrival: np.ndarray,
+        startpoints: np.ndarray,
+        node_weights: np.ndarray) -> List[NodeId]:
+    """
+    Returns the node ids of a critical path ending at @endpoint, i.e. one
+    whose weight determines the arrival depth of @endpoint, given @arrival as
+    computed by compute_arrival_depths() with edge weights derived from
+    @node_weights (see edge_weights()).
+    """
+    path = [endpoint]
+    curr = endpoint
+    while not startpoints[curr]:
+        weight = node_weights[curr]
+        for pred in graph.incoming_ids(curr).tolist():
+            if arrival[pred] >= 0 and arrival[pred] + weight == arrival[curr]:
+                break
+        else:
+            raise RuntimeError(f"No critical predecessor for {curr}")
+        path.append(pred)
+        curr = pred
+    return path[::-1]
+
+
+def deepest_paths(
+        ckt: m.DefineCircuitKind,
+        num_paths: int = 10,
+        include_ports: bool = False,
+        graph: Optional[CompactDirectedGraph] = None) -> (
+            List[LogicDepthPath]):
+    """
+    Returns (up to) the @num_paths deepest register-to-register paths in
+    @ckt, deepest first, where depth is the number of (non-register) primitive
+    cells on the path. One (critical) path is reported per endpoint. If
+    @include_ports is True, then top-level inputs and outputs are also
+    considered start and endpoints. If @graph is not None, it is used as the
+    (materialized) graph of @ckt.
+    """
+    if graph is None:
+        graph = materialize_compact_graph(ckt)
+    classes = classify_nodes(graph)
+    startpoints = classes.startpoints(include_ports)
+    node_weights = classes.cell_outputs.astype(np.int64)
+    active, weights = edge_weights(graph, classes, node_weights)
+    arrival = compute_arrival_depths(graph, startpoints, weights, active)
+    endpoints = np.flatnonzero(
+        classes.endpoints(include_ports) & (arrival >= 0))
+    # NOTE(rsetaluri): We use a stable sort so that ties are reported in node
+    # order.
+    order = np.argsort(-arrival[endpoints], kind="stable")
+    paths = []
+    for endpoint in endpoints[order[:num_paths]].tolist():
+        ids = backtrack_critical_path(
+            graph, endpoint, arrival, startpoints, node_weights)
+        path = BitSignalPath([graph.node(i).bit for i in ids])
+        paths.append(LogicDepthPath(int(arrival[endpoint]), path))
+    return paths
@@ -0,0 +1,66 @@
+import magma as m
+import numpy as np
+import pytest
+
+from pdq.circuit_tools.graph_view_utils import materialize_compact_graph
+from pdq.circuit_tools.logic_depth import (
+    classify_nodes, compute_arrival_depths, deepest_paths, edge_weights)
+
+
+class _Pipeline(m.Circuit):
+    T = m.Bits[2]
+    io = m.IO(I=m.In(T), O=m.Out(T)) + m.ClockIO()
+    reg0 = m.Register(T)()
+    reg1 = m.Register(T)()
+    reg0.I @= io.I
+    # Depth 3 for bit 0 (not, and, xor) and 2 for bit 1 (not, xor).
+    curr = ~reg0.O
+    curr = m.bits([curr[0] & io.I[1], curr[1]])
+    reg1.I @= curr ^ reg0.O
+    io.O @= ~reg1.O
+
+
+m.passes.clock.WireClockPass(_Pipeline).run()
+
+
+def _brute_force_arrival(graph, startpoints, weights, active):
+    out_ptr, out_idx, _, _ = graph.csr_arrays
+    arrival = np.full(graph.num_nodes, -1, dtype=np.int64)
+
+    def _visit(node, depth):
+        if depth <= arrival[node]:
+            return
+        arrival[node] = depth
+        for edge in range(out_ptr[node], out_ptr[node + 1]):
+            if active[edge]:
+                _visit(out_idx[edge], depth + weights[edge])
+
+    for node in np.flatnonzero(startpoints).tolist():
+        _visit(node, 0)
+    return arrival
+
+
+@pytest.mark.parametrize("include_ports", [False, True])
+def test_arrival_depths(include_ports):
+    graph = materialize_compact_graph(_Pipeline)
+    classes = classify_nodes(graph)
+    startpoints = classes.startpoints(include_ports)
+    active, weights = edge_weights(graph, classes)
+    arrival = compute_arrival_depths(graph, startpoints, weights, active)
+    expected = _brute_force_arrival(graph, startpoints, weights, active)
+    assert np.array_equal(arrival, expected)
+
+
+def test_deepest_paths():
+    paths = deepest_paths(_Pipeline, num_paths=3)
+    assert [p.depth for p in paths] == [3, 2]
+    for p in paths:
+        assert p.path.validate()
+        first, last = p.path.nodes[0], p.path.nodes[-1]
+        assert str(first).startswith("_Pipeline.Register_inst0.reg_P2_inst0.")
+        assert str(last).startswith("_Pipeline.Register_inst1.reg_P2_inst0.")
+        assert first.value.is_output() and last.value.is_input()
+        query = p.to_query()
+        assert query.from_list == (first,) and query.to_list == (last,)
+    paths = deepest_paths(_Pipeline, include_ports=True)
+    assert [p.depth for p in paths] == [3, 2, 1, 1, 0, 0]
@@ -1,21 +1,29 @@
+import collections
+import concurrent.futures
 import dataclasses
-import itertools
-import networkx as nx
-from typing import Callable, Iterable, List, Optional, Tuple
+import multiprocessing
+import tempfile
+import threading
+from typing import (
+    Callable, Hashable, Iterable, List, Optional, Sequence, Tuple)
 
 import magma as m
-
-from pdq.circuit_tools.circuit_utils import InstSelector
-from pdq.circuit_tools.graph_view import (
-    BitPortNode, SimpleDirectedGraphViewBase)
-from pdq.circuit_tools.graph_view_utils import materialize_graph
+import numpy as np
+
+from pdq.circuit_tools.circuit_primitives import is_register
+from pdq.circuit_tools.circuit_utils import port_bit_map
+from pdq.circuit_tools.compact_graph import CompactDirectedGraph, NodeId
+from pdq.circuit_tools.graph_cache import load_or_materialize_compact_graph
+from pdq.circuit_tools.graph_view import BitPortNode
+from pdq.circuit_tools.graph_view_utils import (
+    materialize_compact_graph, materialize_query_graph)
 from pdq.circuit_tools.partial_extract_query import (
     PartialExtractQuery, query_is_empty)
 from pdq.circuit_tools.signal_path import Scope, ScopedBit, ScopedValue
-from pdq.common.algorithms import only, remove_all
+from pdq.common.algorithms import remove_all
 
 
-Graph = nx.DiGraph
+Graph = CompactDirectedGraph
 
 
 @dataclasses.dataclass(frozen=True)
@@ -41,14 +49,25 @@ class _CircuitReconstructor:
     def __init__(self, graph: Graph):
         self._graph = graph
         self._node_to_bit = {}
+        # NOTE(rsetaluri): The reverse index is keyed by id(bit). This is safe
+        # since @self._node_to_bit holds a reference to every bit in the index
+        # (so ids can not be reused while the reconstructor is alive), and we
+        # additionally check identity on lookup.
+        self._bit_to_node = {}
         self._instance_map = {}
+        self._instance_bits = {}
 
     def find_node(self, bit: m.Bit) -> BitPortNode:
-        node_to_bit = {n: b for n, b in self._node_to_bit.items() if b is bit}
-        n, b = only(node_to_bit.items())
+        try:
+            b, n = self._bit_to_node[id(bit)]
+        except KeyError:
+            raise ValueError(f"No node found for {bit}") from None
         assert b is bit
         return n
 
+    def find_nodes(self, bits: Iterable[m.Bit]) -> List[BitPortNode]:
+        return [self.find_node(bit) for bit in bits]
+
     @property
     def node_to_bit(self):
         return self._node_to_bit
@@ -58,7 +77,14 @@ class _CircuitReconstructor:
         return self._instance_map
 
     def add_or_get_bit(self, key: BitPortNode) -> m.Bit:
-        return self._node_to_bit.setdefault(key, m.Bit())
+        try:
+            return self._node_to_bit[key]
+        except KeyError:
+            pass
+        bit = m.Bit()
+        self._node_to_bit[key] = bit
+        self._bit_to_node[id(bit)] = (bit, key)
+        return bit
 
     def get_bit(self, key: BitPortNode) -> m.Bit:
         return self._node_to_bit[key]
@@ -73,89 +99,220 @@ class _CircuitReconstructor:
             return inst
         return inst
 
+    def get_instance_bit(self, key: ScopedInst, value: m.Bit) -> m.Bit:
+        """
+        Returns the bit of the reconstructed instance for @key corresponding
+        to @value (a port bit of key.inst), adding the instance if necessary.
+        """
+        inst = self.add_or_get_instance(key)
+        try:
+            bits = self._instance_bits[key]
+        except KeyError:
+            bits = port_bit_map(key.inst, inst)
+            self._instance_bits[key] = bits
+        return bits[id(value)]
+
     def run(self):
-        for node in self._graph.nodes:
+        for node_id in range(self._graph.num_nodes):
+            node = self._graph.node(node_id)
             bit = self.add_or_get_bit(node)
             if node.bit.inst is not None:
                 key = ScopedInst(node.bit.inst, node.bit.scope)
-                sel = InstSelector(
-                    m.value_utils.make_selector(node.bit.value),
-                    node.bit.ref.name)
                 if m.isprimitive(type(key.inst)):
                     if node.bit.value.is_input():
-                        inst = self.add_or_get_instance(key)
-                        inst_bit = sel.select(inst)
+                        inst_bit = self.get_instance_bit(key, node.bit.value)
                         inst_bit @= bit
                     else:
                         assert node.bit.value.is_output()
-                        if self._graph.in_degree(node) > 0:
-                            inst = self.add_or_get_instance(key)
-                            inst_bit = sel.select(inst)
+                        if self._graph.in_degree(node_id) > 0:
+                            inst_bit = self.get_instance_bit(
+                                key, node.bit.value)
                             bit @= inst_bit
                         continue
-            for predecessor in self._graph.predecessors(node):
+            for predecessor_id in self._graph.incoming_ids(node_id):
+                predecessor = self._graph.node(predecessor_id)
                 predecessor_bit = self.add_or_get_bit(predecessor)
                 bit @= predecessor_bit
 
 
-def _reachable_from(graph: Graph, src: BitPortNode) -> Iterable[BitPortNode]:
-    seen = set()
-    stack = [src]
-    while stack:
-        curr = stack.pop()
-        if not graph.has_node(curr):
-            continue
-        if curr in seen:
-            continue
-        yield curr
-        seen.add(curr)
-        stack += list(graph.successors(curr))
+Mask = np.ndarray
 
 
-def _reaches_to(graph: Graph, dst: BitPortNode) -> Iterable[BitPortNode]:
-    seen = set()
-    stack = [dst]
-    while stack:
-        curr = stack.pop()
-        if not graph.has_node(curr):
-            continue
-        if curr in seen:
-            continue
-        yield curr
-        seen.add(curr)
-        stack += list(graph.predecessors(curr))
+def _node_ids(graph: Graph, bits: Iterable[ScopedBit]) -> List[NodeId]:
+    ids = (graph.index(BitPortNode(bit)) for bit in bits)
+    return [i for i in ids if i is not None]
+
+
+def _reachable(
+        graph: Graph,
+        ids: List[NodeId],
+        reverse: bool,
+        mask: Mask,
+        token: Hashable = None) -> Mask:
+    return graph.reachable(ids, reverse=reverse, mask=mask)
+
+
+ReachableFn = Callable[[Graph, List[NodeId], bool, Mask, Hashable], Mask]
+
 
+def _reachable_from(
+        graph: Graph,
+        srcs: Iterable[ScopedBit],
+        mask: Mask,
+        reachable: ReachableFn = _reachable,
+        token: Hashable = None) -> Mask:
+    return reachable(graph, _node_ids(graph, srcs), False, mask, token)
+
+
+def _reaches_to(
+        graph: Graph,
+        dsts: Iterable[ScopedBit],
+        mask: Mask,
+        reachable: ReachableFn = _reachable,
+        token: Hashable = None) -> Mask:
+    return reachable(graph, _node_ids(graph, dsts), True, mask, token)
 
-def _subgraph(graph: Graph, nodes: Iterable[BitPortNode]) -> Graph:
+
+class _ReachabilityCache:
     """
-    Returns a *consistently ordered* subgraph of @graph induced by the set of
-    nodes @nodes. Note that we can not use nx.Graph.subgraph since it has shown
-    to be non-deterministic in terms of subgraph node ordering.
+    Memoizes reachability results over a single graph, keyed by traversal
+    direction, source set and a caller-supplied @token identifying the
+    traversal mask (i.e. equal tokens must imply equal masks), so lookups never
+    inspect the mask itself. At most @max_entries results are retained, least
+    recently used first out. A query whose source set is a superset of a
+    cached source set (for the same direction and mask) reuses the cached
+    result and only traverses the remaining sources.
     """
-    subgraph = graph.copy()
-    nodes_set = set(nodes)
-    subgraph.remove_nodes_from(n for n in graph if n not in nodes_set)
-    return subgraph
 
+    def __init__(self, max_entries: int = 64):
+        if max_entries < 1:
+            raise ValueError(f"Expected max_entries >= 1, got {max_entries}")
+        self._max_entries = max_entries
+        self._buckets = {}
+        self._lru = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lru)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+            self._lru.clear()
+
+    def __call__(
+            self,
+            graph: Graph,
+            ids: List[NodeId],
+            reverse: bool,
+            mask: Mask,
+            token: Hashable) -> Mask:
+        if token is None:
+            return graph.reachable(ids, reverse=reverse, mask=mask)
+        ids = frozenset(ids)
+        key = (reverse, token)
+        with self._lock:
+            entries = self._buckets.get(key, {})
+            try:
+                result = entries[ids]
+            except KeyError:
+                pass
+            else:
+                self._lru.move_to_end((key, ids))
+                return result
+            # NOTE(rsetaluri): Buckets hold at most @max_entries results, so
+            # this scan is bounded regardless of the size of the graph.
+            subsets = (s for s in entries if s <= ids)
+            base = max(subsets, key=len, default=frozenset())
+            visited = entries.get(base)
+        if visited is None:
+            result = graph.reachable(ids, reverse=reverse, mask=mask)
+        else:
+            # NOTE(rsetaluri): Anything reachable through a node in @visited
+            # is already in @visited, so we can stop the traversal there.
+            rest = graph.reachable(
+                ids - base, reverse=reverse, mask=mask & ~visited)
+            result = visited | rest
+        with self._lock:
+            self._buckets.setdefault(key, {})[ids] = result
+            self._lru[(key, ids)] = None
+            self._lru.move_to_end((key, ids))
+            while len(self._lru) > self._max_entries:
+                (old_key, old_ids), _ = self._lru.popitem(last=False)
+                bucket = self._buckets[old_key]
+                del bucket[old_ids]
+                if not bucket:
+                    del self._buckets[old_key]
+        return result
+
+
+def _subgraph(graph: Graph, mask: Mask) -> Graph:
+    """
+    Returns a *consistently ordered* subgraph of @graph induced by the set of
+    nodes selected by @mask (see CompactDirectedGraph.masked_subgraph()).
+    """
+    return graph.masked_subgraph(mask)
 
-def _filter_graph(graph: Graph, query: PartialExtractQuery) -> Graph:
-
-    def _filter(g, fn, l):
-        return itertools.chain(*(fn(g, BitPortNode(bit)) for bit in l))
 
+def _filter_mask(
+        graph: Graph,
+        query: PartialExtractQuery,
+        reachable: ReachableFn = _reachable) -> Mask:
+    """
+    Filters @graph by each stage of @query in turn, returning a boolean mask
+    of the retained nodes. Each stage only traverses the nodes retained by the
+    previous stages. All endpoints of a stage are traversed together in a
+    single sweep.
+    """
+    # NOTE(rsetaluri): @token identifies @mask by the stages which produced it
+    # (see _ReachabilityCache), starting from the empty tuple for all nodes.
+    mask = np.ones(graph.num_nodes, dtype=bool)
+    token = tuple()
     if query.from_list:
-        nodes = _filter(graph, _reachable_from, query.from_list)
-        graph = _subgraph(graph, nodes)
+        mask = _reachable_from(
+            graph, query.from_list, mask, reachable, token)
+        token += (("from", query.from_list),)
     if query.to_list:
-        nodes = _filter(graph, _reaches_to, query.to_list)
-        graph = _subgraph(graph, nodes)
+        mask = _reaches_to(graph, query.to_list, mask, reachable, token)
+        token += (("to", query.to_list),)
     if query.through_lists:
         for through_list in query.through_lists:
-            nodes = itertools.chain(
-                _filter(graph, _reaches_to, through_list),
-                _filter(graph, _reachable_from, through_list))
-            graph = _subgraph(graph, nodes)
-    return graph
+            mask = (
+                _reaches_to(graph, through_list, mask, reachable, token) |
+                _reachable_from(graph, through_list, mask, reachable, token))
+            token += (("through", through_list),)
+    return mask
+
+
+def _filter_graph(
+        graph: Graph,
+        query: PartialExtractQuery,
+        reachable: ReachableFn = _reachable) -> Graph:
+    """
+    Returns the subgraph of @graph retained by @query (see _filter_mask()).
+    The subgraph is materialized once, after all stages have been applied.
+    """
+    return _subgraph(graph, _filter_mask(graph, query, reachable))
+
+
+def _query_endpoints(query: PartialExtractQuery) -> Iterable[ScopedBit]:
+    yield from query.from_list
+    yield from query.to_list
+    for through_list in query.through_lists:
+        yield from through_list
+
+
+def _filter_summarized(
+        ckt: m.DefineCircuitKind, query: PartialExtractQuery) -> Graph:
+    """
+    Returns the same subgraph as _filter_graph() over the flat graph of @ckt,
+    but only expands the instances of @ckt relevant to @query (see
+    materialize_query_graph()), rather than materializing the entire design.
+    """
+    graph = materialize_query_graph(
+        ckt, _query_endpoints(query),
+        lambda graph: _filter_mask(graph, query))
+    return _filter_graph(graph, query)
 
 
 def _lift_instance_inputs(
@@ -164,11 +321,8 @@ def _lift_instance_inputs(
     pi = []
     po = []
 
-    def _process_value(value, scoped_inst, inst):
-        node = BitPortNode(ScopedBit(value, scoped_inst.scope))
-        sel = InstSelector(
-            m.value_utils.make_selector(node.bit.value),
-            node.bit.ref.name)
+    def _process_value(value, scoped_inst, ref):
+        node = BitPortNode(ScopedBit(value, scoped_inst.scope, ref))
         if value.is_input():
             if isinstance(value, m.ClockTypes):
                 return
@@ -177,7 +331,7 @@ def _lift_instance_inputs(
                 return
             assert node not in reconstructor.node_to_bit
             new_value = reconstructor.add_or_get_bit(node)
-            inst_value = sel.select(inst)
+            inst_value = reconstructor.get_instance_bit(scoped_inst, value)
             assert not inst_value.driven()
             inst_value @= new_value
             pi.append(node)
@@ -185,17 +339,18 @@ def _lift_instance_inputs(
             if node in reconstructor.node_to_bit:
                 return
             new_value = reconstructor.add_or_get_bit(node)
-            inst_value = sel.select(inst)
+            inst_value = reconstructor.get_instance_bit(scoped_inst, value)
             assert not inst_value.driving()
             new_value @= inst_value
             po.append(node)
         else:
             raise NotImplementedError(value, type(value))
 
-    for scoped_inst, inst in reconstructor.instance_map.items():
+    for scoped_inst in reconstructor.instance_map:
         for port in scoped_inst.inst.interface.ports.values():
+            ref = port.name
             for bit in m.as_bits(port):
-                _process_value(bit, scoped_inst, inst)
+                _process_value(bit, scoped_inst, ref)
 
     return pi, po
 
@@ -203,18 +358,12 @@ def _lift_instance_inputs(
 def _is_register_port(
         node: BitPortNode,
         value_predicate: Optional[Callable[[m.Type], bool]] = None) -> bool:
-    from magma.primitives.register import _CoreIRRegister
     if value_predicate is not None and not value_predicate(node.bit.value):
         return False
     inst = node.bit.inst
     if inst is None:
         return False
-    defn = type(inst)
-    if not m.isprimitive(defn):
-        return False
-    if not isinstance(defn, _CoreIRRegister):
-        return False
-    return True
+    return is_register(type(inst))
 
 
 def _is_register_input(node: BitPortNode) -> bool:
@@ -229,16 +378,12 @@ def _add_input_registers(
         graph: Graph,
         reconstructor: _CircuitReconstructor) -> List[BitPortNode]:
     pi_to_remove = []
-    for node in graph.nodes:
+    for node in graph.nodes():
         if not _is_register_input(node):
             continue
         scoped_inst = ScopedInst(node.bit.inst, node.bit.scope)
         assert node not in reconstructor.instance_map
-        inst = reconstructor.add_or_get_instance(scoped_inst)
-        sel = InstSelector(
-            m.value_utils.make_selector(node.bit.value),
-            node.bit.ref.name)
-        inst_bit = sel.select(inst)
+        inst_bit = reconstructor.get_instance_bit(scoped_inst, node.bit.value)
         bit = reconstructor.get_bit(node)
         bit @= inst_bit
         pi_to_remove.append(node)
@@ -249,12 +394,12 @@ def _reconstruct_circuit(graph: Graph, name: str) -> m.DefineCircuitKind:
     reconstructor = _CircuitReconstructor(graph)
 
     def _make_terminals(fn, g):
-        return list(filter(lambda n: fn(g, n), g.nodes))
+        return [g.node(i) for i in range(g.num_nodes) if fn(g, i)]
 
-    def _is_po(g, n):
-        return g.out_degree(n) == 0 and (not _is_register_output(n))
+    def _is_po(g, i):
+        return g.out_degree(i) == 0 and (not _is_register_output(g.node(i)))
 
-    pi = _make_terminals(lambda g, n: g.in_degree(n) == 0, graph)
+    pi = _make_terminals(lambda g, i: g.in_degree(i) == 0, graph)
     po = _make_terminals(_is_po, graph)
     _name = name
 
@@ -286,18 +431,158 @@ def _reconstruct_circuit(graph: Graph, name: str) -> m.DefineCircuitKind:
     return _Partial
 
 
+class Extractor:
+    """
+    Extraction session over a single circuit. The graph of @ckt is
+    materialized once (on construction) and shared by all queries, as are
+    reachability results of queries with common endpoint sets.
+
+    If @summarize is True, no graph is shared; instead, each query
+    materializes a graph of @ckt in which only the instances relevant to the
+    query are expanded (see materialize_query_graph()), and all other
+    instances are summarized. This is cheaper for queries which touch a small
+    part of a large hierarchical design, and yields the same results.
+    """
+
+    def __init__(
+            self,
+            ckt: m.DefineCircuitKind,
+            use_graph_cache: bool = False,
+            summarize: bool = False):
+        self._ckt = ckt
+        self._summarize = summarize
+        if summarize:
+            if use_graph_cache:
+                raise ValueError("Can not use graph cache when summarizing")
+            self._graph = None
+        elif use_graph_cache:
+            self._graph = load_or_materialize_compact_graph(ckt)
+        else:
+            self._graph = materialize_compact_graph(ckt)
+        self._reachable = _ReachabilityCache()
+
+    @property
+    def ckt(self) -> m.DefineCircuitKind:
+        return self._ckt
+
+    @property
+    def graph(self) -> Optional[Graph]:
+        """The shared graph of ckt, or None if summarizing."""
+        return self._graph
+
+    def filter(self, query: PartialExtractQuery) -> Graph:
+        if query_is_empty(query):
+            raise ValueError("Can not extract from empty query")
+        if self._summarize:
+            return _filter_summarized(self._ckt, query)
+        return _filter_graph(self._graph, query, self._reachable)
+
+    def extract(
+            self,
+            query: PartialExtractQuery,
+            name: Optional[str] = None) -> m.DefineCircuitKind:
+        if name is None:
+            name = f"{self._ckt.name}_Partial"
+        return _reconstruct_circuit(self.filter(query), name)
+
+    def extract_many(
+            self,
+            queries: Sequence[PartialExtractQuery],
+            names: Optional[Sequence[str]] = None,
+            max_workers: Optional[int] = None) -> List[m.DefineCircuitKind]:
+        """
+        Extracts a partial circuit for each of @queries. If @max_workers is
+        not None, then graph filtering for the queries is run concurrently
+        using a thread pool of (at most) @max_workers threads. Reconstruction
+        is always run serially, since magma circuits can not be defined
+        concurrently.
+        """
+        names = self._make_names(queries, names)
+        if max_workers is None:
+            subgraphs = map(self.filter, queries)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+                subgraphs = list(pool.map(self.filter, queries))
+        return [_reconstruct_circuit(subgraph, name)
+                for subgraph, name in zip(subgraphs, names)]
+
+    def extract_many_verilog(
+            self,
+            queries: Sequence[PartialExtractQuery],
+            names: Optional[Sequence[str]] = None,
+            processes: Optional[int] = None,
+            **compile_kwargs) -> List[str]:
+        """
+        Extracts a partial circuit for each of @queries and returns the
+        compiled verilog of each (using @compile_kwargs as options to
+        m.compile). Filtering, reconstruction, and compilation are run in a
+        pool of @processes (default os.cpu_count()) worker processes. Workers
+        are forked after the graph has been materialized, so the graph is
+        shared with the workers (copy-on-write) rather than re-materialized
+        or serialized. If @processes is 1, or forking is not supported on
+        this platform, extraction is run serially in this process.
+        """
+        names = self._make_names(queries, names)
+        fork = "fork" in multiprocessing.get_all_start_methods()
+        if processes == 1 or not fork:
+            return [_compile_verilog(self.extract(query, name), compile_kwargs)
+                    for query, name in zip(queries, names)]
+        context = multiprocessing.get_context("fork")
+        initargs = (self, queries, names, compile_kwargs)
+        with context.Pool(
+                processes,
+                initializer=_init_worker,
+                initargs=initargs) as pool:
+            return pool.map(_extract_verilog, range(len(queries)), chunksize=1)
+
+    def _make_names(
+            self,
+            queries: Sequence[PartialExtractQuery],
+            names: Optional[Sequence[str]]) -> Sequence[str]:
+        if names is None:
+            return [f"{self._ckt.name}_Partial{i}" for i in range(len(queries))]
+        if len(names) != len(queries):
+            raise ValueError(f"Expected {len(queries)} names, got {names}")
+        return names
+
+
+# NOTE(rsetaluri): State of each (forked) worker of
+# Extractor.extract_many_verilog(), set by _init_worker(). Workers only receive
+# query indices, since queries (and the extractor itself) hold magma values
+# which can not be pickled; with the fork start method, initargs are inherited
+# rather than pickled.
+_worker_state = None
+
+
+def _init_worker(
+        extractor: Extractor,
+        queries: Sequence[PartialExtractQuery],
+        names: Sequence[str],
+        compile_kwargs: dict):
+    global _worker_state
+    _worker_state = (extractor, queries, names, compile_kwargs)
+
+
+def _compile_verilog(partial: m.DefineCircuitKind, compile_kwargs: dict) -> str:
+    with tempfile.TemporaryDirectory() as directory:
+        basename = f"{directory}/{partial.name}"
+        m.compile(basename, partial, **compile_kwargs)
+        with open(f"{basename}.v", "r") as f:
+            return f.read()
+
+
+def _extract_verilog(index: int) -> str:
+    extractor, queries, names, compile_kwargs = _worker_state
+    partial = extractor.extract(queries[index], names[index])
+    return _compile_verilog(partial, compile_kwargs)
+
+
 def extract_partial(
         ckt: m.DefineCircuitKind,
         query: PartialExtractQuery,
-        name: Optional[str] = None) -> m.DefineCircuitKind:
+        name: Optional[str] = None,
+        use_graph_cache: bool = False,
+        summarize: bool = False) -> m.DefineCircuitKind:
     if query_is_empty(query):
         raise ValueError("Can not extract from empty query")
-    if name is None:
-        name = f"{ckt.name}_Partial"
-    graph = Graph()
-    V, E = materialize_graph(ckt)
-    graph.add_nodes_from(V)
-    graph.add_edges_from(E)
-    subgraph = _filter_graph(graph, query)
-    partial = _reconstruct_circuit(subgraph, name)
-    return partial
+    return Extractor(ckt, use_graph_cache, summarize).extract(query, name)
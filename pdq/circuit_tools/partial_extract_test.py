@@ -2,10 +2,16 @@ import tempfile
 
 import magma as m
 import magma.testing
+import numpy as np
+import pytest
 
 from pdq.circuit_tools.circuit_utils import find_instances_name_equals
 from pdq.circuit_tools.graph_view import BitPortNode
-from pdq.circuit_tools.partial_extract import extract_partial
+from pdq.circuit_tools.graph_view_utils import (
+    materialize_compact_graph, materialize_query_graph)
+from pdq.circuit_tools.partial_extract import (
+    Extractor, extract_partial, _CircuitReconstructor, _ReachabilityCache,
+    _filter_mask)
 from pdq.circuit_tools.partial_extract_query import (
     PartialExtractQuery, query_is_empty)
 from pdq.circuit_tools.signal_path import Scope, ScopedBit
@@ -32,8 +38,24 @@ class _Registered(m.Circuit):
     io.O @= m.register(~m.register(io.I, name="reg0"), name="reg1")
 
 
+class _Stage(m.Circuit):
+    name = "Stage"
+    io = m.IO(I=m.In(m.Bits[2]), O=m.Out(m.Bits[2])) + m.ClockIO()
+    io.O @= m.register(~io.I) ^ io.I
+
+
+class _Pipeline(m.Circuit):
+    name = "Pipeline"
+    io = m.IO(I=m.In(m.Bits[2]), O=m.Out(m.Bits[2])) + m.ClockIO()
+    curr = io.I
+    for i in range(3):
+        curr = _Stage(name=f"stage{i}")(curr)
+    io.O @= curr
+
+
 m.passes.clock.WireClockPass(_Basic).run()
 m.passes.clock.WireClockPass(_Registered).run()
+m.passes.clock.WireClockPass(_Pipeline).run()
 
 
 def test_basic():
@@ -85,3 +107,113 @@ def test_io_to_register():
         gold = "golds/partial_extract_io_to_register.v"
         assert m.testing.utils.check_files_equal(
             __file__, f"{basename}.v", gold)
+
+
+def test_reconstructor_find_node():
+    graph = materialize_compact_graph(_Basic)
+    reconstructor = _CircuitReconstructor(graph)
+    nodes = list(graph.nodes())
+    bits = [reconstructor.add_or_get_bit(node) for node in nodes]
+    assert reconstructor.find_nodes(bits) == nodes
+    for node, bit in zip(nodes, bits):
+        assert reconstructor.find_node(bit) == node
+    with pytest.raises(ValueError):
+        reconstructor.find_node(m.Bit())
+
+
+def _make_registered_queries():
+    ckt = _Registered
+    reg0 = only(find_instances_name_equals(ckt, "reg0"))
+    reg1 = only(find_instances_name_equals(ckt, "reg1"))
+    scope = Scope(ckt)
+    queries = [
+        PartialExtractQuery(through_lists=(
+            (ScopedBit(reg0.O, scope),), (ScopedBit(reg1.I, scope),))),
+        PartialExtractQuery(
+            from_list=(ScopedBit(ckt.I, scope),),
+            through_lists=((ScopedBit(reg0.I, scope),),)),
+    ]
+    names = ["register_to_regsiter_partial", "io_to_regsiter_partial"]
+    golds = ["golds/partial_extract_register_to_regsiter.v",
+             "golds/partial_extract_io_to_register.v"]
+    return queries, names, golds
+
+
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_extract_many(max_workers):
+    ckt = _Registered
+    queries, names, golds = _make_registered_queries()
+    extractor = Extractor(ckt)
+    partials = extractor.extract_many(queries, names, max_workers=max_workers)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for ckt_partial, gold in zip(partials, golds):
+            basename = f"{directory}/{ckt_partial.name}"
+            m.compile(basename, ckt_partial, inline=True)
+            assert m.testing.utils.check_files_equal(
+                __file__, f"{basename}.v", gold)
+
+
+def test_reachability_cache():
+    ckt = _Basic
+    extractor = Extractor(ckt)
+    graph = extractor.graph
+    scope = Scope(ckt)
+    bits = [ScopedBit(o, scope) for o in ckt.O]
+    ids = [graph.index(BitPortNode(bit)) for bit in bits]
+    cache = _ReachabilityCache(max_entries=2)
+    mask = np.ones(graph.num_nodes, dtype=bool)
+    for n in range(1, len(ids) + 1):
+        got = cache(graph, ids[:n], True, mask, tuple())
+        expected = graph.reachable(ids[:n], reverse=True, mask=mask)
+        assert (got == expected).all()
+        assert cache(graph, ids[:n], True, mask.copy(), tuple()) is got
+        assert len(cache) == min(n, 2)
+    first = cache(graph, ids[:1], True, mask, tuple())
+    assert cache(graph, ids[:1], True, mask, tuple()) is first
+    assert cache(graph, ids[:1], True, mask, "other") is not first
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_extract_many_verilog(processes):
+    ckt = _Registered
+    queries, names, golds = _make_registered_queries()
+    extractor = Extractor(ckt)
+    verilogs = extractor.extract_many_verilog(
+        queries, names, processes=processes, inline=True)
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, verilog, gold in zip(names, verilogs, golds):
+            filename = f"{directory}/{name}.v"
+            with open(filename, "w") as f:
+                f.write(verilog)
+            assert m.testing.utils.check_files_equal(__file__, filename, gold)
+
+
+def _node_and_edge_sets(graph):
+    return set(graph.nodes()), set(graph.edges())
+
+
+def test_summarized_extraction():
+    ckt = _Pipeline
+    stage0, stage1 = (only(find_instances_name_equals(ckt, f"stage{i}"))
+                      for i in range(2))
+    scope = Scope(ckt)
+    query = PartialExtractQuery(
+        from_list=tuple(ScopedBit(b, scope) for b in stage1.I),
+        to_list=tuple(ScopedBit(b, scope) for b in ckt.O))
+    expected = Extractor(ckt).filter(query)
+    extractor = Extractor(ckt, summarize=True)
+    assert extractor.graph is None
+    got = extractor.filter(query)
+    assert _node_and_edge_sets(got) == _node_and_edge_sets(expected)
+    # Only the instances on the query's paths are expanded.
+    graph = materialize_query_graph(
+        ckt, query.from_list + query.to_list, lambda g: _filter_mask(g, query))
+    assert not any(stage0 in node.bit.scope.path for node in graph.nodes())
+    assert graph.num_nodes < materialize_compact_graph(ckt).num_nodes
+    flat = extract_partial(ckt, query, name="pipeline_partial")
+    summarized = extract_partial(
+        ckt, query, name="pipeline_partial", summarize=True)
+    assert (sorted(type(inst).name for inst in summarized.instances) ==
+            sorted(type(inst).name for inst in flat.instances))
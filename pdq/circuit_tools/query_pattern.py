@@ -0,0 +1,205 @@
+import dataclasses
+import fnmatch
+import functools
+import re
+from typing import Iterable, List, Optional, Tuple
+
+import magma as m
+
+from pdq.circuit_tools.circuit_utils import find_instances_path, find_port_ref
+from pdq.circuit_tools.partial_extract_query import PartialExtractQuery
+from pdq.circuit_tools.signal_path import Scope, ScopedBit
+
+
+_PATTERN_RE = re.compile(
+    r"^(?:(?P<path>[^.]+)\.)?"
+    r"(?P<port>[A-Za-z0-9_*?]+)"
+    r"(?:\[(?P<lo>\d+)(?::(?P<hi>\d+))?\])?$")
+
+
+@dataclasses.dataclass(frozen=True)
+class QueryPattern:
+    """
+    Compiled form of a query pattern (see compile_pattern()). @path is a tuple
+    of instance name globs (empty for top-level ports), @port is a port name
+    glob, and @index is an (inclusive) range of indices into the selected
+    port(s), or None to select entire ports.
+    """
+    path: Tuple[str, ...]
+    port: str
+    index: Optional[Tuple[int, int]] = None
+
+    def __str__(self):
+        s = self.port
+        if self.path:
+            s = f"{'/'.join(self.path)}.{s}"
+        if self.index is not None:
+            lo, hi = self.index
+            s += f"[{lo}]" if lo == hi else f"[{lo}:{hi}]"
+        return s
+
+
+@functools.lru_cache(maxsize=None)
+def compile_pattern(pattern: str) -> QueryPattern:
+    """
+    Compiles @pattern, which has the form
+
+        [<inst>/<inst>/.../<inst>.]<port>[[<index>] | [<lo>:<hi>]]
+
+    where each <inst> is a glob (in the syntax of fnmatch) over instance names
+    at successive levels of hierarchy (see find_instances_path()), <port> is a
+    glob (supporting "*" and "?") over port names, and the optional index
+    selects a single index or an inclusive range of indices (in either order)
+    of the port. Patterns with no instance path select top-level ports. For
+    example, "Tile_*/PE/*.O[0:15]" selects bits 0 through 15 of port O of all
+    instances in all PE instances in all Tile_* instances.
+
+    Brackets after the port glob always select indices; character classes
+    (e.g. "O[01]") are not supported in port globs and are rejected, rather
+    than being read as an index.
+    """
+    match = _PATTERN_RE.match(pattern.strip())
+    if match is None:
+        if "[" in pattern.rsplit(".", 1)[-1]:
+            raise ValueError(
+                f"Invalid query pattern '{pattern}' (brackets after the port "
+                f"must be an index or index range)")
+        raise ValueError(f"Invalid query pattern '{pattern}'")
+    path = match.group("path")
+    path = tuple(path.split("/")) if path is not None else tuple()
+    if any(not component for component in path):
+        raise ValueError(f"Invalid query pattern '{pattern}'")
+    index = None
+    lo = match.group("lo")
+    if lo is not None:
+        hi = match.group("hi")
+        for digits in (lo, hi):
+            if digits is not None and len(digits) > 1 and digits[0] == "0":
+                raise ValueError(
+                    f"Invalid index '{digits}' in query pattern '{pattern}' "
+                    f"(brackets after the port select indices, not "
+                    f"characters)")
+        index = (int(lo), int(hi if hi is not None else lo))
+    return QueryPattern(path, match.group("port"), index)
+
+
+def _select(port: m.Type, index: Optional[Tuple[int, int]]) -> List[m.Type]:
+    if index is None:
+        return [port]
+    if not isinstance(port, m.Array):
+        raise ValueError(f"Can not index into non-array port {port}")
+    lo, hi = index
+    step = 1 if hi >= lo else -1
+    indices = range(lo, hi + step, step)
+    if any(i >= len(port) for i in indices):
+        raise ValueError(f"Index {list(index)} out of range for {port}")
+    return [port[i] for i in indices]
+
+
+def resolve_pattern(
+        defn: m.DefineCircuitKind,
+        pattern: str) -> Tuple[ScopedBit, ...]:
+    """
+    Resolves @pattern (see compile_pattern()) against @defn, returning the
+    selected port bits in hierarchy order.
+    """
+    compiled = compile_pattern(pattern)
+    if compiled.path:
+        paths = find_instances_path(defn, ".".join(compiled.path))
+    else:
+        paths = [tuple()]
+    bits = []
+    for insts in paths:
+        if insts:
+            scope = Scope(defn, insts[:-1])
+            owner = insts[-1]
+        else:
+            scope = Scope(defn)
+            owner = defn
+        for name, port in owner.interface.ports.items():
+            if not fnmatch.fnmatchcase(name, compiled.port):
+                continue
+            ref = find_port_ref(port)
+            for value in _select(port, compiled.index):
+                bits.extend(ScopedBit(bit, scope, ref)
+                            for bit in m.as_bits(value))
+    return tuple(bits)
+
+
+def resolve_patterns(
+        defn: m.DefineCircuitKind,
+        patterns: Iterable[str]) -> Tuple[ScopedBit, ...]:
+    """
+    Resolves each of @patterns against @defn (see resolve_pattern()). Bits
+    selected by multiple patterns are only included once.
+    """
+    bits = {}
+    for pattern in patterns:
+        bits.update(dict.fromkeys(resolve_pattern(defn, pattern)))
+    return tuple(bits)
+
+
+def make_partial_extract_query(
+        defn: m.DefineCircuitKind,
+        from_patterns: Iterable[str] = tuple(),
+        to_patterns: Iterable[str] = tuple(),
+        through_patterns: Iterable[Iterable[str]] = tuple()) -> (
+            PartialExtractQuery):
+    return PartialExtractQuery(
+        from_list=resolve_patterns(defn, from_patterns),
+        to_list=resolve_patterns(defn, to_patterns),
+        through_lists=tuple(
+            resolve_patterns(defn, patterns) for patterns in through_patterns))
+
+
+def tcl_bit_name(bit: ScopedBit) -> str:
+    """
+    Returns the name of the port or (hierarchical) pin for @bit as seen by
+    synthesis tools, e.g. "I0[3]" or "Tile_0/PE/V_1_0[1]".
+    """
+    # NOTE(rsetaluri): This follows magma's verilog flattening conventions:
+    # arrays of bits are emitted as buses, whereas other arrays and tuples are
+    # flattened into "_"-separated names.
+    suffix = ""
+    curr = bit.value.name
+    while curr is not bit.ref:
+        if isinstance(curr, m.ref.ArrayRef):
+            if issubclass(type(curr.array).T, m.Digital):
+                suffix = f"[{curr.index}]{suffix}"
+            else:
+                suffix = f"_{curr.index}{suffix}"
+        elif isinstance(curr, m.ref.TupleRef):
+            suffix = f"_{curr.index}{suffix}"
+        else:
+            raise ValueError(f"Unsupported value {bit}")
+        curr = curr.parent()
+    name = f"{bit.ref.name}{suffix}"
+    if bit.inst is None:
+        return name
+    insts = bit.scope.path + (bit.inst,)
+    return "/".join(inst.name for inst in insts) + f"/{name}"
+
+
+def make_tcl_collection(bits: Iterable[ScopedBit]) -> str:
+    """
+    Returns a Tcl expression (for DC and Genus) for the collection of ports
+    and pins corresponding to @bits, e.g. for use with report_timing -through.
+    Pins are named hierarchically, and so must be preserved by synthesis
+    (e.g. not ungrouped) to be found.
+    """
+    ports = []
+    pins = []
+    for bit in bits:
+        if bit.value.const() or bit.ref is None:
+            raise ValueError(f"Can not emit non-port value {bit}")
+        (ports if bit.inst is None else pins).append(tcl_bit_name(bit))
+    collections = []
+    if ports:
+        collections.append(f"[get_ports {{{' '.join(ports)}}}]")
+    if pins:
+        collections.append(f"[get_pins {{{' '.join(pins)}}}]")
+    if not collections:
+        raise ValueError("Can not emit empty collection")
+    if len(collections) == 1:
+        return collections[0]
+    return f"[add_to_collection {' '.join(collections)}]"
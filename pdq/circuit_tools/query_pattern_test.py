@@ -0,0 +1,87 @@
+import magma as m
+import pytest
+
+from pdq.circuit_tools.query_pattern import (
+    QueryPattern, compile_pattern, resolve_pattern, resolve_patterns,
+    make_partial_extract_query, make_tcl_collection)
+from pdq.circuit_tools.signal_path import Scope, ScopedBit
+
+
+class _PE(m.Circuit):
+    io = m.IO(
+        I=m.In(m.Bits[4]),
+        O=m.Out(m.Bits[4]),
+        V=m.Out(m.Array[2, m.Tuple[m.Bits[2], m.Bit]]))
+    io.O @= ~io.I
+    io.V[0][0] @= io.I[0:2]
+    io.V[0][1] @= io.I[2]
+    io.V[1][0] @= io.I[2:4]
+    io.V[1][1] @= io.I[3]
+
+
+class _Tile(m.Circuit):
+    io = m.IO(I=m.In(m.Bits[4]), O=m.Out(m.Bits[4]))
+    pe = _PE(name="PE")
+    pe.I @= io.I
+    io.O @= pe.O
+
+
+class _Top(m.Circuit):
+    io = m.IO(I0=m.In(m.Bits[4]), O=m.Out(m.Bits[4]))
+    curr = io.I0
+    for i in range(3):
+        curr = _Tile(name=f"Tile_{i}")(curr)
+    io.O @= curr
+
+
+def test_compile_pattern():
+    assert compile_pattern("I0[8]") == QueryPattern((), "I0", (8, 8))
+    pattern = compile_pattern("Tile_*/PE/*.O[0:15]")
+    assert pattern == QueryPattern(("Tile_*", "PE", "*"), "O", (0, 15))
+    assert str(pattern) == "Tile_*/PE/*.O[0:15]"
+    assert compile_pattern("*") == QueryPattern((), "*", None)
+    for invalid in ("", "a//b.O", "O[1:", "a.b.O"):
+        with pytest.raises(ValueError):
+            compile_pattern(invalid)
+    # Brackets after the port always select indices, never characters.
+    assert compile_pattern("O[10]") == QueryPattern((), "O", (10, 10))
+    for invalid in ("O[01]", "O[0:07]", "O[ab]", "PE.I[!0]"):
+        with pytest.raises(ValueError, match="brackets after the port"):
+            compile_pattern(invalid)
+
+
+def test_resolve_pattern():
+    bits = resolve_pattern(_Top, "I0[1:2]")
+    assert bits == (ScopedBit(_Top.I0[1], Scope(_Top)),
+                    ScopedBit(_Top.I0[2], Scope(_Top)))
+    bits = resolve_pattern(_Top, "Tile_*/PE.O[3:2]")
+    assert len(bits) == 6
+    tile = bits[0].scope.leaf()
+    assert tile.name == "Tile_0"
+    assert bits[0].value is bits[0].inst.O[3]
+    assert bits[1].value is bits[1].inst.O[2]
+    assert all(bit.inst.name == "PE" for bit in bits)
+    assert len(resolve_pattern(_Top, "Tile_1.*")) == 8
+    assert resolve_pattern(_Top, "Tile_9.*") == ()
+    with pytest.raises(ValueError):
+        resolve_pattern(_Top, "I0[4]")
+    bits = resolve_patterns(_Top, ["I0[0:1]", "I0[1:2]"])
+    assert [bit.value for bit in bits] == [_Top.I0[i] for i in range(3)]
+
+
+def test_make_partial_extract_query():
+    query = make_partial_extract_query(
+        _Top, from_patterns=["I0[0]"], through_patterns=[["Tile_1.O"]])
+    assert query.from_list == resolve_pattern(_Top, "I0[0]")
+    assert query.to_list == ()
+    assert query.through_lists == (resolve_pattern(_Top, "Tile_1.O"),)
+
+
+def test_make_tcl_collection():
+    bits = resolve_patterns(_Top, ["I0[3]", "Tile_0/PE.V[1]"])
+    expected = ("[add_to_collection [get_ports {I0[3]}] "
+                "[get_pins {Tile_0/PE/V_1_0[0] Tile_0/PE/V_1_0[1] "
+                "Tile_0/PE/V_1_1}]]")
+    assert make_tcl_collection(bits) == expected
+    assert make_tcl_collection(resolve_pattern(_Top, "O[0]")) == (
+        "[get_ports {O[0]}]")
@@ -1,16 +1,20 @@
 import abc
 import dataclasses
 import functools
+import threading
 from typing import Iterable, List, Optional, Tuple, Union
+import weakref
 
 import magma as m
 
 from pdq.circuit_tools.circuit_utils import (
-    find_ref, find_defn_ref, find_inst_ref, inst_port_to_defn_port)
+    PortRef, find_port_ref, inst_port_to_defn_port)
 from pdq.common.validator import validator
 
 
 class ScopeInterface(abc.ABC):
+    __slots__ = ()
+
     @abc.abstractmethod
     def root(self) -> m.DefineCircuitKind:
         raise NotImplementedError()
@@ -52,105 +56,178 @@ class ScopeInterface(abc.ABC):
         return type(leaf)
 
 
-@dataclasses.dataclass(frozen=True)
 class Scope(ScopeInterface):
-    top: m.DefineCircuitKind
-    path: Tuple[m.Circuit] = dataclasses.field(default_factory=tuple)
+    """
+    Scopes are interned in a trie (rooted at each top-level definition): each
+    scope object is the canonical object for its (top, path) pair, and
+    extend() returns the canonical child. Therefore scopes compare by
+    identity and hash in O(1), and scopes sharing a prefix share storage.
+    """
+
+    __slots__ = (
+        "_top", "_parent", "_leaf", "_depth", "_children", "__weakref__")
+
+    # NOTE(rsetaluri): Roots are held weakly, keyed by id(top). This is safe
+    # since each root holds a (strong) reference to its top, so the id can not
+    # be reused while the entry is alive. Children are held strongly by their
+    # parents (and parents by their children), so a trie lives exactly as long
+    # as any of its scopes is referenced.
+    _roots = weakref.WeakValueDictionary()
+    # NOTE(rsetaluri): Scopes may be created concurrently (e.g. by
+    # Extractor.extract_many()), so lookup-or-create must be atomic, otherwise
+    # two threads could each create a "canonical" scope for the same path.
+    # WeakValueDictionary.setdefault() is not atomic, so roots are created
+    # under a lock; children use (atomic) dict.setdefault() (see extend()).
+    _roots_lock = threading.Lock()
+
+    def __new__(
+            cls,
+            top: m.DefineCircuitKind,
+            path: Iterable[m.Circuit] = ()) -> 'Scope':
+        scope = cls._roots.get(id(top))
+        if scope is None:
+            with cls._roots_lock:
+                scope = cls._roots.get(id(top))
+                if scope is None:
+                    scope = cls._make(top, None, None)
+                    cls._roots[id(top)] = scope
+        for inst in path:
+            scope = scope.extend(inst)
+        return scope
+
+    @classmethod
+    def _make(
+            cls,
+            top: m.DefineCircuitKind,
+            parent: Optional['Scope'],
+            leaf: Optional[m.Circuit]) -> 'Scope':
+        scope = object.__new__(cls)
+        scope._top = top
+        scope._parent = parent
+        scope._leaf = leaf
+        scope._depth = 0 if parent is None else parent._depth + 1
+        scope._children = {}
+        return scope
+
+    @property
+    def top(self) -> m.DefineCircuitKind:
+        return self._top
+
+    @property
+    def path(self) -> Tuple[m.Circuit]:
+        path = []
+        curr = self
+        while curr._parent is not None:
+            path.append(curr._leaf)
+            curr = curr._parent
+        return tuple(reversed(path))
+
+    @property
+    def depth(self) -> int:
+        return self._depth
 
     def root(self) -> m.DefineCircuitKind:
-        return self.top
+        return self._top
 
     def is_root(self) -> bool:
-        return not self.path
+        return self._parent is None
 
     def leaf(self) -> Union[m.DefineCircuitKind, m.Circuit]:
-        if not self.path:
-            return self.top
-        return self.path[-1]
+        if self._parent is None:
+            return self._top
+        return self._leaf
 
     def pop(self) -> Tuple['Scope', m.Circuit]:
         if self.is_root():
             raise RuntimeError()
-        path = list(self.path)
-        leaf = path.pop()
-        return Scope(self.top, tuple(path)), leaf
+        return self._parent, self._leaf
 
     def extend(self, leaf: m.Circuit) -> 'Scope':
-        path = list(self.path)
-        path.append(leaf)
-        return Scope(self.top, tuple(path))
+        try:
+            return self._children[id(leaf)]
+        except KeyError:
+            pass
+        # NOTE(rsetaluri): Keying children by id(leaf) is safe since each child
+        # holds a reference to its leaf.
+        child = Scope._make(self._top, self, leaf)
+        return self._children.setdefault(id(leaf), child)
 
     def __eq__(self, other: 'Scope') -> bool:
         if not isinstance(other, Scope):
             return NotImplemented
-        return (
-            (self.top is other.top) and
-            (len(self.path) == len(other.path)) and
-            (all(x is y for x, y in zip(self.path, other.path))))
+        return self is other
 
     def __ne__(self, other: 'Scope') -> bool:
         return not self == other
 
+    __hash__ = object.__hash__
+
+    def __repr__(self):
+        return f"Scope({str(self)})"
+
     def __str__(self):
-        top = self.top.name
-        if not self.path:
+        if self._top is None:
+            return str(None)
+        top = self._top.name
+        if self.is_root():
             return top
         return ".".join([top] + [i.name for i in self.path])
 
     @validator
     def validate(self) -> None:
-        if not self.path:
-            return
-        curr = self.top
+        curr = self._top
         for inst in self.path:
             assert inst in curr.instances
             curr = type(inst)
 
 
-@dataclasses.dataclass(frozen=True)
 class ScopedValue:
-    value: m.Type
-    scope: ScopeInterface
-
-    @property
-    def ref(self) -> Optional[Union[m.InstRef, m.DefnRef]]:
-        try:
-            return self._ref
-        except AttributeError:
-            pass
+    """
+    A (magma) value along with the scope it lives in. Instances are immutable
+    and slotted; the enclosing InstRef/DefnRef of the value is resolved once at
+    construction, unless provided by the caller via @ref (see from_port()).
+    """
+
+    __slots__ = ("value", "scope", "ref", "inst", "defn")
+
+    def __init__(
+            self,
+            value: m.Type,
+            scope: ScopeInterface,
+            ref: Optional[PortRef] = None):
+        if ref is None:
+            ref = find_port_ref(value)
         inst = None
         defn = None
-        ref = find_inst_ref(self.value)
-        if ref is not None:
+        if isinstance(ref, m.InstRef):
             inst = ref.inst
-        else:
-            ref = find_defn_ref(self.value)
-            if ref is not None:
-                defn = ref.defn
-        # NOTE(rsetaluri): Using object.__setattr__ is technically unsafe on
-        # frozen dataclasses, but we know this is just caching logic.
-        object.__setattr__(self, "_ref", ref)
-        object.__setattr__(self, "_inst", inst)
-        object.__setattr__(self, "_defn", defn)
-        return ref
-
-    @property
-    def defn(self) -> Optional[m.DefineCircuitKind]:
-        try:
-            return self._defn
-        except AttributeError:
-            pass
-        ref = self.ref  # performs logic in ref() above
-        return self._defn
-
-    @property
-    def inst(self) -> Optional[m.Circuit]:
-        try:
-            return self._inst
-        except AttributeError:
-            pass
-        ref = self.ref  # performs logic in ref() above
-        return self._inst
+        elif isinstance(ref, m.DefnRef):
+            defn = ref.defn
+        # NOTE(rsetaluri): We use object.__setattr__ since __setattr__ is
+        # disabled to emulate frozen dataclasses.
+        object.__setattr__(self, "value", value)
+        object.__setattr__(self, "scope", scope)
+        object.__setattr__(self, "ref", ref)
+        object.__setattr__(self, "inst", inst)
+        object.__setattr__(self, "defn", defn)
+
+    @classmethod
+    def from_port(
+            cls,
+            port: m.Type,
+            scope: ScopeInterface) -> List['ScopedValue']:
+        """
+        Returns scoped values for each bit of @port (in m.as_bits() order). The
+        ref of @port is resolved once and shared by all the bits.
+        """
+        ref = find_port_ref(port)
+        return [cls(bit, scope, ref) for bit in m.as_bits(port)]
+
+    def __setattr__(self, name, value):
+        raise dataclasses.FrozenInstanceError(f"cannot assign to field {name}")
+
+    def __delattr__(self, name):
+        raise dataclasses.FrozenInstanceError(f"cannot delete field {name}")
 
     def __eq__(self, other: 'ScopedValue') -> bool:
         if not isinstance(other, ScopedValue):
@@ -162,6 +239,13 @@ class ScopedValue:
             return NotImplemented
         return not self == other
 
+    def __hash__(self):
+        return hash((self.value, self.scope))
+
+    def __repr__(self):
+        cls = type(self).__name__
+        return f"{cls}(value={repr(self.value)}, scope={repr(self.scope)})"
+
     def __str__(self):
         if self.value.const():
             return str(self.value)
@@ -170,10 +254,8 @@ class ScopedValue:
         return f"{str(self.scope)}.{repr(self.value)}"
 
 
-@dataclasses.dataclass(frozen=True, eq=False)
 class ScopedBit(ScopedValue):
-    value: m.Bit
-    scope: ScopeInterface
+    __slots__ = ()
 
 
 class SignalPathInterface(abc.ABC):
@@ -188,12 +270,8 @@ class SignalPathInterface(abc.ABC):
 
 
 def _is_driver(driver: ScopedBit, drivee: ScopedBit) -> bool:
-
-    def _ref_test(ref):
-        return isinstance(ref, (m.ref.InstRef, m.ref.DefnRef))
-    
-    driver_ref = find_ref(driver.value.name, _ref_test)
-    drivee_ref = find_ref(drivee.value.name, _ref_test)
+    driver_ref = find_port_ref(driver.value)
+    drivee_ref = find_port_ref(drivee.value)
 
     if driver_ref is None or drivee_ref is None:
         raise ValueError(f"Unexpected values: {driver}, {drivee}")
@@ -1,4 +1,9 @@
+import dataclasses
+import threading
+import time
+
 import magma as m
+import pytest
 
 from pdq.circuit_tools.circuit_utils import (
     find_instances_name_substring, find_instances_type)
@@ -35,6 +40,80 @@ def test_scope():
     assert scope.validate()
 
 
+def test_scope_interning():
+    accum = only(find_instances_type(_Top, lambda t: t is _Accum))
+    add = only(find_instances_name_substring(_Accum, "add"))
+    scope = Scope(_Top, [accum, add])
+    assert scope is Scope(_Top).extend(accum).extend(add)
+    assert scope.path == (accum, add)
+    assert scope.depth == 2
+    parent, leaf = scope.pop()
+    assert leaf is add
+    assert parent is Scope(_Top, (accum,))
+    assert parent.pop() == (Scope(_Top), accum)
+    assert hash(scope) == hash(Scope(_Top, [accum, add]))
+    assert Scope(None) is Scope(None)
+    assert Scope(None) != Scope(_Top)
+    # Scopes are fully slotted (no per-instance __dict__).
+    assert not hasattr(scope, "__dict__")
+
+
+def _make_top():
+
+    class _Inv(m.Circuit):
+        io = m.IO(I=m.In(m.Bit), O=m.Out(m.Bit))
+        io.O @= ~io.I
+
+    return _Inv
+
+
+def test_scope_interning_threaded(monkeypatch):
+    make = Scope._make
+
+    def _slow_make(cls, *args):
+        # Yield to other threads between lookup and insertion.
+        time.sleep(0.001)
+        return make(*args)
+
+    monkeypatch.setattr(Scope, "_make", classmethod(_slow_make))
+    num_threads = 8
+    for _ in range(10):
+        top = _make_top()
+        inst = only(top.instances)
+        barrier = threading.Barrier(num_threads)
+        scopes = []
+
+        def _run():
+            barrier.wait()
+            scopes.append(Scope(top, [inst]))
+
+        threads = [threading.Thread(target=_run) for _ in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(scopes) == num_threads
+        assert all(scope is scopes[0] for scope in scopes)
+        assert scopes[0].pop() == (Scope(top), inst)
+
+
+def test_scoped_bit_from_port():
+    accum = only(find_instances_type(_Top, lambda t: t is _Accum))
+    scope = Scope(_Top)
+    bits = ScopedBit.from_port(accum.O, scope)
+    assert [bit.value for bit in bits] == list(accum.O)
+    for bit in bits:
+        assert bit == ScopedBit(bit.value, scope)
+        assert bit.ref is accum.O.name
+        assert bit.inst is accum
+        assert bit.defn is None
+    top_bit = ScopedBit(_Top.O[0], scope)
+    assert top_bit.defn is _Top and top_bit.inst is None
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        top_bit.scope = scope
+    assert not hasattr(top_bit, "__dict__")
+
+
 def test_internal_signal_path():
     # Validate internal path through and.
     and_inst = only(find_instances_name_substring(_Top, "and"))
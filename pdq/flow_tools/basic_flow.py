@@ -8,6 +8,8 @@ import magma as m
 from pdq.flow_tools.templated_flow_builder import (
     TemplatedFlowBuilder, FileTemplate, FileCopy)
 from pdq.circuit_tools.generate_testbench import generate_testbench
+from pdq.circuit_tools.query_pattern import (
+    make_tcl_collection, resolve_patterns)
 
 
 _BASIC_FLOW_FLOW_DIR = pathlib.Path("basic_flow")
@@ -20,6 +22,11 @@ class BasicFlowOpts:
     inline: bool = False
     adk_name: str = 'freepdk-45nm'
     macros: str = ""
+    # Comma-separated query patterns (see compile_pattern()) for the timing
+    # query; an empty @query_from (@query_to) leaves the query unconstrained
+    # at the start (end).
+    query_from: str = ""
+    query_to: str = ""
 
 
 def _get_macro_files(path):
@@ -37,6 +44,13 @@ def _get_macro_files(path):
     return macro_file_list
 
 
+def _make_query_collection(ckt: m.DefineCircuitKind, patterns: str):
+    patterns = [p for p in patterns.split(",") if p.strip()]
+    if not patterns:
+        return None
+    return make_tcl_collection(resolve_patterns(ckt, patterns))
+
+
 def make_basic_flow(ckt: m.DefineCircuitKind, opts: BasicFlowOpts):
     # First, parse the macro args and copy all the files to the macro node.
     macro_path_list = [s.strip() for s in opts.macros.split(",")]
@@ -71,12 +85,15 @@ def make_basic_flow(ckt: m.DefineCircuitKind, opts: BasicFlowOpts):
                 path,
                 builder.get_relative(f"macros/{os.path.basename(path)}")))
 
-    # TODO(rsetaluri,alexcarsello): Make pins non-design specific.
+    query_opts = {
+        "from": _make_query_collection(ckt, opts.query_from),
+        "to": _make_query_collection(ckt, opts.query_to),
+    }
     builder.add_template(
         FileTemplate(
             builder.get_relative("query.tcl.tpl"),
             builder.get_relative("synopsys-dc-query/scripts/query.tcl"),
-            {"from": "I0[8]", "to": "*"}))
+            query_opts))
     with tempfile.TemporaryDirectory() as directory:
         design_basename = f"{directory}/design"
         m.compile(
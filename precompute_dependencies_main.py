@@ -0,0 +1,24 @@
+import argparse
+import time
+
+from pdq.common.main_utils import (
+    add_design_arguments, parse_design_args, slice_args)
+from pdq.common.reporting import make_header
+from pdq.circuit_tools.circuit_primitives import (
+    precompute_primitive_dependencies, summarize_precompute_results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    design_grp = add_design_arguments(parser)
+    parser.add_argument(
+        "-processes", type=int, help="(default os.cpu_count())")
+    args = parser.parse_args()
+    ckt = parse_design_args(slice_args(args, design_grp))
+    begin = time.perf_counter()
+    results = precompute_primitive_dependencies(ckt, args.processes)
+    elapsed = time.perf_counter() - begin
+    print (make_header(f"PRIMITIVE DEPENDENCIES ({ckt.name})"))
+    print (summarize_precompute_results(results))
+    print (f"total: {elapsed:.3f}s")
+    print (make_header("", pad=False))